@@ -0,0 +1,168 @@
+"""
+AI Smart Calendar Categorization Cache
+Persistent cache of activity text -> {category, intensity} from Gemini.
+
+Entries are keyed by the normalized activity text and a version string
+derived from the categorization prompt, so changing the prompt or the
+category taxonomy never serves stale answers: old entries simply stop
+being read and age out. The cache lives in a small SQLite file shared by
+all worker processes and is bounded to max_entries with least-recently
+used eviction.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default number of cached categorizations kept
+CACHE_MAX_ENTRIES = 50000
+
+# SQLite limits the number of bound parameters per statement
+QUERY_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categorizations (
+    version TEXT NOT NULL,
+    activity TEXT NOT NULL,
+    category TEXT NOT NULL,
+    intensity INTEGER NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (version, activity)
+);
+CREATE INDEX IF NOT EXISTS idx_categorizations_last_used ON categorizations (last_used);
+"""
+
+
+def normalize_activity(activity):
+    """Cache key for an activity: NFKC, case-folded, whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", activity).casefold().split())
+
+
+def prompt_version(*parts):
+    """Short hash identifying a prompt/taxonomy combination"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CategorizationCache:
+    """LRU-bounded, on-disk activity categorization cache"""
+
+    def __init__(self, path, version, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connection(self):
+        """Connection for this process (opened lazily, reopened after fork)"""
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def get_many(self, activities):
+        """Return {activity: {"category", "intensity"}} for the cached ones"""
+        keys = {}
+        for activity in activities:
+            keys.setdefault(normalize_activity(activity), []).append(activity)
+        found = {}
+        with self._lock:
+            db = self._connection()
+            key_list = list(keys)
+            for start in range(0, len(key_list), QUERY_CHUNK):
+                chunk = key_list[start:start + QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = db.execute(
+                    f"SELECT activity, category, intensity FROM categorizations "
+                    f"WHERE version = ? AND activity IN ({placeholders})",
+                    [self.version] + chunk,
+                ).fetchall()
+                for key, category, intensity in rows:
+                    for activity in keys[key]:
+                        found[activity] = {"category": category, "intensity": intensity}
+                if rows:
+                    db.executemany(
+                        "UPDATE categorizations SET last_used = ? WHERE version = ? AND activity = ?",
+                        [(time.time_ns(), self.version, key) for key, _, _ in rows],
+                    )
+            self.hits += len(found)
+            self.misses += len(activities) - len(found)
+        return found
+
+    def get(self, activity):
+        return self.get_many([activity]).get(activity)
+
+    def put_many(self, results):
+        """Store {activity: {"category", "intensity", ...}} and evict beyond max_entries"""
+        if not results:
+            return
+        now = time.time_ns()
+        rows = [(self.version, normalize_activity(activity), result["category"], int(result["intensity"]), now)
+                for activity, result in results.items()]
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO categorizations (version, activity, category, intensity, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                excess = db.execute("SELECT COUNT(*) FROM categorizations").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    db.execute(
+                        "DELETE FROM categorizations WHERE rowid IN "
+                        "(SELECT rowid FROM categorizations ORDER BY last_used LIMIT ?)",
+                        (excess,),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def put(self, activity, result):
+        self.put_many({activity: result})
+
+    def entries(self):
+        """All (normalized activity, category, intensity) cached for the current version"""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT activity, category, intensity FROM categorizations WHERE version = ? ORDER BY activity",
+                (self.version,),
+            ).fetchall()
+
+    def clear(self):
+        """Drop every cached categorization (all versions)"""
+        with self._lock:
+            self._connection().execute("DELETE FROM categorizations")
+
+    def stats(self):
+        """Hit/miss counts of this process and the current cache size"""
+        with self._lock:
+            entries = self._connection().execute(
+                "SELECT COUNT(*) FROM categorizations WHERE version = ?", (self.version,)
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "version": self.version,
+            }
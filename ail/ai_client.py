@@ -0,0 +1,167 @@
+"""
+AI Smart Calendar AI Client
+The one place that talks to Gemini.
+
+Model instances are created once per (model name, generation config) and
+reused, so they share the SDK's client and its open connection instead of
+being rebuilt for every call. configure() sets the API key and the default
+model name, temperature and max output tokens. warm_up() opens the
+connection in the background before the first request needs it and can
+keep it from going cold while the app is idle.
+
+generate_text() and stream_text() go through the current provider:
+GeminiProvider by default, or any object with the same methods set with
+set_provider(), such as the local stand-ins in fake_ai.py.
+
+Connections must not be shared with forked worker processes, so children
+start with a fresh client and model cache.
+"""
+
+import os
+import threading
+import time
+import logging
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+_settings = {"api_key": None, "model_name": DEFAULT_MODEL, "temperature": None, "max_output_tokens": None}
+_models = {}
+_lock = threading.Lock()
+_warmer = None
+
+
+def configure(api_key, model_name=DEFAULT_MODEL, temperature=None, max_output_tokens=None):
+    """Set the API key and the generation defaults used by get_model()"""
+    with _lock:
+        _settings.update(api_key=api_key, model_name=model_name or DEFAULT_MODEL,
+                         temperature=temperature, max_output_tokens=max_output_tokens)
+        _models.clear()
+        genai.configure(api_key=api_key)
+
+
+def settings():
+    """Current defaults (without the API key)"""
+    return {key: value for key, value in _settings.items() if key != "api_key"}
+
+
+def get_model(model_name=None, temperature=None, max_output_tokens=None):
+    """Shared model instance for a model name and generation config.
+
+    Arguments left as None use the configured defaults.
+    """
+    model_name = model_name or _settings["model_name"]
+    if temperature is None:
+        temperature = _settings["temperature"]
+    if max_output_tokens is None:
+        max_output_tokens = _settings["max_output_tokens"]
+    key = (model_name, temperature, max_output_tokens)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                generation_config = {}
+                if temperature is not None:
+                    generation_config["temperature"] = temperature
+                if max_output_tokens is not None:
+                    generation_config["max_output_tokens"] = max_output_tokens
+                model = genai.GenerativeModel(model_name, generation_config=generation_config or None)
+                _models[key] = model
+    return model
+
+
+class GeminiProvider:
+    """Gemini through the google-generativeai SDK"""
+
+    name = "gemini"
+
+    def generate_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        model = get_model(model_name, temperature, max_output_tokens)
+        response = model.generate_content(prompt)
+        return response.text
+
+    def stream_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        model = get_model(model_name, temperature, max_output_tokens)
+        response = model.generate_content(prompt, stream=True)
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def ping(self):
+        """Cheapest round trip that opens the connection (no generation quota)"""
+        get_model().count_tokens("ping")
+
+    def stats(self):
+        return {"name": self.name}
+
+
+_provider = GeminiProvider()
+
+
+def set_provider(provider):
+    """Answer generate_text()/stream_text() with provider (None: Gemini again)"""
+    global _provider
+    _provider = provider or GeminiProvider()
+
+
+def provider():
+    return _provider
+
+
+def generate_text(prompt, model_name=None, temperature=None, max_output_tokens=None):
+    """Send one prompt and return the response text"""
+    return _provider.generate_text(prompt, model_name, temperature, max_output_tokens)
+
+
+def stream_text(prompt, model_name=None, temperature=None, max_output_tokens=None):
+    """Send one prompt and yield the response text as it is generated"""
+    yield from _provider.stream_text(prompt, model_name, temperature, max_output_tokens)
+
+
+def _ping():
+    _provider.ping()
+
+
+def warm_up(keepalive_interval=0):
+    """Open the Gemini connection in the background.
+
+    With keepalive_interval > 0 the connection is pinged again every that
+    many seconds so requests after idle periods do not pay a new handshake.
+    Call once per process (after fork, in each worker).
+    """
+    global _warmer
+
+    def run():
+        while True:
+            try:
+                _ping()
+                logger.info("Gemini connection warmed up")
+            except Exception as e:
+                logger.warning(f"Gemini warm-up failed: {e}")
+            if keepalive_interval <= 0:
+                return
+            time.sleep(keepalive_interval)
+
+    with _lock:
+        if _warmer is not None and _warmer.is_alive():
+            return
+        _warmer = threading.Thread(target=run, name="ai-warm-up", daemon=True)
+        _warmer.start()
+
+
+def _reset_after_fork():
+    """Give a forked child its own client and models"""
+    global _lock, _warmer
+    _lock = threading.Lock()
+    _warmer = None
+    _models.clear()
+    if _settings["api_key"] is not None:
+        genai.configure(api_key=_settings["api_key"])
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,366 @@
+"""
+AI Smart Calendar AI Executor
+Shared, bounded execution layer for Gemini requests.
+
+Every AI call goes through one thread pool per process, so independent
+requests (e.g. categorization batches) run concurrently while the number
+in flight stays bounded. A token bucket paces calls to the configured
+requests-per-minute quota so bursts queue instead of failing with 429s.
+Each call has its own timeout, counted from when it actually starts, and
+callers can pass an overall Deadline that also bounds queueing time.
+
+Streamed calls (stream()) hold a worker for as long as the stream runs
+and hand its chunks over as they arrive; there the timeout applies to the
+wait for each chunk rather than to the whole call.
+
+Python cannot abort a running HTTP call, so a call that times out keeps
+its worker until it returns; the caller just stops waiting for it.
+
+A circuit breaker shared by all calls of the executor stops sending
+requests while Gemini is failing or too slow: calls then fail at once
+with AIUnavailable and callers use their non-AI fallbacks, instead of
+every request waiting out its own timeouts.
+"""
+
+import math
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class AITimeout(Exception):
+    """An AI call did not finish within its timeout or the request deadline"""
+
+
+class AIUnavailable(Exception):
+    """The circuit breaker is open: AI calls fail fast until Gemini recovers"""
+
+
+class Deadline:
+    """Point in time by which a whole request has to be done"""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+
+class TokenBucket:
+    """Allows rate calls per second on average, with bursts up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is available, else return the seconds until one is"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """Wait for a token; False if none became available within timeout"""
+        expires = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if expires is not None:
+                left = expires - time.monotonic()
+                if left <= 0:
+                    return False
+                wait = min(wait, left)
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Fails AI calls fast while Gemini is failing or too slow.
+
+    Closed: calls go through, and failure_threshold consecutive failures
+    (errors, timeouts or calls slower than latency_slo) open it. Open:
+    calls are rejected for reset_timeout seconds. Half-open: one probe
+    call goes through; success closes the breaker, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, latency_slo=15.0, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.latency_slo = latency_slo
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.last_failure = None
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Ticket to report the outcome of a call with, or None to fail fast"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return None
+                self.state = self.HALF_OPEN
+                logger.info("AI circuit half-open: probing Gemini")
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return None
+                self._probing = True
+            return _Ticket(self)
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.opens += 1
+        logger.warning(f"AI circuit open for {self.reset_timeout:.0f}s after {self.consecutive_failures} "
+                       f"failure(s), last: {self.last_failure}")
+
+    def record_success(self, latency):
+        if latency > self.latency_slo:
+            self.record_failure(f"slow call ({latency:.1f}s, SLO {self.latency_slo:.1f}s)")
+            return
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+                self._probing = False
+                logger.info("AI circuit closed: Gemini recovered")
+
+    def record_failure(self, reason):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_failure = reason
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._open()
+
+    def release(self):
+        """An admitted call ended without telling anything about Gemini"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def status(self):
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "latency_slo": self.latency_slo,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": retry_in,
+                "last_failure": self.last_failure,
+                "opens": self.opens,
+                "rejected": self.rejected,
+            }
+
+
+class _Ticket:
+    """One admitted call's report to the breaker; only the first verdict counts"""
+
+    def __init__(self, breaker):
+        self._breaker = breaker
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def _settle(self):
+        with self._lock:
+            settled, self._settled = self._settled, True
+            return not settled
+
+    def success(self, latency):
+        if self._settle():
+            self._breaker.record_success(latency)
+
+    def failure(self, reason):
+        if self._settle():
+            self._breaker.record_failure(reason)
+
+    def release(self):
+        if self._settle():
+            self._breaker.release()
+
+
+def _describe(error):
+    return f"{type(error).__name__}: {error}"
+
+
+class AICall:
+    """Handle for one submitted AI call"""
+
+    def __init__(self, executor, fn, args, kwargs, deadline):
+        self.started = None
+        self._call_timeout = executor.call_timeout
+        self._deadline = deadline
+        self._future = None
+        self._ticket = executor.breaker.admit()
+        if self._ticket is not None:
+            self._future = executor._pool.submit(self._run, executor.limiter, fn, args, kwargs)
+
+    def _run(self, limiter, fn, args, kwargs):
+        if not limiter.acquire(None if self._deadline is None else self._deadline.remaining()):
+            self._ticket.release()
+            raise AITimeout("Request deadline passed while waiting for the AI rate limit")
+        self.started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._ticket.failure(_describe(e))
+            raise
+        self._ticket.success(time.monotonic() - self.started)
+        return result
+
+    def result(self):
+        """Wait for the call; raises AITimeout once a timeout or the deadline passes,
+        AIUnavailable at once if the circuit breaker is open"""
+        if self._future is None:
+            raise AIUnavailable("AI is temporarily unavailable, please try again later")
+        while True:
+            if self.started is None:
+                timeout = self._call_timeout
+            else:
+                timeout = self.started + self._call_timeout - time.monotonic()
+            if self._deadline is not None:
+                timeout = min(timeout, self._deadline.remaining())
+            try:
+                return self._future.result(max(0.0, timeout))
+            except FutureTimeout:
+                call_expired = self.started is not None and time.monotonic() >= self.started + self._call_timeout
+                if call_expired or (self._deadline is not None and self._deadline.expired()):
+                    if self._future.cancel():
+                        self._ticket.release()
+                    elif call_expired:
+                        self._ticket.failure(f"timeout after {self._call_timeout:.0f}s")
+                    raise AITimeout("AI call timed out")
+                # Still queued behind the rate limit: keep waiting
+
+
+class AIStream:
+    """Iterator over the chunks of one streamed AI call"""
+
+    _DONE = object()
+
+    def __init__(self, executor, fn, args, kwargs, deadline):
+        self.started = None
+        self._call_timeout = executor.call_timeout
+        self._deadline = deadline
+        self._chunks = queue.Queue()
+        self._closed = threading.Event()
+        self._ticket = executor.breaker.admit()
+        if self._ticket is None:
+            self._chunks.put(AIUnavailable("AI is temporarily unavailable, please try again later"))
+        else:
+            executor._pool.submit(self._run, executor.limiter, fn, args, kwargs)
+
+    def _run(self, limiter, fn, args, kwargs):
+        try:
+            if not limiter.acquire(None if self._deadline is None else self._deadline.remaining()):
+                raise AITimeout("Request deadline passed while waiting for the AI rate limit")
+            if self._closed.is_set():
+                return
+            self.started = time.monotonic()
+            chunks = fn(*args, **kwargs)
+            try:
+                for chunk in chunks:
+                    # Time to the first chunk is what the latency SLO applies to
+                    self._ticket.success(time.monotonic() - self.started)
+                    if self._closed.is_set():
+                        break
+                    self._chunks.put(chunk)
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+            self._ticket.success(time.monotonic() - self.started)
+            self._chunks.put(self._DONE)
+        except Exception as e:
+            if self.started is not None:
+                self._ticket.failure(_describe(e))
+            self._chunks.put(e)
+        finally:
+            self._ticket.release()
+
+    def __iter__(self):
+        """Yield chunks; raises AITimeout if one takes longer than the call timeout"""
+        try:
+            while True:
+                timeout = self._call_timeout
+                if self._deadline is not None:
+                    timeout = min(timeout, self._deadline.remaining())
+                try:
+                    item = self._chunks.get(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    if self.started is None and not (self._deadline is not None and self._deadline.expired()):
+                        continue  # Still queued behind the rate limit: keep waiting
+                    if self.started is not None:
+                        self._ticket.failure(f"stream stalled for {self._call_timeout:.0f}s")
+                    raise AITimeout("AI stream timed out")
+                if item is self._DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop reading; the worker drops the rest of the stream"""
+        self._closed.set()
+
+
+class AIExecutor:
+    """Bounded, rate-limited pool that runs AI calls"""
+
+    def __init__(self, max_workers=8, requests_per_minute=60, call_timeout=30.0, burst=None, breaker=None):
+        self.max_workers = max_workers
+        self.requests_per_minute = requests_per_minute
+        self.call_timeout = call_timeout
+        self.limiter = TokenBucket(requests_per_minute / 60.0, burst or max_workers)
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai")
+
+    def submit(self, fn, *args, deadline=None, **kwargs):
+        """Start fn(*args, **kwargs) in the pool and return its AICall"""
+        return AICall(self, fn, args, kwargs, deadline)
+
+    def stream(self, fn, *args, deadline=None, **kwargs):
+        """Start the generator fn(*args, **kwargs) in the pool and return its AIStream"""
+        return AIStream(self, fn, args, kwargs, deadline)
+
+    def run(self, fn, *args, deadline=None, **kwargs):
+        """Run fn(*args, **kwargs) in the pool and wait for its result"""
+        return self.submit(fn, *args, deadline=deadline, **kwargs).result()
+
+    def batch_budget(self, calls, per_call):
+        """Seconds to allow for calls submitted at once, each taking up to per_call.
+
+        They run in rounds of max_workers, and past the limiter's burst
+        they can start no faster than the rate limit allows.
+        """
+        rounds = math.ceil(calls / self.max_workers)
+        paced = max(0, calls - self.limiter.capacity) / self.limiter.rate
+        return rounds * per_call + paced
@@ -1,12 +1,23 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import json
 import os
 import re
+import time
 from datetime import datetime, timedelta, date
-import google.generativeai as genai
 import logging
-import random # Added for fallback_categorization
 from collections import defaultdict
+from storage import create_stores, file_stamp
+from events import EventBroker, default_max_subscribers
+from ai_cache import CategorizationCache, normalize_activity, prompt_version
+from ai_executor import AIExecutor, AITimeout, AIUnavailable, CircuitBreaker, Deadline
+from classifier import ModelFile
+from retrieval import ScheduleIndex, estimate_tokens, select_context
+from response_cache import ResponseCache
+from jobs import JobRunner, JobStore
+import ai_client
+import fake_ai
+import plan_parser
+import taxonomy
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,8 +27,77 @@ app = Flask(__name__)
 NOTES_FILE = "notes.json"
 LABELS_FILE = "labels.json"
 
-# Configure Gemini API
-genai.configure(api_key="Classified")
+# Storage backend: "json" (notes.json/labels.json, default) or "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json").lower()
+SQLITE_FILE = os.environ.get("SQLITE_FILE", "calendar.db")
+# Let reads of the JSON stores run concurrently (useful with many threads)
+STORE_RW_LOCK = os.environ.get("STORE_RW_LOCK", "false").lower() in ("1", "true", "yes")
+
+# Parsed notes/labels stay in memory and are written through on mutation
+note_store, label_store, change_log = create_stores(STORAGE_BACKEND, NOTES_FILE, LABELS_FILE, SQLITE_FILE,
+                                                    rw_lock=STORE_RW_LOCK)
+
+# Configure Gemini API: one shared client, model and generation defaults from the environment
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", ai_client.DEFAULT_MODEL)
+AI_TEMPERATURE = float(os.environ["AI_TEMPERATURE"]) if os.environ.get("AI_TEMPERATURE") else None
+AI_MAX_OUTPUT_TOKENS = int(os.environ["AI_MAX_OUTPUT_TOKENS"]) if os.environ.get("AI_MAX_OUTPUT_TOKENS") else None
+# Categorization answers are cached, so ask for the most deterministic ones
+AI_CATEGORIZATION_TEMPERATURE = float(os.environ.get("AI_CATEGORIZATION_TEMPERATURE", "0"))
+ai_client.configure(os.environ.get("GEMINI_API_KEY", "Classified"), GEMINI_MODEL,
+                    temperature=AI_TEMPERATURE, max_output_tokens=AI_MAX_OUTPUT_TOKENS)
+
+# AI provider: "gemini", or a local stand-in (see fake_ai.py) to develop and
+# benchmark offline: "fake", "record" (Gemini, saving answers to
+# AI_FIXTURES_FILE) or "replay" (the saved answers)
+AI_PROVIDER = os.environ.get("AI_PROVIDER", "gemini").lower()
+if AI_PROVIDER != "gemini":
+    ai_client.set_provider(fake_ai.create_provider(
+        AI_PROVIDER,
+        os.environ.get("AI_FIXTURES_FILE", "ai_fixtures.jsonl"),
+        latency=os.environ.get("AI_FAKE_LATENCY", fake_ai.DEFAULT_LATENCY),
+        error_rate=float(os.environ.get("AI_FAKE_ERROR_RATE", "0")),
+        seed=int(os.environ["AI_FAKE_SEED"]) if os.environ.get("AI_FAKE_SEED") else None
+    ))
+    logger.info(f"AI provider: {AI_PROVIDER}")
+
+# Open the Gemini connection at startup and optionally keep it warm while idle
+AI_WARMUP = os.environ.get("AI_WARMUP", "false").lower() in ("1", "true", "yes")
+AI_KEEPALIVE_INTERVAL = float(os.environ.get("AI_KEEPALIVE_INTERVAL", "0"))
+
+def warm_up_ai():
+    """Warm the Gemini connection of this process if AI_WARMUP is set"""
+    if AI_WARMUP:
+        ai_client.warm_up(AI_KEEPALIVE_INTERVAL)
+
+# All Gemini calls share one bounded pool, paced to the API quota, behind a
+# circuit breaker that fails them fast while Gemini is failing or too slow
+AI_CALL_TIMEOUT = float(os.environ.get("AI_CALL_TIMEOUT", "30"))
+AI_REQUEST_DEADLINE = float(os.environ.get("AI_REQUEST_DEADLINE", "60"))
+ai_executor = AIExecutor(
+    max_workers=int(os.environ.get("AI_MAX_CONCURRENCY", "8")),
+    requests_per_minute=float(os.environ.get("AI_REQUESTS_PER_MINUTE", "60")),
+    call_timeout=AI_CALL_TIMEOUT,
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("AI_BREAKER_FAILURES", "5")),
+        latency_slo=float(os.environ.get("AI_LATENCY_SLO", "15")),
+        reset_timeout=float(os.environ.get("AI_BREAKER_RESET", "30"))
+    )
+)
+
+# Latency budget of each user-facing AI endpoint, queueing included; past
+# it the endpoint answers without the AI (or with an error) instead of waiting
+ASK_AI_BUDGET = float(os.environ.get("ASK_AI_BUDGET", "30"))
+GENERATE_PLAN_BUDGET = float(os.environ.get("GENERATE_PLAN_BUDGET", "45"))
+
+# /ask_ai sends only the notes relevant to the question, up to this many tokens
+ASK_AI_CONTEXT_TOKENS = int(os.environ.get("ASK_AI_CONTEXT_TOKENS", "2000"))
+schedule_index = ScheduleIndex(note_store, change_log)
+
+# Finished /ask_ai and /analyze_time_allocation responses, per worker
+response_cache = ResponseCache(
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "300")),
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+)
 
 def get_today_date():
     """Get today's date in YYYY-MM-DD format, timezone-safe"""
@@ -29,7 +109,7 @@ def parse_date_safe(date_string):
         # Parse the date string and extract only the date part
         dt = datetime.strptime(date_string, "%Y-%m-%d")
         return dt.date()
-    except ValueError:
+    except (TypeError, ValueError):  # TypeError: not a string at all
         raise ValueError(f"Invalid date format: {date_string}. Use YYYY-MM-DD format.")
 
 def validate_date_format(date_string):
@@ -82,36 +162,20 @@ def generate_date_range(start_date, end_date):
     return dates
 
 def load_notes():
-    """Load notes from JSON file with error handling"""
-    if os.path.exists(NOTES_FILE):
-        with open(NOTES_FILE, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                logger.error("Failed to parse notes.json, starting with empty data")
-                return {}
-    return {}
+    """Load notes from the in-memory store (re-reads notes.json only when it changed)"""
+    return note_store.snapshot()
 
 def save_notes(notes):
-    """Save notes to JSON file with proper formatting"""
-    with open(NOTES_FILE, "w", encoding="utf-8") as f:
-        json.dump(notes, f, ensure_ascii=False, indent=2)
+    """Replace all notes and write them through to notes.json"""
+    note_store.replace_all(notes)
 
 def load_labels():
-    """Load date labels from JSON file with error handling"""
-    if os.path.exists(LABELS_FILE):
-        with open(LABELS_FILE, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                logger.error("Failed to parse labels.json, starting with empty data")
-                return {}
-    return {}
+    """Load date labels from the in-memory store (re-reads labels.json only when it changed)"""
+    return label_store.snapshot()
 
 def save_labels(labels):
-    """Save date labels to JSON file with proper formatting"""
-    with open(LABELS_FILE, "w", encoding="utf-8") as f:
-        json.dump(labels, f, ensure_ascii=False, indent=2)
+    """Replace all labels and write them through to labels.json"""
+    label_store.replace_all(labels)
 
 def get_current_week_dates():
     """Get the next 7 days starting from today in YYYY-MM-DD format"""
@@ -129,91 +193,31 @@ def get_month_dates(year, month):
     return generate_date_range(start_date, end_date)
 
 def parse_ai_plan(ai_response):
-    """Parse AI response to extract daily plans with improved error handling"""
-    try:
-        logger.info(f"Parsing AI response: {ai_response[:200]}...")
-        
-        # Try to extract structured plan from AI response
-        lines = ai_response.strip().split('\n')
-        daily_plans = {}
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Look for date patterns like "Monday:", "週一:", "Day 1:", etc.
-            date_patterns = [
-                r'^(週[一二三四五六日]|Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday|Day \d+)[:：]\s*(.+)',
-                r'^(\d{1,2}月\d{1,2}日)[:：]\s*(.+)',
-                r'^(\d{4}-\d{2}-\d{2})[:：]\s*(.+)',
-                r'^(Mon|Tue|Wed|Thu|Fri|Sat|Sun)[:：]\s*(.+)',
-                r'^(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)[:：]\s*(.+)'
-            ]
-            
-            for pattern in date_patterns:
-                match = re.match(pattern, line, re.IGNORECASE)
-                if match:
-                    date_key = match.group(1)
-                    activities_text = match.group(2)
-                    
-                    # Handle different activity separators
-                    if '、' in activities_text:
-                        activities = activities_text.split('、')
-                    elif ',' in activities_text:
-                        activities = activities_text.split(',')
-                    elif ';' in activities_text:
-                        activities = activities_text.split(';')
-                    else:
-                        activities = [activities_text]
-                    
-                    # Clean up activities
-                    cleaned_activities = []
-                    for act in activities:
-                        act = act.strip()
-                        if act and act not in ['', ' ', '•', '-']:
-                            # Remove common prefixes
-                            act = re.sub(r'^[•\-*]\s*', '', act)
-                            cleaned_activities.append(act)
-                    
-                    if cleaned_activities:
-                        daily_plans[date_key] = cleaned_activities
-                        logger.info(f"Parsed {date_key}: {cleaned_activities}")
-                    break
-        
-        logger.info(f"Successfully parsed {len(daily_plans)} days")
-        return daily_plans
-        
-    except Exception as e:
-        logger.error(f"Error parsing AI plan: {e}")
-        return {}
+    """Parse a free-text "day: activities" plan (see plan_parser.parse_line_plan)"""
+    daily_plans = plan_parser.parse_line_plan(ai_response)
+    logger.info(f"Parsed {len(daily_plans)} days from a text plan")
+    return daily_plans
 
 def map_weekday_to_date(weekday, week_dates):
-    """Map weekday names to actual dates with improved mapping"""
-    weekday_mapping = {
-        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-        'friday': 4, 'saturday': 5, 'sunday': 6,
-        '週一': 0, '週二': 1, '週三': 2, '週四': 3,
-        '週五': 4, '週六': 5, '週日': 6,
-        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3,
-        'fri': 4, 'sat': 5, 'sun': 6
-    }
-    
-    weekday_lower = weekday.lower()
-    if weekday_lower in weekday_mapping:
-        day_index = weekday_mapping[weekday_lower]
-        if day_index < len(week_dates):
-            return week_dates[day_index]
-    
-    # Try to extract day number from "Day X" format
-    day_match = re.match(r'day\s*(\d+)', weekday_lower)
-    if day_match:
-        day_num = int(day_match.group(1)) - 1  # Convert to 0-based index
-        if 0 <= day_num < len(week_dates):
-            return week_dates[day_num]
-    
-    logger.warning(f"Could not map weekday '{weekday}' to date")
-    return None
+    """Map a parsed day ("週一", "Monday", "Day 3", "8月12日", a date) to its date"""
+    actual_date = plan_parser.day_to_date(weekday, week_dates)
+    if actual_date is None:
+        logger.warning(f"Could not map weekday '{weekday}' to date")
+    return actual_date
+
+def parse_plan_response(ai_response, week_dates):
+    """Parse Gemini's plan: strict JSON first, then the free-text fallback.
+
+    Returns (daily_plans, format, json_error): format is "json", "lines" or
+    None when neither found a day; json_error says why JSON was rejected.
+    """
+    try:
+        return plan_parser.parse_json_plan(ai_response, week_dates), "json", None
+    except plan_parser.PlanFormatError as e:
+        json_error = str(e)
+    logger.warning(f"AI plan is not a valid JSON plan ({json_error}), parsing it as text")
+    daily_plans = parse_ai_plan(ai_response)
+    return daily_plans, "lines" if daily_plans else None, json_error
 
 def create_fallback_plan(goal, week_dates):
     """Create a simple fallback plan when AI parsing fails"""
@@ -231,6 +235,21 @@ def create_fallback_plan(goal, week_dates):
     
     return fallback_activities
 
+def conditional_json(etag, build_payload):
+    """Return build_payload() as JSON with a strong ETag, or 304 if the client has it.
+
+    etag must be cheap to compute (store versions, not data) so unchanged
+    calendars are answered without loading or serializing anything.
+    """
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag)
+    # Let clients cache the body but always revalidate it
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -238,82 +257,87 @@ def index():
 @app.route("/get_notes", methods=["GET"])
 def get_notes():
     """Get all notes from the calendar"""
-    notes = load_notes()
-    return jsonify(notes)
+    return conditional_json(f"notes-{note_store.etag()}", load_notes)
 
 @app.route("/get_labels", methods=["GET"])
 def get_labels():
     """Get all date labels from the calendar"""
-    labels = load_labels()
-    return jsonify(labels)
+    return conditional_json(f"labels-{label_store.etag()}", load_labels)
 
-@app.route("/save_label", methods=["POST"])
-def save_label():
-    """Save a label for a specific date"""
-    data = request.get_json()
+def apply_save_label(data):
+    """Save a label for a specific date; returns (response, status)"""
     date = data.get("date")
     label = data.get("label")
     color = data.get("color", "#ff6b6b")  # Default color
 
     if not date or not label:
-        return jsonify({"error": "Please provide date and label"}), 400
+        return {"error": "Please provide date and label"}, 400
+
+    if not validate_date_format(date):
+        return {"error": "Invalid date format. Use YYYY-MM-DD"}, 400
 
     # Validate color format
     if not re.match(r'^#[0-9a-fA-F]{6}$', color):
-        return jsonify({"error": "Invalid color format. Use hex format (e.g., #ff6b6b)"}), 400
+        return {"error": "Invalid color format. Use hex format (e.g., #ff6b6b)"}, 400
 
-    labels = load_labels()
-    labels[date] = {
+    label_store.set(date, {
         "label": label,
         "color": color,
         "created_at": datetime.now().isoformat()
-    }
-    save_labels(labels)
-    return jsonify({"status": "success"})
+    })
+    return {"status": "success"}, 200
 
-@app.route("/update_label", methods=["POST"])
-def update_label():
-    """Update a label for a specific date"""
-    data = request.get_json()
+@app.route("/save_label", methods=["POST"])
+def save_label():
+    """Save a label for a specific date"""
+    response, status = apply_save_label(request.get_json())
+    return jsonify(response), status
+
+def apply_update_label(data):
+    """Update a label for a specific date; returns (response, status)"""
     date = data.get("date")
     label = data.get("label")
     color = data.get("color")
 
     if not date or not label:
-        return jsonify({"error": "Please provide date and label"}), 400
+        return {"error": "Please provide date and label"}, 400
 
     # Validate color format if provided
     if color and not re.match(r'^#[0-9a-fA-F]{6}$', color):
-        return jsonify({"error": "Invalid color format. Use hex format (e.g., #ff6b6b)"}), 400
+        return {"error": "Invalid color format. Use hex format (e.g., #ff6b6b)"}, 400
 
-    labels = load_labels()
-    if date not in labels:
-        return jsonify({"error": "Label not found for this date"}), 404
-
-    labels[date]["label"] = label
+    fields = {"label": label, "updated_at": datetime.now().isoformat()}
     if color:
-        labels[date]["color"] = color
-    labels[date]["updated_at"] = datetime.now().isoformat()
-    
-    save_labels(labels)
-    return jsonify({"status": "success"})
+        fields["color"] = color
 
-@app.route("/delete_label", methods=["POST"])
-def delete_label():
-    """Delete a label from a specific date"""
-    data = request.get_json()
+    if not label_store.update_label(date, fields):
+        return {"error": "Label not found for this date"}, 404
+
+    return {"status": "success"}, 200
+
+@app.route("/update_label", methods=["POST"])
+def update_label():
+    """Update a label for a specific date"""
+    response, status = apply_update_label(request.get_json())
+    return jsonify(response), status
+
+def apply_delete_label(data):
+    """Delete a label from a specific date; returns (response, status)"""
     date = data.get("date")
 
     if not date:
-        return jsonify({"error": "Please provide date"}), 400
+        return {"error": "Please provide date"}, 400
 
-    labels = load_labels()
-    if date in labels:
-        del labels[date]
-        save_labels(labels)
-        return jsonify({"status": "success"})
+    if label_store.delete(date) is not None:
+        return {"status": "success"}, 200
     else:
-        return jsonify({"error": "Label not found for this date"}), 404
+        return {"error": "Label not found for this date"}, 404
+
+@app.route("/delete_label", methods=["POST"])
+def delete_label():
+    """Delete a label from a specific date"""
+    response, status = apply_delete_label(request.get_json())
+    return jsonify(response), status
 
 @app.route("/get_labels_for_month", methods=["GET"])
 def get_labels_for_month():
@@ -324,15 +348,10 @@ def get_labels_for_month():
     if year is None or month is None:
         return jsonify({"error": "Please provide year and month parameters"}), 400
     
-    month_dates = get_month_dates(year, month)
-    labels = load_labels()
-    
-    month_labels = {}
-    for date in month_dates:
-        if date in labels:
-            month_labels[date] = labels[date]
-    
-    return jsonify(month_labels)
+    return conditional_json(
+        f"labels-{year}-{month}-{label_store.etag()}",
+        lambda: label_store.get_range(get_month_start_date(year, month), get_month_end_date(year, month))
+    )
 
 @app.route("/get_notes_for_month", methods=["GET"])
 def get_notes_for_month():
@@ -343,66 +362,148 @@ def get_notes_for_month():
     if year is None or month is None:
         return jsonify({"error": "Please provide year and month parameters"}), 400
     
-    month_dates = get_month_dates(year, month)
-    notes = load_notes()
-    
-    month_notes = {}
-    for date in month_dates:
-        if date in notes:
-            month_notes[date] = notes[date]
-    
-    return jsonify(month_notes)
+    return conditional_json(
+        f"notes-{year}-{month}-{note_store.etag()}",
+        lambda: note_store.get_range(get_month_start_date(year, month), get_month_end_date(year, month))
+    )
 
-@app.route("/save_note", methods=["POST"])
-def save_note():
-    """Save a single note for a specific date"""
-    data = request.get_json()
+def apply_save_note(data):
+    """Save a single note for a specific date; returns (response, status)"""
     date = data.get("date")
     content = data.get("content")
 
     if not date or content is None:
-        return jsonify({"error": "Please provide date and content"}), 400
+        return {"error": "Please provide date and content"}, 400
+
+    if not validate_date_format(date):
+        return {"error": "Invalid date format. Use YYYY-MM-DD"}, 400
+
+    note_store.append_note(date, content)
+    return {"status": "success"}, 200
+
+def split_changed(store, dates):
+    """Split changed dates into current values and deleted dates (tombstones)"""
+    current = {}
+    deleted = []
+    for date in dates:
+        value = store.get(date)
+        if value is None:
+            deleted.append(date)
+        else:
+            current[date] = value
+    return current, deleted
 
-    notes = load_notes()
-    notes.setdefault(date, [])
-    notes[date].append(content)
-    save_notes(notes)
-    return jsonify({"status": "success"})
+@app.route("/changes", methods=["GET"])
+def get_changes():
+    """Get notes and labels that changed after a version, for delta sync"""
+    since = request.args.get("since", type=int)
 
-@app.route("/update_note", methods=["POST"])
-def update_note():
-    """Update all notes for a specific date"""
-    data = request.get_json()
+    if since is None:
+        return jsonify({"error": "Please provide the since parameter"}), 400
+
+    version, changed = change_log.since(since)
+    if changed is None:
+        # The version is older than the retained history: send everything
+        return jsonify({
+            "version": version,
+            "full_resync": True,
+            "notes": load_notes(),
+            "labels": load_labels()
+        })
+
+    payload = build_change_payload(changed)
+    payload["version"] = version
+    return jsonify(payload)
+
+def build_change_payload(changed):
+    """Current content of the dates in a change-log delta (None means resync)"""
+    if changed is None:
+        return {"full_resync": True}
+
+    notes, deleted_notes = split_changed(note_store, changed.get("notes", []))
+    labels, deleted_labels = split_changed(label_store, changed.get("labels", []))
+    return {
+        "full_resync": False,
+        "notes": notes,
+        "deleted_notes": deleted_notes,
+        "labels": labels,
+        "deleted_labels": deleted_labels
+    }
+
+# Every open /events stream holds a server thread unless the worker is
+# cooperative (gevent); tabs over the cap poll /changes instead
+MAX_EVENT_SUBSCRIBERS = int(os.environ.get("MAX_EVENT_SUBSCRIBERS")
+                            or default_max_subscribers(int(os.environ.get("WEB_THREADS", "8"))))
+
+# Pushes every committed note/label change to /events subscribers
+event_broker = EventBroker(change_log, build_change_payload, max_subscribers=MAX_EVENT_SUBSCRIBERS)
+
+@app.after_request
+def notify_event_subscribers(response):
+    """Wake the event broker after any successful mutation"""
+    if request.method == "POST" and response.status_code < 400:
+        event_broker.notify()
+    return response
+
+@app.route("/events", methods=["GET"])
+def events():
+    """Server-Sent Events stream of note/label changes"""
+    if not event_broker.try_subscribe():
+        response = jsonify({"error": "Too many event subscribers, please poll /changes instead"})
+        response.headers["Retry-After"] = "300"
+        return response, 503
+
+    last_version = request.headers.get("Last-Event-ID", type=int)
+    response = Response(stream_with_context(event_broker.stream(last_version)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # keep reverse proxies from buffering the stream
+    return response
+
+@app.route("/save_note", methods=["POST"])
+def save_note():
+    """Save a single note for a specific date"""
+    response, status = apply_save_note(request.get_json())
+    return jsonify(response), status
+
+def apply_update_note(data):
+    """Update all notes for a specific date; returns (response, status)"""
     date = data.get("date")
     contents = data.get("contents")
 
     if not date or not isinstance(contents, list):
-        return jsonify({"error": "Please provide date and contents list"}), 400
+        return {"error": "Please provide date and contents list"}, 400
 
-    notes = load_notes()
-    notes[date] = contents
-    save_notes(notes)
-    return jsonify({"status": "success"})
+    if not validate_date_format(date):
+        return {"error": "Invalid date format. Use YYYY-MM-DD"}, 400
 
-@app.route("/delete_note", methods=["POST"])
-def delete_note():
-    """Delete a specific note from a date"""
-    data = request.get_json()
+    note_store.set(date, contents)
+    return {"status": "success"}, 200
+
+@app.route("/update_note", methods=["POST"])
+def update_note():
+    """Update all notes for a specific date"""
+    response, status = apply_update_note(request.get_json())
+    return jsonify(response), status
+
+def apply_delete_note(data):
+    """Delete a specific note from a date; returns (response, status)"""
     date = data.get("date")
     note_index = data.get("note_index")
 
-    if not date or note_index is None:
-        return jsonify({"error": "Please provide date and note index"}), 400
+    if not date or not isinstance(note_index, int):
+        return {"error": "Please provide date and note index"}, 400
 
-    notes = load_notes()
-    if date in notes and 0 <= note_index < len(notes[date]):
-        notes[date].pop(note_index)
-        if not notes[date]:  # Remove date if no notes left
-            del notes[date]
-        save_notes(notes)
-        return jsonify({"status": "success"})
+    # The store removes the date once its last note is gone
+    if note_store.remove_note(date, note_index):
+        return {"status": "success"}, 200
     else:
-        return jsonify({"error": "Note not found"}), 404
+        return {"error": "Note not found"}, 404
+
+@app.route("/delete_note", methods=["POST"])
+def delete_note():
+    """Delete a specific note from a date"""
+    response, status = apply_delete_note(request.get_json())
+    return jsonify(response), status
 
 @app.route("/delete_all_notes", methods=["POST"])
 def delete_all_notes():
@@ -417,11 +518,9 @@ def delete_all_notes():
     if not validate_date_format(date_string):
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
 
-    notes = load_notes()
-    if date_string in notes:
-        deleted_count = len(notes[date_string])
-        del notes[date_string]
-        save_notes(notes)
+    removed = note_store.delete(date_string)
+    if removed is not None:
+        deleted_count = len(removed)
         return jsonify({
             "status": "success",
             "deleted_notes_count": deleted_count,
@@ -430,21 +529,19 @@ def delete_all_notes():
     else:
         return jsonify({"error": "No notes found for this date"}), 404
 
-@app.route("/delete_date_range", methods=["POST"])
-def delete_date_range():
-    """Delete all notes within a date range"""
-    data = request.get_json()
+def apply_delete_date_range(data):
+    """Delete all notes within a date range; returns (response, status)"""
     start_date = data.get("start_date")
     end_date = data.get("end_date")
 
     if not start_date or not end_date:
-        return jsonify({"error": "Please provide both start_date and end_date"}), 400
+        return {"error": "Please provide both start_date and end_date"}, 400
 
     # Validate date formats
     if not validate_date_format(start_date):
-        return jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD"}), 400
+        return {"error": "Invalid start_date format. Use YYYY-MM-DD"}, 400
     if not validate_date_format(end_date):
-        return jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD"}), 400
+        return {"error": "Invalid end_date format. Use YYYY-MM-DD"}, 400
 
     try:
         # Parse dates and validate range
@@ -452,34 +549,30 @@ def delete_date_range():
         end_dt = parse_date_safe(end_date)
         
         if start_dt > end_dt:
-            return jsonify({"error": "Start date must be before or equal to end date"}), 400
+            return {"error": "Start date must be before or equal to end date"}, 400
             
     except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        return {"error": str(e)}, 400
 
-    notes = load_notes()
-    deleted_dates = []
-    deleted_count = 0
-    
-    # Generate all dates in the range using the utility function
-    date_range = generate_date_range(start_dt, end_dt)
-    
-    for current_date in date_range:
-        if current_date in notes:
-            deleted_count += len(notes[current_date])
-            deleted_dates.append(current_date)
-            del notes[current_date]
+    removed = note_store.delete_range(start_dt, end_dt)
+    deleted_dates = list(removed.keys())
+    deleted_count = sum(len(notes_list) for notes_list in removed.values())
     
     if deleted_dates:
-        save_notes(notes)
-        return jsonify({
+        return {
             "status": "success",
             "deleted_dates": deleted_dates,
             "deleted_notes_count": deleted_count,
             "message": f"Deleted {len(deleted_dates)} days with {deleted_count} total notes"
-        })
+        }, 200
     else:
-        return jsonify({"error": "No notes found in the specified date range"}), 404
+        return {"error": "No notes found in the specified date range"}, 404
+
+@app.route("/delete_date_range", methods=["POST"])
+def delete_date_range():
+    """Delete all notes within a date range"""
+    response, status = apply_delete_date_range(request.get_json())
+    return jsonify(response), status
 
 @app.route("/delete_multiple_dates", methods=["POST"])
 def delete_multiple_dates():
@@ -504,18 +597,11 @@ def delete_multiple_dates():
             "error": f"Invalid date format(s): {', '.join(invalid_dates)}. Use YYYY-MM-DD format."
         }), 400
 
-    notes = load_notes()
-    deleted_dates = []
-    deleted_count = 0
-    
-    for date_string in dates:
-        if date_string in notes:
-            deleted_count += len(notes[date_string])
-            deleted_dates.append(date_string)
-            del notes[date_string]
+    removed = note_store.delete_many(dates)
+    deleted_dates = list(removed.keys())
+    deleted_count = sum(len(notes_list) for notes_list in removed.values())
     
     if deleted_dates:
-        save_notes(notes)
         return jsonify({
             "status": "success",
             "deleted_dates": deleted_dates,
@@ -545,21 +631,11 @@ def delete_week():
     
     end_dt = get_week_end_date(start_dt)
     
-    notes = load_notes()
-    deleted_dates = []
-    deleted_count = 0
-    
-    # Generate all dates in the week using the utility function
-    week_dates = generate_date_range(start_dt, end_dt)
-    
-    for current_date in week_dates:
-        if current_date in notes:
-            deleted_count += len(notes[current_date])
-            deleted_dates.append(current_date)
-            del notes[current_date]
+    removed = note_store.delete_range(start_dt, end_dt)
+    deleted_dates = list(removed.keys())
+    deleted_count = sum(len(notes_list) for notes_list in removed.values())
     
     if deleted_dates:
-        save_notes(notes)
         return jsonify({
             "status": "success",
             "deleted_dates": deleted_dates,
@@ -595,21 +671,11 @@ def delete_month():
     start_dt = get_month_start_date(year, month)
     end_dt = get_month_end_date(year, month)
     
-    notes = load_notes()
-    deleted_dates = []
-    deleted_count = 0
-    
-    # Generate all dates in the month using the utility function
-    month_dates = generate_date_range(start_dt, end_dt)
-    
-    for current_date in month_dates:
-        if current_date in notes:
-            deleted_count += len(notes[current_date])
-            deleted_dates.append(current_date)
-            del notes[current_date]
+    removed = note_store.delete_range(start_dt, end_dt)
+    deleted_dates = list(removed.keys())
+    deleted_count = sum(len(notes_list) for notes_list in removed.values())
     
     if deleted_dates:
-        save_notes(notes)
         month_name = start_dt.strftime("%B %Y")
         return jsonify({
             "status": "success",
@@ -625,129 +691,555 @@ def delete_month():
             "message": f"No notes found for {month_name}"
         })
 
+# Operations accepted by /batch, applied with the same validation as their routes
+BATCH_OPERATIONS = {
+    "save_note": apply_save_note,
+    "update_note": apply_update_note,
+    "delete_note": apply_delete_note,
+    "save_label": apply_save_label,
+    "update_label": apply_update_label,
+    "delete_label": apply_delete_label,
+    "delete_date_range": apply_delete_date_range,
+}
+MAX_BATCH_OPERATIONS = 5000
+
+class BatchAborted(Exception):
+    """Raised inside an all-or-nothing batch to roll back every operation"""
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    """Apply an ordered list of note/label operations and save once"""
+    data = request.get_json()
+    operations = data.get("operations")
+    atomic = bool(data.get("atomic", False))
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "Please provide a list of operations"}), 400
+
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"A batch can contain at most {MAX_BATCH_OPERATIONS} operations"}), 400
+
+    # Validate the shape of every operation before applying any of them
+    invalid_indexes = [
+        str(index) for index, operation in enumerate(operations)
+        if not isinstance(operation, dict) or operation.get("op") not in BATCH_OPERATIONS
+    ]
+    if invalid_indexes:
+        return jsonify({
+            "error": f"Unknown or malformed operation(s) at index {', '.join(invalid_indexes)}. "
+                     f"Supported operations: {', '.join(BATCH_OPERATIONS)}"
+        }), 400
+
+    # Every operation is applied to the in-memory stores and persisted once
+    # when the batch closes; an exception rolls all of them back
+    results = []
+    try:
+        with note_store.batch(), label_store.batch():
+            for index, operation in enumerate(operations):
+                response, status = BATCH_OPERATIONS[operation["op"]](operation)
+                results.append({
+                    "index": index,
+                    "op": operation["op"],
+                    "status_code": status,
+                    "response": response
+                })
+                if atomic and status >= 400:
+                    raise BatchAborted()
+    except BatchAborted:
+        failed = results[-1]
+        return jsonify({
+            "status": "rolled_back",
+            "atomic": True,
+            "failed_index": failed["index"],
+            "error": failed["response"].get("error"),
+            "results": results
+        }), failed["status_code"]
+
+    failed_count = sum(1 for result in results if result["status_code"] >= 400)
+    return jsonify({
+        "status": "success" if failed_count == 0 else "partial",
+        "atomic": atomic,
+        "applied_count": len(results) - failed_count,
+        "failed_count": failed_count,
+        "results": results
+    })
+
+# Prompt for generate_plan(): the answer is parsed by plan_parser.parse_json_plan
+PLAN_PROMPT = """
+    As an AI calendar assistant, please create a detailed weekly schedule based on this goal: "{goal}"
+    
+    The schedule covers these {count} days: {days}
+    {context}
+    
+    Respond with only a JSON object that maps each of these dates (YYYY-MM-DD) to a list of its activities:
+    {{"{first_date}": ["activity", "activity"], ...}}
+    
+    Make sure each day has 2-4 specific, actionable activities that align with the goal.
+    Keep activities concise but descriptive.
+    """
+
+# Streamed plans are parsed line by line (plan_parser.PlanStreamParser)
+PLAN_STREAM_PROMPT = """
+    As an AI calendar assistant, please create a detailed weekly schedule based on this goal: "{goal}"
+    
+    The schedule covers these {count} days: {days}
+    {context}
+    
+    Respond with one JSON object per line, one line per date in date order, and nothing else:
+    {{"date": "{first_date}", "activities": ["activity", "activity"]}}
+    
+    Make sure each day has 2-4 specific, actionable activities that align with the goal.
+    Keep activities concise but descriptive.
+    """
+
+# Longest plan generate_plan accepts, and how often a week whose request
+# failed or could not be parsed is asked for again before using the template
+PLAN_MAX_WEEKS = int(os.environ.get("PLAN_MAX_WEEKS", "26"))
+PLAN_WEEK_ATTEMPTS = 2
+
+def build_plan_prompt(template, goal, week_dates, context=""):
+    """Fill a plan prompt with the goal, the dates to plan and continuity context"""
+    return template.format(
+        goal=goal,
+        count=len(week_dates),
+        days=", ".join(f"{day} ({parse_date_safe(day).strftime('%A')})" for day in week_dates),
+        first_date=week_dates[0],
+        context=context
+    )
+
+def plan_horizon(data):
+    """Dates a plan request covers: `weeks` weeks from today (default 1) or start_date..end_date"""
+    if data.get("start_date") or data.get("end_date"):
+        if not (data.get("start_date") and data.get("end_date")):
+            raise ValueError("Please provide both start_date and end_date")
+        first, last = parse_date_safe(data["start_date"]), parse_date_safe(data["end_date"])
+        if last < first:
+            raise ValueError("end_date must not be before start_date")
+    else:
+        try:
+            weeks = int(data.get("weeks", 1))
+        except (TypeError, ValueError):
+            raise ValueError("weeks must be a whole number")
+        if not 1 <= weeks <= PLAN_MAX_WEEKS:
+            raise ValueError(f"weeks must be between 1 and {PLAN_MAX_WEEKS}")
+        first = date.today()
+        last = first + timedelta(days=7 * weeks - 1)
+    if (last - first).days + 1 > 7 * PLAN_MAX_WEEKS:
+        raise ValueError(f"Plans can cover at most {PLAN_MAX_WEEKS} weeks")
+    return generate_date_range(first, last)
+
 @app.route("/generate_plan", methods=["POST"])
 def generate_plan():
-    """Generate AI-powered weekly plan with improved error handling"""
+    """Generate AI-powered weekly plan with improved error handling.
+
+    Clients that accept text/event-stream get each day as soon as Gemini
+    has written it (see stream_plan); others get the whole plan at once.
+    Plans longer than a week are generated week by week, concurrently (see
+    generate_multi_week_plan), and always returned as one JSON object.
+    """
     data = request.get_json()
     planning_goal = data.get("goal", "").strip()
     
     if not planning_goal:
         return jsonify({"error": "Please provide a planning goal"}), 400
+    commit = data.get("commit", "progressive")
+    if commit not in ("progressive", "final"):
+        return jsonify({"error": "commit must be 'progressive' or 'final'"}), 400
+
+    try:
+        plan_dates = plan_horizon(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     logger.info(f"Generating plan for goal: {planning_goal}")
 
-    # Get current week dates
-    week_dates = get_current_week_dates()
+    if len(plan_dates) > 7:
+        try:
+            return jsonify(generate_multi_week_plan(planning_goal, plan_dates))
+        except Exception as e:
+            logger.error(f"AI planning error: {str(e)}")
+            return jsonify({"error": f"AI planning error: {str(e)}"}), 500
+
+    # Dates of the week to plan
+    week_dates = plan_dates
     logger.info(f"Week dates: {week_dates}")
+
+    if request.accept_mimetypes.best_match(["application/json", "text/event-stream"]) == "text/event-stream":
+        response = Response(stream_with_context(stream_plan(planning_goal, week_dates, commit == "progressive")),
+                            mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
     
     # Create prompt for AI planning
-    prompt = f"""
-    As an AI calendar assistant, please create a detailed weekly schedule based on this goal: "{planning_goal}"
-    
-    The schedule should start from TODAY and cover the next 7 days. Please provide a structured plan with the following format:
-    
-    週一: [activities separated by 、]
-    週二: [activities separated by 、]
-    週三: [activities separated by 、]
-    週四: [activities separated by 、]
-    週五: [activities separated by 、]
-    週六: [activities separated by 、]
-    週日: [activities separated by 、]
-    
-    Note: The first day (週一) represents TODAY, and the schedule covers the next 7 days.
-    Make sure each day has 2-4 specific, actionable activities that align with the goal.
-    Keep activities concise but descriptive.
-    Only respond with the schedule in the exact format requested.
-    """
+    prompt = build_plan_prompt(PLAN_PROMPT, planning_goal, week_dates)
 
     try:
-        # Use Gemini API to generate plan
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        ai_response = response.text
-        
-        logger.info(f"AI Response received: {ai_response[:300]}...")
+        try:
+            # Use Gemini API to generate plan
+            ai_response = ai_executor.run(ai_client.generate_text, prompt, deadline=Deadline(GENERATE_PLAN_BUDGET))
+            logger.info(f"AI Response received: {ai_response[:300]}...")
+        except (AIUnavailable, AITimeout) as e:
+            # Within the latency budget or not at all: plan without the AI
+            logger.warning(f"AI planning unavailable ({str(e)}), using fallback plan")
+            ai_response = ""
         
         # Parse the AI response
-        daily_plans = parse_ai_plan(ai_response)
+        daily_plans, plan_format, _ = parse_plan_response(ai_response, week_dates) if ai_response else ({}, None, None)
         
         # If parsing failed, create fallback plan
         if not daily_plans:
             logger.warning("AI parsing failed, using fallback plan")
             daily_plans = create_fallback_plan(planning_goal, week_dates)
+            plan_format = "fallback"
         
         # Map weekday names to actual dates and save to calendar
-        notes = load_notes()
         saved_plans = {}
         
         for weekday, activities in daily_plans.items():
             actual_date = map_weekday_to_date(weekday, week_dates)
             if actual_date:
-                notes[actual_date] = activities
                 saved_plans[actual_date] = activities
                 logger.info(f"Mapped {weekday} to {actual_date}: {activities}")
             else:
                 logger.warning(f"Could not map {weekday} to a date")
         
-        save_notes(notes)
+        note_store.set_many(saved_plans)
         
         return jsonify({
             "status": "success",
             "plan": saved_plans,
             "ai_response": ai_response,
-            "parsed_plans": daily_plans
+            "parsed_plans": daily_plans,
+            "plan_format": plan_format
         })
         
     except Exception as e:
         logger.error(f"AI planning error: {str(e)}")
         return jsonify({"error": f"AI planning error: {str(e)}"}), 500
 
+def week_context(index, weeks):
+    """Continuity context for the index-th week of a multi-week plan"""
+    context = (f"This is week {index + 1} of a {len(weeks)}-week plan ({weeks[0][0]} to {weeks[-1][-1]}): "
+               f"plan it as step {index + 1} of {len(weeks)} towards the goal.")
+    if index > 0:
+        context += f" Week {index} ({weeks[index - 1][0]} to {weeks[index - 1][-1]}) covers step {index}."
+    if index + 1 < len(weeks):
+        context += f" Week {index + 2} ({weeks[index + 1][0]} to {weeks[index + 1][-1]}) covers step {index + 2}."
+    return context + " Build on the earlier steps without repeating them, and leave the later ones for their weeks."
+
+def generate_multi_week_plan(goal, plan_dates):
+    """Plan several weeks at once: one request per week, run concurrently.
+
+    Each week's request says which step of the plan it is and which dates
+    the neighbouring weeks cover, so weeks generated at the same time still
+    build on each other. The deadline allows GENERATE_PLAN_BUDGET for each
+    round of the AI pool, plus the rate limiter's pacing. A week whose
+    request fails or cannot be parsed is asked for again while time is
+    left (PLAN_WEEK_ATTEMPTS in total) and then gets the template plan; the
+    other weeks are unaffected. All weeks are saved in one write.
+    """
+    started = time.monotonic()
+    weeks = [plan_dates[start:start + 7] for start in range(0, len(plan_dates), 7)]
+    budget = ai_executor.batch_budget(len(weeks), GENERATE_PLAN_BUDGET)
+    deadline = Deadline(budget)
+    logger.info(f"Planning {len(weeks)} weeks concurrently within {budget:.0f}s")
+
+    results = {}  # week index -> (daily plans by date, plan format)
+    errors = {}
+    remaining = list(range(len(weeks)))
+    for attempt in range(PLAN_WEEK_ATTEMPTS):
+        if not remaining or deadline.expired():
+            break
+        calls = [(index, ai_executor.submit(ai_client.generate_text,
+                                            build_plan_prompt(PLAN_PROMPT, goal, weeks[index],
+                                                              week_context(index, weeks)),
+                                            deadline=deadline))
+                 for index in remaining]
+        unavailable = False
+        for index, call in calls:
+            try:
+                daily_plans, plan_format, json_error = parse_plan_response(call.result(), weeks[index])
+            except AIUnavailable as e:
+                unavailable = True
+                errors[index] = str(e)
+                continue
+            except Exception as e:
+                errors[index] = str(e)
+                continue
+            mapped = {}
+            for day, activities in daily_plans.items():
+                actual_date = plan_parser.day_to_date(day, weeks[index])
+                if actual_date:
+                    mapped[actual_date] = activities
+            if mapped:
+                results[index] = (mapped, plan_format)
+                errors.pop(index, None)
+            else:
+                errors[index] = f"no days could be parsed ({json_error})"
+        remaining = [index for index in remaining if index not in results]
+        if remaining:
+            logger.warning(f"{len(remaining)} of {len(weeks)} plan weeks failed (attempt {attempt + 1})")
+        if unavailable:
+            break  # retrying cannot help while the breaker is open
+
+    plan = {}
+    week_reports = []
+    for index, week_dates in enumerate(weeks):
+        if index in results:
+            daily_plans, plan_format = results[index]
+        else:
+            daily_plans = {}
+            for weekday, activities in create_fallback_plan(goal, week_dates).items():
+                actual_date = plan_parser.day_to_date(weekday, week_dates)
+                if actual_date:
+                    daily_plans[actual_date] = activities
+            plan_format = "fallback"
+        plan.update(daily_plans)
+        week_reports.append({
+            "start": week_dates[0],
+            "end": week_dates[-1],
+            "plan_format": plan_format,
+            "error": errors.get(index),
+        })
+
+    note_store.set_many(plan)
+    elapsed = time.monotonic() - started
+    logger.info(f"Planned {len(weeks)} weeks ({len(weeks) - len(results)} from the template) in {elapsed:.2f}s")
+    return {
+        "status": "success",
+        "plan": plan,
+        "weeks": week_reports,
+        "failed_weeks": len(weeks) - len(results),
+        "elapsed": round(elapsed, 3),
+    }
+
+def restore_notes(previous, written):
+    """Put dates back the way they were: {date: old activities, or None if it had none}.
+
+    Only dates still holding what was written to them ({date: activities})
+    are restored; a date another client edited since keeps that edit.
+    Returns the restored dates.
+    """
+    with note_store.batch():
+        # Compare and set in one batch, so no other write can slip in between
+        restored = {key: value for key, value in previous.items() if note_store.get(key) == written[key]}
+        kept = {key: value for key, value in restored.items() if value is not None}
+        if kept:
+            note_store.set_many(kept)
+        note_store.delete_many([key for key, value in restored.items() if value is None])
+    skipped = len(previous) - len(restored)
+    if skipped:
+        logger.info(f"Kept {skipped} days edited while the plan was generated")
+    return sorted(restored)
+
+def stream_plan(goal, week_dates, progressive):
+    """Send each planned day as a day event as soon as its line is generated.
+
+    progressive: every day is saved when it arrives; otherwise all of them
+    are saved in one write at the end. Either way the plan is committed as
+    a whole or not at all: if generation fails midway or the client goes
+    away, days already saved are put back the way they were, unless another
+    client edited them in the meantime. The done event carries the time to
+    the first day. If the AI is unavailable before any day arrived, the
+    template plan is sent instead.
+    """
+    started = time.monotonic()
+    plan = {}
+    previous = {}  # what progressively saved dates held before
+    first_day = None
+    committed = False
+    stream = None
+    parser = plan_parser.PlanStreamParser(week_dates)
+
+    def accept(day, activities):
+        nonlocal first_day
+        plan[day] = activities
+        if progressive:
+            if day not in previous:
+                previous[day] = note_store.get(day)
+            note_store.set(day, activities)
+        if first_day is None:
+            first_day = time.monotonic() - started
+            logger.info(f"First plan day after {first_day:.2f}s")
+        return sse_event("day", {"date": day, "activities": activities, "saved": progressive})
+
+    try:
+        plan_format = "json"
+        try:
+            stream = ai_executor.stream(ai_client.stream_text, build_plan_prompt(PLAN_STREAM_PROMPT, goal, week_dates),
+                                        deadline=Deadline(GENERATE_PLAN_BUDGET))
+            for text in stream:
+                for day, activities in parser.feed(text):
+                    yield accept(day, activities)
+            for day, activities in parser.close():
+                yield accept(day, activities)
+        except (AIUnavailable, AITimeout) as e:
+            if plan:
+                raise
+            logger.warning(f"AI planning unavailable ({str(e)}), using fallback plan")
+
+        if not plan:
+            logger.warning("AI parsing failed, using fallback plan")
+            plan_format = "fallback"
+            for weekday, activities in create_fallback_plan(goal, week_dates).items():
+                actual_date = map_weekday_to_date(weekday, week_dates)
+                if actual_date:
+                    yield accept(actual_date, activities)
+        elif parser.free_text:
+            plan_format = "lines"
+
+        if not progressive:
+            note_store.set_many(plan)
+        committed = True
+        elapsed = time.monotonic() - started
+        logger.info(f"Streamed plan of {len(plan)} days in {elapsed:.2f}s ({parser.skipped} lines skipped)")
+        yield sse_event("done", {"plan": plan, "plan_format": plan_format, "first_day": round(first_day, 3),
+                                 "elapsed": round(elapsed, 3), "skipped_lines": parser.skipped})
+    except Exception as e:
+        logger.error(f"AI planning error: {str(e)}")
+        rolled_back = restore_notes(previous, plan)
+        previous = {}
+        yield sse_event("error", {"error": f"AI planning error: {str(e)}", "rolled_back": rolled_back})
+    finally:
+        # Also reached when the browser disconnects mid-plan
+        if stream is not None:
+            stream.close()
+        if not committed and previous:
+            logger.info(f"Plan abandoned, restoring {len(previous)} days")
+            restore_notes(previous, plan)
+
+# Prompt for ask_ai(); {schedule} is the retrieved part of the calendar
+ASK_AI_PROMPT = """
+    You are an AI calendar assistant. Today is {today}. Here is the part of the user's schedule relevant to their question:
+    {schedule}
+    
+    User's question: {question}
+    
+    Please provide a helpful, personalized response based on their schedule. If they're asking for advice, consider their current commitments and suggest improvements. If they're asking about specific dates or activities, provide relevant information. Keep your response concise but informative. Respond in a friendly, helpful tone.
+    """
+
 @app.route("/ask_ai", methods=["POST"])
 def ask_ai():
-    """AI Q&A about existing schedule with improved error handling"""
+    """AI Q&A about existing schedule with improved error handling.
+
+    Clients that accept text/event-stream get the answer streamed as
+    Server-Sent Events while Gemini generates it; others get one JSON object.
+    Answers are cached until the notes change (see response_cache).
+    """
     data = request.get_json()
     question = data.get("question", "").strip()
     if not question:
         return jsonify({"error": "Please provide a question"}), 400
     
     logger.info(f"AI Q&A request: {question}")
-    notes = load_notes()
-    
-    # Create summary of current schedule
-    if notes:
-        notes_summary = []
-        for date, activities in notes.items():
-            if isinstance(activities, dict):
-                acts = "、".join(activities.get('activities', []))
-            else:
-                acts = "、".join(activities)
-            notes_summary.append(f"{date}: {acts}")
-        schedule_text = "\n".join(notes_summary)
-        logger.info(f"Current schedule: {schedule_text}")
+    cache_key = ask_ai_cache_key(question)
+
+    if request.accept_mimetypes.best_match(["application/json", "text/event-stream"]) == "text/event-stream":
+        response = Response(stream_with_context(stream_ai_answer(question, cache_key)), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"  # keep reverse proxies from buffering the stream
+        return response
+
+    def answer_question():
+        prompt, context = build_ask_ai_prompt(question)
+        # Use Gemini API for Q&A
+        return {"answer": ai_executor.run(ai_client.generate_text, prompt, deadline=Deadline(ASK_AI_BUDGET)),
+                "context": context}
+
+    try:
+        result = response_cache.get_or_compute(cache_key, answer_question)
+        logger.info(f"AI Q&A response: {result['answer'][:200]}...")
+        return jsonify(result)
+    except (AIUnavailable, AITimeout) as e:
+        logger.warning(f"AI Q&A unavailable: {str(e)}")
+        return jsonify({"error": f"AI response error: {str(e)}"}), 503
+    except Exception as e:
+        logger.error(f"AI response error: {str(e)}")
+        return jsonify({"error": f"AI response error: {str(e)}"}), 500
+
+def ask_ai_cache_key(question):
+    """Response cache key: the answer depends on the question, the notes and today's date"""
+    return ResponseCache.key("ask_ai", normalize_activity(question), note_store.etag(), get_today_date(),
+                             ASK_AI_PROMPT, GEMINI_MODEL, ASK_AI_CONTEXT_TOKENS)
+
+def build_ask_ai_prompt(question):
+    """Prompt for a Q&A question about the user's schedule, and its size report.
+
+    Only the part of the calendar relevant to the question (see
+    retrieval.py) is included, up to ASK_AI_CONTEXT_TOKENS.
+    """
+    today = date.today()
+    lines, context = select_context(schedule_index, question, today, ASK_AI_CONTEXT_TOKENS)
+    if lines:
+        schedule_text = "\n".join(lines)
+    elif len(schedule_index):
+        schedule_text = "No scheduled activities match this question."
     else:
         schedule_text = "Currently no scheduled activities."
-        logger.info("No current schedule found")
+    logger.debug(f"Schedule context: {schedule_text}")
     
     # Create prompt for AI analysis
-    prompt = f"""
-    You are an AI calendar assistant. Here is the user's current schedule:
-    {schedule_text}
-    
-    User's question: {question}
-    
-    Please provide a helpful, personalized response based on their schedule. If they're asking for advice, consider their current commitments and suggest improvements. If they're asking about specific dates or activities, provide relevant information. Keep your response concise but informative. Respond in a friendly, helpful tone.
+    prompt = ASK_AI_PROMPT.format(today=today.strftime("%Y-%m-%d (%A)"), schedule=schedule_text, question=question)
+    context["prompt_tokens"] = estimate_tokens(prompt)
+    logger.info(f"AI Q&A prompt: ~{context['prompt_tokens']} tokens, {context['dates']} of "
+                f"{context['total_dates']} dates (windows {context['windows']}, {context['matched']} matched)")
+    return prompt, context
+
+def sse_event(event, data):
+    """One Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_ai_answer(question, cache_key):
+    """Relay Gemini's answer as chunk events, then a done (or error) event.
+
+    Time to first token is logged and sent with the done event, along with
+    the prompt size report (context). A cached answer, or one another
+    request is already generating, is sent as a single chunk.
     """
-    
+    started = time.monotonic()
+    flight = response_cache.claim(cache_key)
+    if not flight.leader:
+        try:
+            result = flight.wait()
+        except Exception as e:
+            logger.error(f"AI response error: {str(e)}")
+            yield sse_event("error", {"error": f"AI response error: {str(e)}"})
+            return
+        elapsed = time.monotonic() - started
+        logger.info(f"AI Q&A answered from the response cache in {elapsed:.2f}s")
+        yield sse_event("chunk", {"text": result["answer"]})
+        yield sse_event("done", {"ttft": round(elapsed, 3), "elapsed": round(elapsed, 3),
+                                 "context": result["context"], "cached": True})
+        return
+
+    first_token = None
+    answer = []
+    stream = None
     try:
-        # Use Gemini API for Q&A
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        answer = response.text
-        logger.info(f"AI Q&A response: {answer[:200]}...")
-        return jsonify({"answer": answer})
+        prompt, context = build_ask_ai_prompt(question)
+        stream = ai_executor.stream(ai_client.stream_text, prompt, deadline=Deadline(ASK_AI_BUDGET))
+        for text in stream:
+            if first_token is None:
+                first_token = time.monotonic() - started
+                logger.info(f"AI Q&A time to first token: {first_token:.2f}s")
+            answer.append(text)
+            yield sse_event("chunk", {"text": text})
+        flight.resolve({"answer": "".join(answer), "context": context})
+        elapsed = time.monotonic() - started
+        logger.info(f"AI Q&A streamed response in {elapsed:.2f}s: {''.join(answer)[:200]}...")
+        yield sse_event("done", {"ttft": round(first_token or elapsed, 3), "elapsed": round(elapsed, 3),
+                                 "context": context})
     except Exception as e:
+        flight.fail(e)
         logger.error(f"AI response error: {str(e)}")
-        return jsonify({"error": f"AI response error: {str(e)}"}), 500
+        yield sse_event("error", {"error": f"AI response error: {str(e)}"})
+    finally:
+        # Also reached when the browser disconnects mid-answer
+        if stream is not None:
+            stream.close()
+        if not flight.done():
+            flight.fail(AITimeout("The request generating this answer was cancelled"))
 
 @app.route("/get_week_dates", methods=["GET"])
 def get_week_dates():
@@ -758,6 +1250,11 @@ def get_week_dates():
 @app.route("/get_calendar_stats", methods=["GET"])
 def get_calendar_stats():
     """Get calendar statistics"""
+    # The current week depends on today's date as well as on the notes
+    return conditional_json(f"stats-{get_today_date()}-{note_store.etag()}", build_calendar_stats)
+
+def build_calendar_stats():
+    """Compute the statistics returned by /get_calendar_stats"""
     notes = load_notes()
     
     total_notes = sum(len(notes_list) for notes_list in notes.values())
@@ -783,100 +1280,125 @@ def get_calendar_stats():
             "note_count": len(notes[most_active_date])
         }
     
-    # Get recent activity (last 5 days with notes)
-    recent_dates = sorted(notes.keys(), reverse=True)[:5]
+    # Get recent activity (last 5 days with notes) from the store's date index
     stats["recent_activity"] = [
-        {"date": date, "note_count": len(notes[date])} 
-        for date in recent_dates
+        {"date": date, "note_count": len(notes_list)}
+        for date, notes_list in note_store.latest(5)
     ]
     
-    return jsonify(stats)
+    return stats
+
+# Activity categories with AI-friendly descriptions
+TIME_ALLOCATION_CATEGORIES = {
+    "study": {
+        "description": "Academic learning, reading, research, exam preparation, homework, studying, educational activities",
+        "color": "#4e79a7",
+        "icon": "📚",
+        "scale_range": (1, 10)  # Intensity scale 1-10
+    },
+    "exercise": {
+        "description": "Physical activities, workouts, sports, fitness training, movement, athletic activities",
+        "color": "#f28e2c",
+        "icon": "💪",
+        "scale_range": (1, 10)  # Intensity scale 1-10
+    },
+    "rest": {
+        "description": "Relaxation, sleep, leisure, downtime, breaks, meditation, peaceful activities",
+        "color": "#76b7b2",
+        "icon": "😴",
+        "scale_range": (1, 10)  # Rest quality scale 1-10
+    }
+}
 
 @app.route("/analyze_time_allocation", methods=["GET"])
 def analyze_time_allocation():
-    """Analyze time allocation from calendar data using AI categorization"""
+    """Analyze time allocation from calendar data using AI categorization.
+
+    Open tabs loading the analysis at once share one computation, and the
+    result is reused until the notes change. Analyses where some activities
+    fell back to keywords (the AI failed or ran out of time) are not kept.
+    """
+    cache_key = ResponseCache.key("analyze_time_allocation", note_store.etag(), get_today_date(),
+                                  categorization_cache.version, file_stamp(CLASSIFIER_FILE))
+    analysis, _ = response_cache.get_or_compute(cache_key, build_time_allocation,
+                                                cacheable=lambda result: result[1])
+    return jsonify(analysis)
+
+def build_time_allocation():
+    """Compute the /analyze_time_allocation payload; returns (payload, fully AI-categorized)"""
     notes = load_notes()
     
-    # Activity categories with AI-friendly descriptions
-    activity_categories = {
-        "study": {
-            "description": "Academic learning, reading, research, exam preparation, homework, studying, educational activities",
-            "color": "#4e79a7",
-            "icon": "📚",
-            "scale_range": (1, 10)  # Intensity scale 1-10
-        },
-        "exercise": {
-            "description": "Physical activities, workouts, sports, fitness training, movement, athletic activities",
-            "color": "#f28e2c",
-            "icon": "💪",
-            "scale_range": (1, 10)  # Intensity scale 1-10
-        },
-        "rest": {
-            "description": "Relaxation, sleep, leisure, downtime, breaks, meditation, peaceful activities",
-            "color": "#76b7b2",
-            "icon": "😴",
-            "scale_range": (1, 10)  # Rest quality scale 1-10
-        }
-    }
-    
-    # Analyze activities using AI
-    category_counts = {category: 0 for category in activity_categories.keys()}
-    category_details = {category: [] for category in activity_categories.keys()}
-    category_intensities = {category: [] for category in activity_categories.keys()}
-    
+    # Use AI to categorize and get intensity (cached answers are reused)
+    all_activities = [activity for activities in notes.values() for activity in activities]
+    categorized = categorize_activities(all_activities, TIME_ALLOCATION_CATEGORIES,
+                                        deadline=Deadline(AI_REQUEST_DEADLINE))
+    complete = not any(result.get("fallback") for result in categorized.values())
+    return summarize_time_allocation(notes, categorized), complete
+
+def summarize_time_allocation(notes, categorized):
+    """Time allocation payload from {activity: {"category", "intensity"}}.
+
+    Activities without a result yet (a job still in progress) are counted
+    in the total but not in any category.
+    """
+    tally = new_time_allocation_tally()
     total_activities = 0
     
     for date, activities in notes.items():
         for activity in activities:
             total_activities += 1
             
-            # Use AI to categorize and get intensity
-            ai_result = categorize_activity_with_ai(activity, activity_categories)
+            ai_result = categorized.get(activity)
             
             if ai_result:
-                category = ai_result['category']
-                intensity = ai_result['intensity']
-                
-                category_counts[category] += 1
-                category_details[category].append({
+                entry = tally[ai_result['category']]
+                entry["count"] += 1
+                entry["intensity"] += ai_result['intensity']
+                entry["details"].append({
                     "date": date,
                     "activity": activity,
-                    "category": category,
-                    "intensity": intensity
+                    "category": ai_result['category'],
+                    "intensity": ai_result['intensity']
                 })
-                category_intensities[category].append(intensity)
     
-    # Calculate percentages and averages
-    category_percentages = {}
-    category_averages = {}
-    
-    for category, count in category_counts.items():
-        if total_activities > 0:
-            percentage = (count / total_activities) * 100
-        else:
-            percentage = 0
-        category_percentages[category] = round(percentage, 1)
-        
-        # Calculate average intensity
-        if category_intensities[category]:
-            avg_intensity = sum(category_intensities[category]) / len(category_intensities[category])
-            category_averages[category] = round(avg_intensity, 1)
-        else:
-            category_averages[category] = 0
+    return time_allocation_payload(notes, categorized, tally, total_activities)
+
+def new_time_allocation_tally():
+    """Empty {category: {"count", "intensity" (sum), "details"}} for summarizing"""
+    return {category: {"count": 0, "intensity": 0, "details": []} for category in TIME_ALLOCATION_CATEGORIES}
+
+def tally_time_allocation(tally, occurrences, answered, max_details):
+    """Add answered activities to a running tally, once per date each occurs on.
+
+    Only up to max_details details are kept per category, so a job's
+    partial results stay small however many activities it has.
+    """
+    for activity, result in answered.items():
+        entry = tally[result["category"]]
+        dates = occurrences.get(activity, [])
+        entry["count"] += len(dates)
+        entry["intensity"] += result["intensity"] * len(dates)
+        for date in dates[:max(0, max_details - len(entry["details"]))]:
+            entry["details"].append({"date": date, "activity": activity, "category": result["category"],
+                                     "intensity": result["intensity"]})
+
+def time_allocation_payload(notes, categorized, tally, total_activities):
+    """Time allocation payload from a tally; the weekly part is read from this week's notes"""
+    activity_categories = TIME_ALLOCATION_CATEGORIES
     
     # Prepare chart data
     chart_data = []
-    for category, count in category_counts.items():
-        if count > 0:
+    for category, entry in tally.items():
+        if entry["count"] > 0:
             chart_data.append({
                 "category": category,
-                "count": count,
-                "percentage": category_percentages[category],
-                "average_intensity": category_averages[category],
+                "count": entry["count"],
+                "percentage": round(entry["count"] / total_activities * 100, 1),
+                "average_intensity": round(entry["intensity"] / entry["count"], 1),
                 "color": activity_categories[category]["color"],
                 "icon": activity_categories[category]["icon"],
                 "scale_range": activity_categories[category]["scale_range"],
-                "details": category_details[category]
+                "details": entry["details"]
             })
     
     # Sort by count (descending)
@@ -893,7 +1415,7 @@ def analyze_time_allocation():
             daily_intensities = {category: [] for category in activity_categories.keys()}
             
             for activity in notes[date]:
-                ai_result = categorize_activity_with_ai(activity, activity_categories)
+                ai_result = categorized.get(activity)
                 
                 if ai_result:
                     category = ai_result['category']
@@ -905,22 +1427,111 @@ def analyze_time_allocation():
             weekly_analysis[date] = daily_categories
             weekly_intensities[date] = daily_intensities
     
-    return jsonify({
+    return {
         "total_activities": total_activities,
         "chart_data": chart_data,
         "weekly_analysis": weekly_analysis,
         "weekly_intensities": weekly_intensities,
         "activity_categories": activity_categories
-    })
+    }
 
-def categorize_activity_with_ai(activity, categories):
-    """Use AI to categorize an activity and determine its intensity"""
-    try:
-        # Create prompt for AI categorization
-        prompt = f"""
-        Analyze this activity: "{activity}"
+# Analyses too large for one request run as background jobs, persisted in
+# JOBS_FILE so a restart resumes them. A job whose worker has not saved
+# progress for JOB_STALE_SECONDS is taken over by another one.
+JOBS_FILE = os.environ.get("JOBS_FILE", "jobs.db")
+ANALYSIS_JOB_CHUNK = int(os.environ.get("ANALYSIS_JOB_CHUNK", "200"))
+# Sample details per category in the partial results of a running job
+ANALYSIS_PARTIAL_DETAILS = 5
+job_store = JobStore(JOBS_FILE)
+job_runner = JobRunner(
+    job_store,
+    max_workers=int(os.environ.get("JOB_WORKERS", "2")),
+    stale_after=float(os.environ.get("JOB_STALE_SECONDS", str(max(180, 3 * AI_REQUEST_DEADLINE))))
+)
+
+def run_time_allocation_job(job):
+    """Categorize the notes ANALYSIS_JOB_CHUNK activities at a time, saving each chunk.
+
+    The job only records the notes version it was started for; a job
+    resumed after the notes changed analyzes them as they are now. Keyword
+    fallbacks (the AI failed) are saved for progress but asked for again
+    when the job is resumed. Each chunk also saves a partial result from
+    running counts, with a few sample details per category; the full
+    result is built once at the end.
+    """
+    notes = load_notes()
+    occurrences = {}
+    for date, activities in notes.items():
+        for activity in activities:
+            occurrences.setdefault(activity, []).append(date)
+    categorized = {activity: result for activity, result in job.saved().items() if not result.get("fallback")}
+    tally = new_time_allocation_tally()
+    tally_time_allocation(tally, occurrences, categorized, ANALYSIS_PARTIAL_DETAILS)
+    total = sum(len(dates) for dates in occurrences.values())
+    pending = [activity for activity in occurrences if activity not in categorized]
+    for start in range(0, len(pending), ANALYSIS_JOB_CHUNK):
+        job.check_cancelled()
+        chunk = pending[start:start + ANALYSIS_JOB_CHUNK]
+        answered = categorize_activities(chunk, TIME_ALLOCATION_CATEGORIES, deadline=Deadline(AI_REQUEST_DEADLINE))
+        categorized.update(answered)
+        tally_time_allocation(tally, occurrences, answered, ANALYSIS_PARTIAL_DETAILS)
+        # Saved with the chunk so polls can return it as is
+        job.save(answered, result=time_allocation_payload(notes, categorized, tally, total))
+    return summarize_time_allocation(notes, categorized)
+
+job_runner.register("time_allocation", run_time_allocation_job)
+
+def start_background_tasks():
+    """Per-process startup: warm the AI connection and resume interrupted jobs"""
+    warm_up_ai()
+    job_runner.resume_stale()
+
+def analysis_job_status(job):
+    """Job state for clients, with the result so far (final once done)"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "progress": min(1.0, round(job["completed"] / job["total"], 3)) if job["total"] else 1.0,
+        "error": job["error"],
+        # The partial result saved with the latest chunk until the job is done
+        "result": job["result"]
+    }
+
+@app.route("/analysis_jobs", methods=["POST"])
+def start_analysis_job():
+    """Start a background time allocation analysis (or join the one already running)"""
+    version = note_store.etag()
+    notes = load_notes()
+    total = len(set(activity for activities in notes.values() for activity in activities))
+    job, created = job_runner.start("time_allocation", f"{version}-{get_today_date()}", {"notes_version": version},
+                                    total, result=summarize_time_allocation(notes, {}))
+    logger.info(f"Analysis job {job['id']} {'started' if created else 'joined'} ({total} activities)")
+    return jsonify(analysis_job_status(job)), 202 if created else 200
+
+@app.route("/analysis_jobs/<job_id>", methods=["GET"])
+def get_analysis_job(job_id):
+    """Progress and partial results of an analysis job"""
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(analysis_job_status(job))
+
+@app.route("/analysis_jobs/<job_id>/cancel", methods=["POST"])
+def cancel_analysis_job(job_id):
+    """Cancel an analysis job; results saved so far are kept"""
+    job = job_store.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(analysis_job_status(job))
+
+# Prompt for categorize_batch_with_ai(); {activities} is a JSON list of {"id", "activity"}
+CATEGORIZATION_PROMPT = """
+        Analyze each of these activities:
+        {activities}
         
-        Categorize it into one of these categories and provide an intensity score (1-10):
+        Categorize each one into one of these categories and provide an intensity score (1-10):
         
         1. STUDY: Academic learning, reading, research, exam preparation, homework, studying, educational activities
            - Intensity 1-3: Light reading, casual learning
@@ -940,118 +1551,194 @@ def categorize_activity_with_ai(activity, categories):
            - Intensity 7-8: Deep relaxation, meditation
            - Intensity 9-10: Complete rest days, vacation
         
-        Respond in this exact format:
-        Category: [study/exercise/rest]
-        Intensity: [1-10]
-        Reason: [brief explanation]
+        Respond with only a JSON array holding one object per activity, using its id:
+        [{{"id": 0, "category": "study", "intensity": 5}}]
+        category must be one of study, exercise or rest.
         """
+
+# Activities sent per categorization request, and how often the ones the
+# AI skipped or answered malformed are re-sent before using keywords
+CATEGORIZATION_BATCH_SIZE = int(os.environ.get("CATEGORIZATION_BATCH_SIZE", "40"))
+CATEGORIZATION_ATTEMPTS = 2
+
+# Gemini categorizations persist across requests and restarts. Entries are
+# tied to the prompt and model, so changing either starts a fresh set of answers.
+AI_CACHE_FILE = os.environ.get("AI_CACHE_FILE", "ai_cache.db")
+categorization_cache = CategorizationCache(
+    AI_CACHE_FILE,
+    prompt_version(CATEGORIZATION_PROMPT, GEMINI_MODEL, AI_CATEGORIZATION_TEMPERATURE),
+    max_entries=int(os.environ.get("AI_CACHE_MAX_ENTRIES", "50000"))
+)
+
+# Local classifier trained from the cached AI answers (python classifier.py
+# train). Its predictions at or above the threshold are used without asking
+# Gemini; without a model file every uncached activity goes to the AI.
+CLASSIFIER_FILE = os.environ.get("CLASSIFIER_FILE", "activity_model.npz")
+CLASSIFIER_THRESHOLD = float(os.environ.get("CLASSIFIER_THRESHOLD", "0.9"))
+local_classifier = ModelFile(CLASSIFIER_FILE, categorization_cache.version)
+
+def categorize_activities(activities, categories, deadline=None):
+    """Categorize many activities, asking the AI only for ones not in the cache.
+
+    Activities the local classifier is confident about are not sent to the
+    AI either. Any activity the AI does not answer (in time) falls back to
+    keyword matching. Returns {activity: result}; duplicates are categorized once.
+    """
+    unique = list(dict.fromkeys(activities))
+    results = categorization_cache.get_many(unique)
+    pending = [activity for activity in unique if activity not in results]
+    model = local_classifier.get()
+    if model is not None and pending:
+        uncertain = []
+        for activity in pending:
+            prediction = model.predict(activity)
+            if prediction["confidence"] >= CLASSIFIER_THRESHOLD and prediction["category"] in categories:
+                # Not cached: the cache only holds AI answers to train on
+                results[activity] = prediction
+            else:
+                uncertain.append(activity)
+        local_classifier.record(len(pending), len(pending) - len(uncertain))
+        pending = uncertain
+    answered = categorize_batch_with_ai(pending, categories, deadline)
+    for activity in pending:
+        if activity not in answered:
+            # Keyword fallbacks are not cached so the AI is asked again next time
+            results[activity] = dict(fallback_categorization(activity, categories), fallback=True)
+    results.update(answered)
+    categorization_cache.put_many(answered)
+    return results
+
+def categorize_batch_with_ai(activities, categories, deadline=None):
+    """Use AI to categorize activities, CATEGORIZATION_BATCH_SIZE per request.
+
+    All batches are sent concurrently through the AI executor. Returns
+    {activity: result} for the activities the AI answered validly; missing
+    or malformed entries are re-sent (again concurrently) up to
+    CATEGORIZATION_ATTEMPTS times in total.
+    """
+    remaining = dict(enumerate(activities))
+    answered = {}
+    for attempt in range(CATEGORIZATION_ATTEMPTS):
+        if not remaining or (deadline is not None and deadline.expired()):
+            break
+        ids = list(remaining)
+        calls = []
+        for start in range(0, len(ids), CATEGORIZATION_BATCH_SIZE):
+            # Create prompt for AI categorization
+            items = [{"id": item_id, "activity": remaining[item_id]}
+                     for item_id in ids[start:start + CATEGORIZATION_BATCH_SIZE]]
+            prompt = CATEGORIZATION_PROMPT.format(activities=json.dumps(items, ensure_ascii=False))
+            call = ai_executor.submit(ai_client.generate_text, prompt,
+                                      temperature=AI_CATEGORIZATION_TEMPERATURE, deadline=deadline)
+            calls.append((items, call))
         
-        # Use Gemini API for categorization
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
-        ai_response = response.text.strip()
-        
-        # Parse AI response
-        category_match = re.search(r'Category:\s*(study|exercise|rest)', ai_response, re.IGNORECASE)
-        intensity_match = re.search(r'Intensity:\s*(\d+)', ai_response)
+        unavailable = False
+        for items, call in calls:
+            try:
+                ids_sent = {item["id"] for item in items}
+                parsed = parse_categorization_batch(call.result(), ids_sent, categories)
+            except AIUnavailable:
+                unavailable = True
+                parsed = {}
+            except Exception as e:
+                logger.error(f"AI categorization error for {len(items)} activities: {str(e)}")
+                parsed = {}
+            for item_id, result in parsed.items():
+                answered[remaining.pop(item_id)] = result
         
-        if category_match and intensity_match:
-            category = category_match.group(1).lower()
-            intensity = int(intensity_match.group(1))
-            
+        if unavailable:
+            # Retrying cannot help while the breaker is open: keywords take over
+            logger.warning(f"AI unavailable, {len(remaining)} activities left to keyword categorization")
+            break
+        if remaining:
+            logger.warning(f"AI left {len(remaining)} of {len(ids)} activities uncategorized (attempt {attempt + 1})")
+    return answered
+
+def parse_categorization_batch(ai_response, ids, categories):
+    """Parse a JSON array of {id, category, intensity} into {id: result}.
+
+    Entries with unknown ids or categories, or without a numeric
+    intensity, are dropped so the caller can re-send them.
+    """
+    text = ai_response.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return {}
+    try:
+        entries = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            item_id = int(entry.get("id"))
+            intensity = int(entry.get("intensity"))
+        except (TypeError, ValueError):
+            continue
+        category = str(entry.get("category", "")).strip().lower()
+        if item_id not in ids or item_id in results or category not in categories:
+            continue
+        results[item_id] = {
+            "category": category,
             # Ensure intensity is within valid range
-            intensity = max(1, min(10, intensity))
-            
-            return {
-                'category': category,
-                'intensity': intensity,
-                'ai_response': ai_response
-            }
-        
-        # Fallback: use keyword matching if AI fails
-        return fallback_categorization(activity, categories)
-        
-    except Exception as e:
-        logger.error(f"AI categorization error for '{activity}': {str(e)}")
-        # Fallback to keyword matching
-        return fallback_categorization(activity, categories)
+            "intensity": max(1, min(10, intensity))
+        }
+    return results
 
 def fallback_categorization(activity, categories):
     """Fallback categorization using keyword matching"""
-    activity_lower = activity.lower()
-    
-    # Study keywords
-    study_keywords = ["study", "learn", "read", "research", "exam", "test", "quiz", "assignment", 
-                     "homework", "project", "paper", "essay", "review", "practice", "course", 
-                     "class", "lecture", "tutorial", "workshop", "seminar", "library", "book", 
-                     "chapter", "notes", "revision", "preparation"]
-    
-    # Exercise keywords
-    exercise_keywords = ["exercise", "workout", "gym", "run", "jog", "walk", "swim", "bike", 
-                        "cycling", "yoga", "pilates", "fitness", "training", "sport", "basketball", 
-                        "football", "soccer", "tennis", "volleyball", "badminton", "dance", 
-                        "aerobics", "strength", "cardio", "stretch"]
-    
-    # Rest keywords
-    rest_keywords = ["rest", "sleep", "nap", "relax", "break", "vacation", "holiday", "weekend", 
-                    "leisure", "free time", "downtime", "chill", "unwind", "recharge", "refresh", 
-                    "peace", "quiet", "meditation", "mindfulness"]
-    
-    # Determine category and intensity
-    if any(keyword in activity_lower for keyword in study_keywords):
-        intensity = determine_intensity(activity_lower, study_keywords)
-        return {'category': 'study', 'intensity': intensity}
-    elif any(keyword in activity_lower for keyword in exercise_keywords):
-        intensity = determine_intensity(activity_lower, exercise_keywords)
-        return {'category': 'exercise', 'intensity': intensity}
-    elif any(keyword in activity_lower for keyword in rest_keywords):
-        intensity = determine_intensity(activity_lower, rest_keywords)
-        return {'category': 'rest', 'intensity': intensity}
-    else:
+    result = taxonomy.categorize(activity, categories)
+    if result is None:
         # Default to rest with low intensity for unknown activities
         return {'category': 'rest', 'intensity': 3}
+    return result
+
+@app.route("/get_ai_cache_stats", methods=["GET"])
+def get_ai_cache_stats():
+    """Hit/miss counts and size of the categorization and response caches"""
+    stats = categorization_cache.stats()
+    stats["local_classifier"] = local_classifier.stats()
+    stats["responses"] = response_cache.stats()
+    return jsonify(stats)
 
-def determine_intensity(activity, keywords):
-    """Determine intensity based on activity description"""
-    activity_lower = activity.lower()
-    
-    # High intensity indicators
-    high_intensity_words = ["intense", "hard", "difficult", "challenging", "major", "important", 
-                           "critical", "all-day", "marathon", "competition", "exam", "test"]
-    
-    # Medium intensity indicators
-    medium_intensity_words = ["regular", "normal", "standard", "routine", "daily", "weekly"]
-    
-    # Low intensity indicators
-    low_intensity_words = ["light", "easy", "casual", "quick", "short", "brief", "simple"]
-    
-    if any(word in activity_lower for word in high_intensity_words):
-        return random.randint(7, 10)
-    elif any(word in activity_lower for word in medium_intensity_words):
-        return random.randint(4, 6)
-    elif any(word in activity_lower for word in low_intensity_words):
-        return random.randint(1, 3)
-    else:
-        # Default to medium intensity
-        return random.randint(4, 6)
+@app.route("/ai_status", methods=["GET"])
+def ai_status():
+    """AI provider, circuit breaker state and latency budgets of this worker's AI calls"""
+    return jsonify({
+        "provider": ai_client.provider().stats(),
+        "breaker": ai_executor.breaker.status(),
+        "budgets": {
+            "ask_ai": ASK_AI_BUDGET,
+            "generate_plan": GENERATE_PLAN_BUDGET,
+            "analysis": AI_REQUEST_DEADLINE,
+        },
+        "call_timeout": ai_executor.call_timeout,
+        "max_concurrency": ai_executor.max_workers,
+        "requests_per_minute": ai_executor.requests_per_minute,
+    })
 
 @app.route("/get_activity_trends", methods=["GET"])
 def get_activity_trends():
     """Get activity trends over time"""
+    # The 30-day window moves with today's date as well as with the notes
+    return conditional_json(f"trends-{get_today_date()}-{note_store.etag()}", build_activity_trends)
+
+def build_activity_trends():
+    """Compute the trends returned by /get_activity_trends"""
     notes = load_notes()
     
     # Get last 30 days using date utilities
     end_date = date.today()
     start_date = end_date - timedelta(days=30)
     
-    # Activity categories (same as above)
-    activity_categories = {
-        "study": ["study", "learn", "read", "research", "exam", "test", "quiz", "assignment", "homework", "project", "paper", "essay", "review", "practice", "course", "class", "lecture", "tutorial", "workshop", "seminar", "library", "book", "chapter", "notes", "revision", "preparation"],
-        "exercise": ["exercise", "workout", "gym", "run", "jog", "walk", "swim", "bike", "cycling", "yoga", "pilates", "fitness", "training", "sport", "basketball", "football", "soccer", "tennis", "volleyball", "badminton", "dance", "aerobics", "strength", "cardio", "stretch"],
-        "work": ["work", "job", "office", "meeting", "presentation", "client", "project", "deadline", "report", "email", "call", "conference", "interview", "business", "professional", "task", "assignment", "collaboration", "team", "manager", "colleague", "workplace"],
-        "rest": ["rest", "sleep", "nap", "relax", "break", "vacation", "holiday", "weekend", "leisure", "free time", "downtime", "chill", "unwind", "recharge", "refresh", "peace", "quiet", "meditation", "mindfulness"],
-        "social": ["friend", "family", "party", "dinner", "lunch", "coffee", "date", "hangout", "visit", "birthday", "celebration", "event", "gathering", "meet", "social", "relationship", "conversation", "chat", "talk"]
-    }
+    # Activity categories, in the order they are checked
+    activity_categories = list(taxonomy.CATEGORY_KEYWORDS)
     
     # Generate daily trends using the utility function
     trends = []
@@ -1061,43 +1748,40 @@ def get_activity_trends():
         daily_data = {
             "date": current_date_str,
             "total_activities": 0,
-            "categories": {category: 0 for category in activity_categories.keys()}
+            "categories": {category: 0 for category in activity_categories}
         }
         
         if current_date_str in notes:
             daily_data["total_activities"] = len(notes[current_date_str])
             
             for activity in notes[current_date_str]:
-                activity_lower = activity.lower()
-                categorized = False
-                
-                for category, keywords in activity_categories.items():
-                    for keyword in keywords:
-                        if keyword in activity_lower:
-                            daily_data["categories"][category] += 1
-                            categorized = True
-                            break
-                    if categorized:
-                        break
+                category = taxonomy.first_category(taxonomy.scan(activity), activity_categories)
+                if category:
+                    daily_data["categories"][category] += 1
         
         trends.append(daily_data)
     
-    return jsonify({
+    return {
         "trends": trends,
         "period": "30_days"
-    })
+    }
 
 @app.route("/debug/ai_response", methods=["POST"])
 def debug_ai_response():
-    """Debug endpoint to test AI response parsing"""
+    """Debug endpoint to test AI response parsing.
+
+    Runs the response through the strict JSON parser and the free-text
+    parser, and reports which one generate_plan would use and why JSON
+    was rejected.
+    """
     data = request.get_json()
     test_response = data.get("response", "")
     
     if not test_response:
         return jsonify({"error": "Please provide a test response"}), 400
     
-    parsed = parse_ai_plan(test_response)
     week_dates = get_current_week_dates()
+    parsed, plan_format, json_error = parse_plan_response(test_response, week_dates)
     
     mapped_plans = {}
     for weekday, activities in parsed.items():
@@ -1107,6 +1791,9 @@ def debug_ai_response():
     
     return jsonify({
         "original_response": test_response,
+        "plan_format": plan_format,
+        "json_error": json_error,
+        "line_plans": parse_ai_plan(test_response),
         "parsed_plans": parsed,
         "mapped_plans": mapped_plans,
         "week_dates": week_dates
@@ -1115,19 +1802,16 @@ def debug_ai_response():
 @app.route("/get_labeled_deadlines", methods=["GET"])
 def get_labeled_deadlines():
     """Get countdown data for dates that have labels (user-marked important events)"""
+    # Days remaining change with today's date as well as with notes and labels
+    return conditional_json(
+        f"deadlines-{get_today_date()}-{note_store.etag()}-{label_store.etag()}", build_labeled_deadlines
+    )
+
+def build_labeled_deadlines():
+    """Compute the countdowns returned by /get_labeled_deadlines"""
     notes = load_notes()
     labels = load_labels()
     
-    # Keywords that indicate important/deadline events in labels
-    important_label_keywords = [
-        "deadline", "due", "exam", "test", "quiz", "assignment", "project", "presentation",
-        "meeting", "appointment", "interview", "submission", "review", "final", "important",
-        "urgent", "critical", "must", "essential", "priority", "due date", "final exam", 
-        "term paper", "thesis", "dissertation", "proposal", "report", "conference", 
-        "workshop", "seminar", "training", "certification", "license", "renewal", 
-        "expiry", "expiration", "expires", "expiring", "last day", "final day"
-    ]
-    
     countdowns = []
     today = date.today()
     
@@ -1141,7 +1825,7 @@ def get_labeled_deadlines():
                 label_text = label_data.get("label", "").lower()
                 
                 # Check if label indicates importance
-                is_important = any(keyword in label_text for keyword in important_label_keywords)
+                is_important = taxonomy.is_important_label(label_text)
                 
                 if is_important:
                     days_remaining = (event_date - today).days
@@ -1191,7 +1875,7 @@ def get_labeled_deadlines():
     urgent_count = len([c for c in countdowns if c["priority"] == "urgent"])
     high_count = len([c for c in countdowns if c["priority"] == "high"])
     
-    return jsonify({
+    return {
         "countdowns": countdowns,
         "statistics": {
             "total": total_countdowns,
@@ -1199,7 +1883,10 @@ def get_labeled_deadlines():
             "urgent": urgent_count,
             "high": high_count
         }
-    })
+    }
 
 if __name__ == "__main__":
+    # With the reloader (debug=True) only the serving child runs the background tasks
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_tasks()
     app.run(debug=True)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar AI Endpoint Load Benchmark
+Drives /ask_ai, /generate_plan and /analyze_time_allocation with
+concurrent clients and reports throughput, latency percentiles and how
+many AI calls the requests cost.
+
+By default the app is started in-process on a synthetic calendar with the
+fake AI provider (fake_ai.py), so no API key or network is needed; tune it
+with --latency and --error-rate, or set AI_* variables (e.g.
+AI_REQUESTS_PER_MINUTE, AI_PROVIDER=replay) in the environment. With --url
+it drives a server that is already running instead.
+
+Usage: python bench_ai.py [--concurrency 8] [--requests 100] [--distinct 20]
+                          [--endpoints ask_ai,generate_plan,analyze_time_allocation]
+                          [--stream] [--latency lognormal:0.8,0.4] [--error-rate 0]
+                          [--notes 5000] [--url http://localhost:5000]
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ("ask_ai", "generate_plan", "analyze_time_allocation")
+
+QUESTIONS = ["What do I have tomorrow?", "How busy is next week?", "When did I last go jogging?",
+             "Do I exercise enough?", "明天有什麼安排？", "Am I studying enough for the exam?",
+             "What should I do to rest more this week?", "下週的行程會不會太滿？"]
+GOALS = ["Prepare for the final exam", "Run a 10K", "Learn to play the piano", "準備期末考",
+         "Get more sleep", "Read two books", "學習日文", "Finish the project report"]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return float("nan")
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def start_server(args):
+    """Serve the app in this process on a synthetic calendar; returns its base URL"""
+    os.environ.setdefault("AI_PROVIDER", "fake")
+    os.environ.setdefault("AI_FAKE_LATENCY", args.latency)
+    os.environ.setdefault("AI_FAKE_ERROR_RATE", str(args.error_rate))
+    # The fake answers instantly in quota terms: measure the app, not the pacing
+    os.environ.setdefault("AI_REQUESTS_PER_MINUTE", "6000")
+
+    workdir = tempfile.mkdtemp(prefix="calendar-bench-")
+    sys.path.insert(0, APP_DIR)
+    from bench_store import generate_calendar
+    print(f"📁 Generating {args.notes} notes in {workdir}")
+    generate_calendar(workdir, args.notes)
+
+    # The app resolves its data files relative to the working directory
+    os.chdir(workdir)
+    import logging
+    logging.disable(logging.ERROR)  # injected failures would interleave with the report
+    import app as calendar_app
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, calendar_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+_sessions = threading.local()
+
+
+def session():
+    """One keep-alive HTTP session per client thread"""
+    if not hasattr(_sessions, "value"):
+        _sessions.value = requests.Session()
+    return _sessions.value
+
+
+def read_stream(response, started):
+    """(time to the first chunk or plan day, ok) of a Server-Sent Events response"""
+    first_chunk = None
+    ok = False
+    for line in response.iter_lines(decode_unicode=True):
+        if line in ("event: chunk", "event: day") and first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        elif line == "event: done":
+            ok = True
+    return first_chunk, ok
+
+
+def issue(base_url, endpoint, index, args):
+    """One request: (latency, time to first chunk or None, "ok" or what failed)"""
+    started = time.perf_counter()
+    if endpoint == "ask_ai":
+        payload = {"question": f"{QUESTIONS[index % args.distinct % len(QUESTIONS)]} #{index % args.distinct}"}
+        headers = {"Accept": "text/event-stream" if args.stream else "application/json"}
+        response = session().post(f"{base_url}/ask_ai", json=payload, headers=headers,
+                                  stream=args.stream, timeout=args.timeout)
+        if args.stream and response.status_code == 200:
+            first_chunk, ok = read_stream(response, started)
+            return time.perf_counter() - started, first_chunk, "ok" if ok else "error event"
+    elif endpoint == "generate_plan":
+        payload = {"goal": f"{GOALS[index % args.distinct % len(GOALS)]} #{index % args.distinct}"}
+        headers = {"Accept": "text/event-stream" if args.stream else "application/json"}
+        response = session().post(f"{base_url}/generate_plan", json=payload, headers=headers,
+                                  stream=args.stream, timeout=args.timeout)
+        if args.stream and response.status_code == 200:
+            first_day, ok = read_stream(response, started)
+            return time.perf_counter() - started, first_day, "ok" if ok else "error event"
+    else:
+        response = session().get(f"{base_url}/analyze_time_allocation", timeout=args.timeout)
+    return time.perf_counter() - started, None, "ok" if response.status_code < 400 else str(response.status_code)
+
+
+def ai_calls(base_url):
+    """AI calls made so far by the provider of the worker that answers (None if unknown)"""
+    try:
+        return requests.get(f"{base_url}/ai_status", timeout=10).json()["provider"].get("calls")
+    except (requests.RequestException, ValueError, KeyError):
+        return None
+
+
+def run_endpoint(base_url, endpoint, args):
+    calls_before = ai_calls(base_url)
+
+    def task(index):
+        try:
+            return issue(base_url, endpoint, index, args)
+        except requests.RequestException as e:
+            return None, None, type(e).__name__
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(task, range(args.requests)))
+    wall = time.perf_counter() - started
+    calls_after = ai_calls(base_url)
+
+    latencies = sorted(latency for latency, _, status in results if status == "ok")
+    first_chunks = sorted(first for _, first, status in results if status == "ok" and first is not None)
+    failures = {}
+    for _, _, status in results:
+        if status != "ok":
+            failures[status] = failures.get(status, 0) + 1
+    return {
+        "ok": len(latencies),
+        "failures": failures,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttft_p50": percentile(first_chunks, 50) if first_chunks else None,
+        "ai_calls": calls_after - calls_before if None not in (calls_before, calls_after) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the AI endpoints")
+    parser.add_argument("--url", help="base URL of a running server (default: start one with the fake AI)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated endpoints to drive")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--distinct", type=int, default=20,
+                        help="distinct questions/goals (1: every request identical)")
+    parser.add_argument("--stream", action="store_true",
+                        help="ask /ask_ai and /generate_plan for Server-Sent Events (reports time to first chunk/day)")
+    parser.add_argument("--latency", default="lognormal:0.8,0.4",
+                        help="fake AI latency: fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake AI calls that fail")
+    parser.add_argument("--notes", type=int, default=5000, help="notes in the synthetic calendar")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds before a request is abandoned")
+    args = parser.parse_args()
+    args.distinct = max(1, args.distinct)
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    base_url = args.url.rstrip("/") if args.url else start_server(args)
+    print(f"🚀 {args.requests} requests per endpoint, {args.concurrency} concurrent, "
+          f"{args.distinct} distinct, against {base_url}")
+
+    print()
+    print(f"{'endpoint':<26} {'ok':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'ttft p50':>9} {'AI calls':>9}  failures")
+    print("-" * 110)
+    for endpoint in endpoints:
+        result = run_endpoint(base_url, endpoint, args)
+        ttft = f"{result['ttft_p50'] * 1000:>9.0f}" if result["ttft_p50"] is not None else f"{'-':>9}"
+        calls = f"{result['ai_calls']:>9}" if result["ai_calls"] is not None else f"{'-':>9}"
+        failures = ", ".join(f"{status}: {count}" for status, count in sorted(result["failures"].items())) or "-"
+        print(f"{endpoint:<26} {result['ok']:>5} {result['throughput']:>8.1f} {result['p50'] * 1000:>9.0f} "
+              f"{result['p95'] * 1000:>9.0f} {result['p99'] * 1000:>9.0f} {ttft} {calls}  {failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar Plan Parser Benchmark
+Runs the plan answers in fixtures/plan_responses.json (formats Gemini has
+drifted into: bold or bulleted days, dates instead of weekdays, mixed
+separators, fenced or malformed JSON, ...) through the parser generate_plan
+used before plan_parser.py (five uncompiled patterns tried per line, split
+on the first separator found), the precompiled free-text parser, and the
+full pipeline (strict JSON, then free text). Reports answers/sec and how
+many days of each answer end up mapped to a date, against the number the
+corpus expects.
+
+Usage: python bench_plan_parser.py [--repeat 500] [--verbose]
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import plan_parser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "plan_responses.json")
+
+
+def old_parse_ai_plan(ai_response):
+    """parse_ai_plan() before plan_parser.py (minus the logging)"""
+    lines = ai_response.strip().split('\n')
+    daily_plans = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        date_patterns = [
+            r'^(週[一二三四五六日]|Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday|Day \d+)[:：]\s*(.+)',
+            r'^(\d{1,2}月\d{1,2}日)[:：]\s*(.+)',
+            r'^(\d{4}-\d{2}-\d{2})[:：]\s*(.+)',
+            r'^(Mon|Tue|Wed|Thu|Fri|Sat|Sun)[:：]\s*(.+)',
+            r'^(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)[:：]\s*(.+)'
+        ]
+        for pattern in date_patterns:
+            match = re.match(pattern, line, re.IGNORECASE)
+            if match:
+                date_key = match.group(1)
+                activities_text = match.group(2)
+                if '、' in activities_text:
+                    activities = activities_text.split('、')
+                elif ',' in activities_text:
+                    activities = activities_text.split(',')
+                elif ';' in activities_text:
+                    activities = activities_text.split(';')
+                else:
+                    activities = [activities_text]
+                cleaned_activities = []
+                for act in activities:
+                    act = act.strip()
+                    if act and act not in ['', ' ', '•', '-']:
+                        act = re.sub(r'^[•\-*]\s*', '', act)
+                        cleaned_activities.append(act)
+                if cleaned_activities:
+                    daily_plans[date_key] = cleaned_activities
+                break
+    return daily_plans
+
+
+def old_map_weekday_to_date(weekday, week_dates):
+    """map_weekday_to_date() before plan_parser.py (minus the logging)"""
+    weekday_mapping = {
+        'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+        'friday': 4, 'saturday': 5, 'sunday': 6,
+        '週一': 0, '週二': 1, '週三': 2, '週四': 3,
+        '週五': 4, '週六': 5, '週日': 6,
+        'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3,
+        'fri': 4, 'sat': 5, 'sun': 6
+    }
+    weekday_lower = weekday.lower()
+    if weekday_lower in weekday_mapping:
+        day_index = weekday_mapping[weekday_lower]
+        if day_index < len(week_dates):
+            return week_dates[day_index]
+    day_match = re.match(r'day\s*(\d+)', weekday_lower)
+    if day_match:
+        day_num = int(day_match.group(1)) - 1
+        if 0 <= day_num < len(week_dates):
+            return week_dates[day_num]
+    return None
+
+
+def mapped(daily_plans, map_day, week_dates):
+    """{date: activities} of the parsed days that map to a date"""
+    plans = {}
+    for day, activities in daily_plans.items():
+        actual_date = map_day(day, week_dates)
+        if actual_date:
+            plans[actual_date] = activities
+    return plans
+
+
+def old_pipeline(response, week_dates):
+    return mapped(old_parse_ai_plan(response), old_map_weekday_to_date, week_dates)
+
+
+def line_pipeline(response, week_dates):
+    return mapped(plan_parser.parse_line_plan(response), plan_parser.day_to_date, week_dates)
+
+
+def full_pipeline(response, week_dates):
+    try:
+        return plan_parser.parse_json_plan(response, week_dates)
+    except plan_parser.PlanFormatError:
+        return line_pipeline(response, week_dates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generate_plan answer parsers")
+    parser.add_argument("--repeat", type=int, default=500, help="passes over the fixture corpus")
+    parser.add_argument("--verbose", action="store_true", help="days recovered for every fixture")
+    args = parser.parse_args()
+
+    with open(FIXTURES, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    week_dates = corpus["week_dates"]
+    fixtures = corpus["responses"]
+    expected = sum(fixture["days"] for fixture in fixtures)
+
+    pipelines = [("before (5 patterns/line)", old_pipeline), ("free text, precompiled", line_pipeline),
+                 ("JSON, then free text", full_pipeline)]
+    print(f"📄 {len(fixtures)} plan answers, {expected} days expected, {args.repeat} passes")
+    print()
+    print(f"{'parser':<28} {'answers/s':>12} {'days found':>12} {'exact':>8}")
+    print("-" * 64)
+    for name, pipeline in pipelines:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for fixture in fixtures:
+                pipeline(fixture["response"], week_dates)
+        rate = args.repeat * len(fixtures) / (time.perf_counter() - started)
+        found = [len(pipeline(fixture["response"], week_dates)) for fixture in fixtures]
+        exact = sum(days == fixture["days"] for days, fixture in zip(found, fixtures))
+        print(f"{name:<28} {rate:>12.0f} {sum(found):>12} {exact:>4}/{len(fixtures):<3}")
+        if args.verbose:
+            for days, fixture in zip(found, fixtures):
+                print(f"    {fixture['name']:<36} {days}/{fixture['days']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar Store Benchmark
+Measures requests/sec of the read and write routes on a large notes.json,
+with the in-memory store (after) and with a forced reload on every request,
+which is what the old load_notes()/load_labels() did (before).
+
+Usage: python bench_store.py [--notes 100000] [--requests 200]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_calendar(directory, total_notes, notes_per_day=10):
+    """Write a synthetic notes.json/labels.json with total_notes activities"""
+    activities = ["閱讀《百年孤獨》第一章", "30分鐘慢跑", "Team meeting", "Study for exam",
+                  "瑜伽練習30分鐘", "Lunch with friends", "Review project documents", "Nap"]
+    start = date.today() - timedelta(days=total_notes // notes_per_day)
+    notes = {}
+    labels = {}
+    for i in range(total_notes // notes_per_day):
+        day = (start + timedelta(days=i)).strftime("%Y-%m-%d")
+        notes[day] = [random.choice(activities) for _ in range(notes_per_day)]
+        if i % 30 == 0:
+            labels[day] = {"label": "Final Exam", "color": "#dc3545",
+                           "created_at": "2025-08-10T09:12:40.252826"}
+    with open(os.path.join(directory, "notes.json"), "w", encoding="utf-8") as f:
+        json.dump(notes, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(directory, "labels.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+
+
+def run_route(client, stores, method, url, payload, count, cold):
+    """Issue count requests and return requests/sec"""
+    started = time.perf_counter()
+    for _ in range(count):
+        if cold:
+            for store in stores:
+                store.invalidate()
+        if method == "GET":
+            response = client.get(url)
+        else:
+            response = client.post(url, json=payload)
+        assert response.status_code < 500, f"{url} failed: {response.status_code}"
+    elapsed = time.perf_counter() - started
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the notes/labels store")
+    parser.add_argument("--notes", type=int, default=100000, help="number of notes to generate")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and mode")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="calendar-bench-")
+    print(f"📁 Generating {args.notes} notes in {workdir}")
+    generate_calendar(workdir, args.notes)
+
+    # The app resolves notes.json relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+    import app as calendar_app
+
+    client = calendar_app.app.test_client()
+    stores = [calendar_app.note_store, calendar_app.label_store]
+    today = date.today()
+
+    routes = [
+        ("GET", f"/get_notes_for_month?year={today.year}&month={today.month}", None),
+        ("GET", f"/get_labels_for_month?year={today.year}&month={today.month}", None),
+        ("GET", "/get_calendar_stats", None),
+        ("GET", "/get_labeled_deadlines", None),
+        ("POST", "/save_note", {"date": today.strftime("%Y-%m-%d"), "content": "Benchmark note"}),
+        # Multi-year range that holds no notes: only the populated dates are visited
+        ("POST", "/delete_date_range", {"start_date": f"{today.year + 1}-01-01", "end_date": f"{today.year + 20}-12-31"}),
+    ]
+
+    print()
+    print(f"{'route':<50} {'before req/s':>14} {'after req/s':>14} {'speedup':>9}")
+    print("-" * 90)
+    for method, url, payload in routes:
+        # Writes are expensive regardless, so use fewer of them
+        count = args.requests if method == "GET" else max(1, args.requests // 10)
+        before = run_route(client, stores, method, url, payload, count, cold=True)
+        after = run_route(client, stores, method, url, payload, count, cold=False)
+        name = f"{method} {url.split('?')[0]}"
+        print(f"{name:<50} {before:>14.1f} {after:>14.1f} {after / before:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
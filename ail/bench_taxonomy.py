@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar Taxonomy Benchmark
+Compares the compiled keyword scanner in taxonomy.py with the per-call
+`any(keyword in text for keyword in list)` loops it replaced (before), on
+fallback categorization, trend categorization and label importance, and
+checks that both give the same answers. Activities are random mixes of
+a small vocabulary, so they repeat the way real notes do (scan() memoizes
+recent texts); use --unique to make every activity distinct.
+
+Usage: python bench_taxonomy.py [--activities 20000] [--unique]
+"""
+
+import argparse
+import random
+import time
+
+import taxonomy
+
+WORDS = ["閱讀《百年孤獨》第一章", "30分鐘慢跑", "Team meeting", "Study for exam", "瑜伽練習30分鐘",
+         "Lunch with friends", "Review project documents", "Nap", "light jog", "intense workout",
+         "daily standup call", "weekend hike", "quick email", "Final exam", "Birthday party",
+         "read chapter 3", "routine gym session", "free time", "coffee chat", "買菜"]
+
+LABELS = ["Final Exam", "Project deadline", "Mom's birthday", "Dentist appointment", "Vacation",
+          "Thesis submission", "Team offsite", "License renewal", "Concert"]
+
+
+def old_fallback(activity):
+    """fallback_categorization()/determine_intensity() before taxonomy.py (minus the randomness)"""
+    activity_lower = activity.lower()
+    study_keywords = list(taxonomy.CATEGORY_KEYWORDS["study"])
+    exercise_keywords = list(taxonomy.CATEGORY_KEYWORDS["exercise"])
+    rest_keywords = list(taxonomy.CATEGORY_KEYWORDS["rest"])
+    if any(keyword in activity_lower for keyword in study_keywords):
+        category = "study"
+    elif any(keyword in activity_lower for keyword in exercise_keywords):
+        category = "exercise"
+    elif any(keyword in activity_lower for keyword in rest_keywords):
+        category = "rest"
+    else:
+        return ("rest", (3, 3))
+    high_intensity_words = list(taxonomy.INTENSITY_KEYWORDS["high"])
+    medium_intensity_words = list(taxonomy.INTENSITY_KEYWORDS["medium"])
+    low_intensity_words = list(taxonomy.INTENSITY_KEYWORDS["low"])
+    if any(word in activity_lower for word in high_intensity_words):
+        return (category, (7, 10))
+    elif any(word in activity_lower for word in medium_intensity_words):
+        return (category, (4, 6))
+    elif any(word in activity_lower for word in low_intensity_words):
+        return (category, (1, 3))
+    return (category, (4, 6))
+
+
+def old_trend_category(activity):
+    """get_activity_trends() inner loop before taxonomy.py"""
+    activity_categories = {category: list(keywords) for category, keywords in taxonomy.CATEGORY_KEYWORDS.items()}
+    activity_lower = activity.lower()
+    for category, keywords in activity_categories.items():
+        for keyword in keywords:
+            if keyword in activity_lower:
+                return category
+    return None
+
+
+def old_is_important(label):
+    """get_labeled_deadlines() check before taxonomy.py"""
+    important_label_keywords = list(taxonomy.IMPORTANT_LABEL_KEYWORDS)
+    label_text = label.lower()
+    return any(keyword in label_text for keyword in important_label_keywords)
+
+
+def new_fallback(activity):
+    result = taxonomy.categorize(activity, ["study", "exercise", "rest"])
+    return result or {"category": "rest", "intensity": 3}
+
+
+def new_trend_category(activity):
+    return taxonomy.first_category(taxonomy.scan(activity), list(taxonomy.CATEGORY_KEYWORDS))
+
+
+def timed(function, items):
+    """Run function over items and return (results, items/sec)"""
+    started = time.perf_counter()
+    results = [function(item) for item in items]
+    return results, len(items) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the keyword taxonomy scanner")
+    parser.add_argument("--activities", type=int, default=20000, help="number of activities to classify")
+    parser.add_argument("--unique", action="store_true", help="number every activity so none repeats")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    activities = [" ".join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(args.activities)]
+    if args.unique:
+        activities = [f"{activity} #{index}" for index, activity in enumerate(activities)]
+    labels = [rng.choice(LABELS) for _ in range(args.activities)]
+
+    print(f"{'task':<28} {'before items/s':>16} {'after items/s':>16} {'speedup':>9} {'agree':>8}")
+    print("-" * 81)
+
+    before, before_rate = timed(old_fallback, activities)
+    after, after_rate = timed(new_fallback, activities)
+    agree = sum(
+        old[0] == new["category"] and old[1][0] <= new["intensity"] <= old[1][1]
+        for old, new in zip(before, after)
+    )
+    print(f"{'fallback_categorization':<28} {before_rate:>16.0f} {after_rate:>16.0f} "
+          f"{after_rate / before_rate:>8.1f}x {agree / len(activities):>7.1%}")
+
+    for name, old, new, items in [
+        ("activity trends", old_trend_category, new_trend_category, activities),
+        ("important labels", old_is_important, taxonomy.is_important_label, labels),
+    ]:
+        before, before_rate = timed(old, items)
+        after, after_rate = timed(new, items)
+        agree = sum(a == b for a, b in zip(before, after))
+        print(f"{name:<28} {before_rate:>16.0f} {after_rate:>16.0f} "
+              f"{after_rate / before_rate:>8.1f}x {agree / len(items):>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
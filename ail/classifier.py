@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar Local Classifier
+Offline activity categorizer trained from the Gemini answers in the
+categorization cache.
+
+Activities are short and mostly repeat with small variations ("30分鐘慢跑",
+"45分鐘快走"), and much of the text is Chinese without spaces, so the
+features are character 1-3 grams of the normalized text (word boundaries
+are not needed), weighted by log term frequency times IDF and L2
+normalized. Two multinomial naive Bayes models are fitted on them: one for
+the category, one for the 1-10 intensity. The category confidence is the
+posterior probability of the predicted category, scaled by the share of
+the text's n-grams seen in training so unfamiliar text is never confident;
+the intensity is the posterior mean, rounded.
+
+Everything is plain NumPy, so training takes well under a second for tens
+of thousands of cached answers and needs no GPU or network. The model is
+saved as an .npz file tagged with the cache version it was trained on;
+a model trained on answers to a different prompt is not used.
+
+Usage: python classifier.py train [--holdout 0.2] [--threshold 0.9]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+import logging
+
+import numpy as np
+
+from ai_cache import normalize_activity
+from storage import file_stamp, replace_file, temp_path_for
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (1, 2, 3)
+
+# Most frequent n-grams kept in the vocabulary
+MAX_FEATURES = 50000
+
+# Naive Bayes additive smoothing
+ALPHA = 0.1
+
+INTENSITIES = list(range(1, 11))
+
+
+def char_ngrams(text):
+    """Character n-grams of the normalized text, padded to mark the edges"""
+    padded = f" {normalize_activity(text)} "
+    grams = []
+    for size in NGRAM_SIZES:
+        for start in range(len(padded) - size + 1):
+            gram = padded[start:start + size]
+            if gram.strip():
+                grams.append(gram)
+    return grams
+
+
+def _term_counts(text, vocabulary):
+    """({feature index: count}, share of the text's n-grams in the vocabulary)"""
+    grams = char_ngrams(text)
+    counts = {}
+    for gram in grams:
+        index = vocabulary.get(gram)
+        if index is not None:
+            counts[index] = counts.get(index, 0) + 1
+    return counts, sum(counts.values()) / len(grams) if grams else 0.0
+
+
+def _fit_naive_bayes(rows, labels, n_classes, n_features):
+    """Log priors and per-class feature log probabilities"""
+    class_counts = np.bincount(labels, minlength=n_classes).astype(float)
+    feature_totals = np.zeros((n_classes, n_features))
+    for (indices, weights), label in zip(rows, labels):
+        feature_totals[label, indices] += weights
+    log_prior = np.log((class_counts + ALPHA) / (class_counts.sum() + ALPHA * n_classes))
+    smoothed = feature_totals + ALPHA
+    log_prob = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+    return log_prior, log_prob
+
+
+def _posterior(log_prior, log_prob, indices, weights):
+    scores = log_prior + log_prob[:, indices] @ weights
+    scores = np.exp(scores - scores.max())
+    return scores / scores.sum()
+
+
+class ActivityClassifier:
+    """Character n-gram TF-IDF + naive Bayes category and intensity model"""
+
+    def __init__(self, vocabulary, idf, categories, category_log_prior, category_log_prob,
+                 intensity_log_prior, intensity_log_prob, info=None):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.categories = categories
+        self.category_log_prior = category_log_prior
+        self.category_log_prob = category_log_prob
+        self.intensity_log_prior = intensity_log_prior
+        self.intensity_log_prob = intensity_log_prob
+        self.info = info or {}
+
+    @classmethod
+    def train(cls, examples, info=None):
+        """Fit on (activity, category, intensity) examples"""
+        if not examples:
+            raise ValueError("No training examples")
+        document_frequency = {}
+        for text, _, _ in examples:
+            for gram in set(char_ngrams(text)):
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+        kept = sorted(document_frequency, key=lambda gram: (-document_frequency[gram], gram))[:MAX_FEATURES]
+        vocabulary = {gram: index for index, gram in enumerate(kept)}
+        df = np.array([document_frequency[gram] for gram in kept], dtype=float)
+        idf = np.log((1 + len(examples)) / (1 + df)) + 1
+
+        categories = sorted({category for _, category, _ in examples})
+        category_index = {category: index for index, category in enumerate(categories)}
+
+        model = cls(vocabulary, idf, categories, None, None, None, None, info)
+        rows = [model._features(text)[:2] for text, _, _ in examples]
+        category_labels = np.array([category_index[category] for _, category, _ in examples])
+        intensity_labels = np.array([min(10, max(1, int(intensity))) - 1 for _, _, intensity in examples])
+        model.category_log_prior, model.category_log_prob = _fit_naive_bayes(
+            rows, category_labels, len(categories), len(vocabulary))
+        model.intensity_log_prior, model.intensity_log_prob = _fit_naive_bayes(
+            rows, intensity_labels, len(INTENSITIES), len(vocabulary))
+        model.info.update(examples=len(examples), features=len(vocabulary), trained_at=int(time.time()))
+        return model
+
+    def _features(self, text):
+        """(feature indices, L2-normalized log-tf * idf weights, known share) for a text"""
+        counts, known = _term_counts(text, self.vocabulary)
+        if not counts:
+            return np.zeros(0, dtype=int), np.zeros(0), 0.0
+        indices = np.fromiter(counts, dtype=int, count=len(counts))
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=float, count=len(counts)))) * self.idf[indices]
+        return indices, weights / np.linalg.norm(weights), known
+
+    def predict(self, text):
+        """{"category", "intensity", "confidence"} for an activity"""
+        indices, weights, known = self._features(text)
+        if not len(indices):
+            # Nothing known about this text: never confident
+            return {"category": self.categories[int(np.argmax(self.category_log_prior))],
+                    "intensity": 5, "confidence": 0.0}
+        category_posterior = _posterior(self.category_log_prior, self.category_log_prob, indices, weights)
+        intensity_posterior = _posterior(self.intensity_log_prior, self.intensity_log_prob, indices, weights)
+        best = int(np.argmax(category_posterior))
+        return {
+            "category": self.categories[best],
+            "intensity": int(round(float(intensity_posterior @ np.array(INTENSITIES)))),
+            "confidence": round(float(category_posterior[best]) * known, 4),
+        }
+
+    def save(self, path):
+        """Write the model atomically to an .npz file"""
+        temp_path = temp_path_for(path)
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                vocabulary=np.array(list(self.vocabulary)),
+                idf=self.idf,
+                categories=np.array(self.categories),
+                category_log_prior=self.category_log_prior,
+                category_log_prob=self.category_log_prob,
+                intensity_log_prior=self.intensity_log_prior,
+                intensity_log_prob=self.intensity_log_prob,
+                info=np.array(json.dumps(self.info, ensure_ascii=False)),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                {gram: index for index, gram in enumerate(data["vocabulary"].tolist())},
+                data["idf"],
+                data["categories"].tolist(),
+                data["category_log_prior"],
+                data["category_log_prob"],
+                data["intensity_log_prior"],
+                data["intensity_log_prob"],
+                json.loads(str(data["info"])),
+            )
+
+
+class ModelFile:
+    """The saved classifier, reloaded whenever the file is retrained"""
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.predictions = 0
+        self.confident = 0
+        self._model = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current model, or None if there is none for this cache version"""
+        stamp = file_stamp(self.path)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._model = self._load(stamp)
+                    self._stamp = stamp
+        return self._model
+
+    def _load(self, stamp):
+        if stamp is None:
+            return None
+        try:
+            model = ActivityClassifier.load(self.path)
+        except Exception as e:
+            logger.warning(f"Could not load activity classifier {self.path}: {e}")
+            return None
+        if model.info.get("version") != self.version:
+            logger.warning(f"Activity classifier {self.path} was trained for another prompt version; "
+                           f"retrain it with `python classifier.py train`")
+            return None
+        logger.info(f"Loaded activity classifier ({model.info.get('examples')} examples)")
+        return model
+
+    def record(self, predictions, confident):
+        with self._lock:
+            self.predictions += predictions
+            self.confident += confident
+
+    def stats(self):
+        model = self.get()
+        return {
+            "loaded": model is not None,
+            "examples": model.info.get("examples") if model else 0,
+            "holdout_accuracy": model.info.get("holdout_accuracy") if model else None,
+            "predictions": self.predictions,
+            "confident": self.confident,
+        }
+
+
+def split_holdout(examples, fraction):
+    """Deterministic (train, held-out) split by a checksum of the activity"""
+    cutoff = int(fraction * 100)
+    train, held_out = [], []
+    for example in examples:
+        bucket = zlib.crc32(example[0].encode("utf-8")) % 100
+        (held_out if bucket < cutoff else train).append(example)
+    return train, held_out
+
+
+def evaluate(model, examples, thresholds):
+    """Accuracy report of model against (activity, category, intensity) labels"""
+    predictions = [model.predict(text) for text, _, _ in examples]
+    correct = [prediction["category"] == category for prediction, (_, category, _) in zip(predictions, examples)]
+    per_category = {}
+    for category in sorted({category for _, category, _ in examples} | set(model.categories)):
+        predicted = [p["category"] == category for p in predictions]
+        actual = [c == category for _, c, _ in examples]
+        true_positive = sum(p and a for p, a in zip(predicted, actual))
+        per_category[category] = {
+            "precision": true_positive / sum(predicted) if sum(predicted) else None,
+            "recall": true_positive / sum(actual) if sum(actual) else None,
+            "support": sum(actual),
+        }
+    errors = [abs(p["intensity"] - int(intensity)) for p, (_, _, intensity) in zip(predictions, examples)]
+    at_threshold = {}
+    for threshold in thresholds:
+        selected = [ok for p, ok in zip(predictions, correct) if p["confidence"] >= threshold]
+        at_threshold[threshold] = {
+            "coverage": len(selected) / len(examples),
+            "accuracy": sum(selected) / len(selected) if selected else None,
+        }
+    return {
+        "examples": len(examples),
+        "accuracy": sum(correct) / len(examples),
+        "per_category": per_category,
+        "intensity_mae": sum(errors) / len(errors),
+        "at_threshold": at_threshold,
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return "   -" if value is None else f"{value:.2f}"
+
+    print(f"📊 Held-out AI labels: {report['examples']}")
+    print(f"Category accuracy: {report['accuracy']:.1%}")
+    print(f"{'category':<12} {'precision':>10} {'recall':>8} {'support':>8}")
+    for category, row in report["per_category"].items():
+        print(f"{category:<12} {fmt(row['precision']):>10} {fmt(row['recall']):>8} {row['support']:>8}")
+    print(f"Intensity mean absolute error: {report['intensity_mae']:.2f}")
+    print(f"{'confidence >=':<14} {'coverage':>9} {'accuracy':>9}")
+    for threshold, row in report["at_threshold"].items():
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.1%}"
+        print(f"{threshold:<14} {row['coverage']:>9.1%} {accuracy:>9}")
+
+
+def train_from_cache(cache, path, holdout=0.2, thresholds=(0.5, 0.7, 0.8, 0.9, 0.95)):
+    """Evaluate on a held-out split, then fit on every cached answer and save"""
+    examples = [(activity, category, intensity) for activity, category, intensity in cache.entries()]
+    if not examples:
+        print("❌ The AI cache has no categorizations for the current prompt yet")
+        return None
+    info = {"version": cache.version}
+    train, held_out = split_holdout(examples, holdout)
+    if train and held_out:
+        report = evaluate(ActivityClassifier.train(train), held_out, thresholds)
+        print_report(report)
+        info["holdout_accuracy"] = round(report["accuracy"], 4)
+    else:
+        print("⚠️ Too few cached answers for a held-out evaluation")
+    model = ActivityClassifier.train(examples, info)
+    model.save(path)
+    print(f"✅ Trained on {len(examples)} AI labels ({len(model.vocabulary)} features) -> {path}")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local activity classifier")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="retrain from the AI categorization cache")
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="fraction of AI labels held out")
+    train_parser.add_argument("--threshold", type=float, action="append",
+                              help="confidence threshold to report on (repeatable)")
+    args = parser.parse_args()
+
+    # The app owns the cache location and prompt version
+    from app import CLASSIFIER_FILE, CLASSIFIER_THRESHOLD, categorization_cache
+
+    thresholds = sorted(set(args.threshold or [0.5, 0.7, 0.8, 0.9, 0.95]) | {CLASSIFIER_THRESHOLD})
+    train_from_cache(categorization_cache, CLASSIFIER_FILE, args.holdout, thresholds)
+
+
+if __name__ == "__main__":
+    main()
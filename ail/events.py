@@ -0,0 +1,145 @@
+"""
+AI Smart Calendar Events
+Fan-out of calendar changes to Server-Sent Events subscribers.
+
+One watcher thread per process turns new change-log versions into event
+payloads (so work is done once per change, not once per subscriber) and
+keeps the most recent ones in a small ring buffer. Subscribers only wait on
+a shared condition and read from that buffer, so an idle subscriber costs
+a suspended generator; served by a cooperative (gevent) worker that is a
+greenlet rather than an OS thread. Threaded servers spend one of their
+threads on every open stream, so there the number of subscribers is kept
+well below the thread count (default_max_subscribers) and the tabs that do
+not get a stream poll /changes instead.
+
+The watcher also polls the change log, so changes committed by other
+worker processes are pushed too, just with up to POLL_INTERVAL of delay.
+"""
+
+import json
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Seconds between change-log polls (for changes made by other processes)
+POLL_INTERVAL = 1.0
+
+# Seconds between keepalive comments on idle streams
+KEEPALIVE_INTERVAL = 25.0
+
+# Number of recent events kept for subscribers that fall behind
+EVENT_BUFFER_SIZE = 256
+
+# Subscribers per process when streams are greenlets (gevent)
+COOPERATIVE_MAX_SUBSCRIBERS = 500
+
+
+def cooperative():
+    """True if gevent has patched threading, i.e. each stream is a greenlet"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def default_max_subscribers(threads):
+    """Subscriber cap for a process serving requests with this many threads.
+
+    A threaded server keeps three quarters of its threads for requests.
+    """
+    if cooperative():
+        return COOPERATIVE_MAX_SUBSCRIBERS
+    return max(1, threads // 4)
+
+
+class EventBroker:
+    """Publishes change-log deltas to any number of stream subscribers"""
+
+    def __init__(self, change_log, build_payload, max_subscribers=COOPERATIVE_MAX_SUBSCRIBERS):
+        self._change_log = change_log
+        self._build_payload = build_payload
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self.version = None
+        self._events = deque(maxlen=EVENT_BUFFER_SIZE)  # (from_version, version, message)
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._watcher = None
+
+    def _ensure_watcher(self):
+        with self._condition:
+            if self._watcher is None or not self._watcher.is_alive():
+                self.version = self._change_log.since(0)[0]
+                self._watcher = threading.Thread(target=self._watch, name="event-watcher", daemon=True)
+                self._watcher.start()
+
+    def _watch(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self._collect()
+            except Exception as e:
+                logger.error(f"Failed to collect calendar events: {e}")
+
+    def _collect(self):
+        """Turn changes since the last seen version into one event"""
+        version, changed = self._change_log.since(self.version)
+        if version == self.version:
+            return
+        payload = self._build_payload(changed)
+        payload["from_version"] = self.version
+        payload["version"] = version
+        message = f"id: {version}\nevent: changes\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        with self._condition:
+            self._events.append((self.version, version, message))
+            self.version = version
+            self._condition.notify_all()
+
+    def notify(self):
+        """Wake the watcher right away after a local mutation"""
+        if self.subscribers:
+            self._wake.set()
+
+    def try_subscribe(self):
+        """Reserve a subscriber slot; False when the server is at capacity"""
+        with self._condition:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+        self._ensure_watcher()
+        return True
+
+    def stream(self, last_version=None):
+        """Generate SSE messages for one subscriber (after try_subscribe)"""
+        try:
+            cursor = self.version if last_version is None else last_version
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'version': self.version})}\n\n"
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.version != cursor, KEEPALIVE_INTERVAL)
+                    messages = self._messages_after(cursor)
+                    latest = self.version
+                if messages is None:
+                    # Fell out of the buffer: tell the client to resync via /changes
+                    yield f"id: {latest}\nevent: resync\ndata: {json.dumps({'version': latest})}\n\n"
+                elif messages:
+                    yield "".join(messages)
+                else:
+                    yield ": keepalive\n\n"
+                cursor = latest
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+    def _messages_after(self, cursor):
+        """Buffered messages following cursor, or None if cursor is not in the buffer"""
+        if cursor == self.version:
+            return []
+        for index, (from_version, _, _) in enumerate(self._events):
+            if from_version == cursor:
+                return [message for _, _, message in list(self._events)[index:]]
+        return None
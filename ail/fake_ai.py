@@ -0,0 +1,272 @@
+"""
+AI Smart Calendar Fake AI Providers
+Local stand-ins for Gemini, so the AI endpoints can be developed and
+benchmarked without an API key or network (see ai_client.set_provider).
+
+AI_PROVIDER selects one in app.py:
+- fake: FakeProvider answers after a latency drawn from AI_FAKE_LATENCY,
+  fails AI_FAKE_ERROR_RATE of the calls, and returns the recorded response
+  of a prompt from the fixtures file if there is one, otherwise a canned
+  response shaped like what the app asks for (a JSON categorization
+  array, a JSON plan, one plan day per line or a short answer);
+- record: RecordingProvider calls Gemini and appends every prompt, response
+  and latency to the fixtures file (AI_FIXTURES_FILE);
+- replay: FakeProvider serving the fixtures with their recorded latency.
+
+Prompts carry today's date and the current notes, so fixtures recorded on
+another day or calendar mostly miss and get canned responses instead.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import logging
+
+from ai_cache import prompt_version
+import ai_client
+import taxonomy
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("gemini", "fake", "record", "replay")
+
+DEFAULT_LATENCY = "lognormal:0.8,0.4"
+
+# Canned answers are streamed this many characters per chunk
+CHUNK_SIZE = 24
+
+_CATEGORIES = ["study", "exercise", "rest"]
+_WEEKDAYS = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+_GOAL = re.compile(r'goal: "(.*?)"', re.DOTALL)
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_PLANNED_DAYS = re.compile(r"covers these \d+ days: (.*)")
+_QUESTION = re.compile(r"User's question: (.*)")
+
+
+class FakeAIError(Exception):
+    """An error injected by FakeProvider"""
+
+
+def parse_latency(spec):
+    """Sampler rng -> seconds for a latency spec.
+
+    "0.5" or "fixed:0.5", "uniform:0.2,1.5", "normal:0.8,0.2" (mean and
+    standard deviation) or "lognormal:0.8,0.4" (median and sigma).
+    """
+    kind, _, values = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    try:
+        numbers = [float(value) for value in values.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(numbers) == 1:
+        return lambda rng: numbers[0]
+    if kind == "uniform" and len(numbers) == 2:
+        return lambda rng: rng.uniform(numbers[0], numbers[1])
+    if kind == "normal" and len(numbers) == 2:
+        return lambda rng: max(0.0, rng.gauss(numbers[0], numbers[1]))
+    if kind == "lognormal" and len(numbers) == 2 and numbers[0] > 0:
+        return lambda rng: rng.lognormvariate(math.log(numbers[0]), numbers[1])
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def fixture_key(prompt):
+    """Fixture key of a prompt (whitespace-insensitive)"""
+    return prompt_version(" ".join(prompt.split()))
+
+
+def load_fixtures(path):
+    """{key: entry} of a fixtures file (JSON lines); the last entry of a prompt wins"""
+    fixtures = {}
+    if not path or not os.path.exists(path):
+        return fixtures
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                fixtures[entry["key"]] = entry
+            except (ValueError, KeyError):
+                logger.warning(f"Skipping malformed fixture on line {number} of {path}")
+    return fixtures
+
+
+def _activities_in(prompt):
+    """The [{"id", "activity"}] array of a categorization prompt, or None"""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\[", prompt):
+        try:
+            value, _ = decoder.raw_decode(prompt, match.start())
+        except ValueError:
+            continue
+        if isinstance(value, list) and value and all(isinstance(item, dict) and "activity" in item
+                                                     for item in value):
+            return value
+    return None
+
+
+def canned_response(prompt):
+    """A response of the shape the app expects for this kind of prompt"""
+    items = _activities_in(prompt)
+    if items is not None:
+        answers = []
+        for item in items:
+            result = taxonomy.categorize(str(item["activity"]), _CATEGORIES) or {"category": "rest", "intensity": 3}
+            answers.append({"id": item.get("id"), **result})
+        return json.dumps(answers, ensure_ascii=False)
+
+    goal = _GOAL.search(prompt)
+    if goal:
+        goal = goal.group(1).strip()[:40]
+        planned = _PLANNED_DAYS.search(prompt)
+        days = list(dict.fromkeys(_DATE.findall(planned.group(1)))) if planned else []
+        if days and "per line" in prompt:
+            return "\n".join(json.dumps({"date": day, "activities": [f"{goal} - part {i + 1}", "Review progress",
+                                                                    "30 minutes of exercise"]}, ensure_ascii=False)
+                             for i, day in enumerate(days))
+        if days:
+            return json.dumps({day: [f"{goal} - part {i + 1}", "Review progress", "30 minutes of exercise"]
+                               for i, day in enumerate(days)}, ensure_ascii=False)
+        return "\n".join(f"{weekday}: {goal} - part {i + 1}、Review progress、30 minutes of exercise"
+                         for i, weekday in enumerate(_WEEKDAYS))
+
+    question = _QUESTION.search(prompt)
+    topic = question.group(1).strip()[:80] if question else "your schedule"
+    return (f"About \"{topic}\": your schedule looks manageable. Keep your most demanding work for the "
+            f"mornings, leave short breaks between activities, and set aside time to rest at the end of "
+            f"each day so the week stays sustainable.")
+
+
+class FakeProvider:
+    """Answers locally with injected latency and errors"""
+
+    name = "fake"
+
+    def __init__(self, latency=DEFAULT_LATENCY, error_rate=0.0, fixtures=None, replay_latency=False,
+                 chunk_delay=0.02, seed=None):
+        self.latency_spec = latency
+        self._sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.fixtures = fixtures or {}
+        self.replay_latency = replay_latency
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.errors = 0
+        self.fixture_hits = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _prepare(self, prompt):
+        """(latency, failure, response) of one call"""
+        entry = self.fixtures.get(fixture_key(prompt))
+        with self._lock:
+            self.calls += 1
+            if entry is not None and self.replay_latency and entry.get("latency") is not None:
+                latency = entry["latency"]
+            else:
+                latency = self._sample_latency(self._rng)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            elif entry is not None:
+                self.fixture_hits += 1
+        if failed:
+            return latency, FakeAIError("503 Service Unavailable (injected by the fake AI provider)"), None
+        return latency, None, entry["response"] if entry is not None else canned_response(prompt)
+
+    def generate_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        latency, failure, response = self._prepare(prompt)
+        time.sleep(latency)
+        if failure is not None:
+            raise failure
+        return response
+
+    def stream_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        latency, failure, response = self._prepare(prompt)
+        time.sleep(latency)  # time to first chunk
+        if failure is not None:
+            raise failure
+        for start in range(0, len(response), CHUNK_SIZE):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield response[start:start + CHUNK_SIZE]
+
+    def ping(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "latency": self.latency_spec,
+                "error_rate": self.error_rate,
+                "fixtures": len(self.fixtures),
+                "calls": self.calls,
+                "errors": self.errors,
+                "fixture_hits": self.fixture_hits,
+            }
+
+
+class RecordingProvider:
+    """Passes calls to another provider and appends its responses to a fixtures file"""
+
+    name = "record"
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def _record(self, prompt, response, latency, model_name, temperature):
+        line = json.dumps({"key": fixture_key(prompt), "prompt": prompt, "response": response,
+                           "latency": round(latency, 3), "model": model_name, "temperature": temperature},
+                          ensure_ascii=False)
+        with self._lock:
+            # One write per line: appends of several workers do not interleave
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    def generate_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        started = time.monotonic()
+        response = self.inner.generate_text(prompt, model_name, temperature, max_output_tokens)
+        self._record(prompt, response, time.monotonic() - started, model_name, temperature)
+        return response
+
+    def stream_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+        started = time.monotonic()
+        chunks = []
+        for chunk in self.inner.stream_text(prompt, model_name, temperature, max_output_tokens):
+            chunks.append(chunk)
+            yield chunk
+        # Only complete answers are recorded (not ones the client hung up on)
+        self._record(prompt, "".join(chunks), time.monotonic() - started, model_name, temperature)
+
+    def ping(self):
+        self.inner.ping()
+
+    def stats(self):
+        with self._lock:
+            return {"name": self.name, "fixtures_file": self.path, "recorded": self.recorded}
+
+
+def create_provider(name, fixtures_file, latency=DEFAULT_LATENCY, error_rate=0.0, seed=None):
+    """Provider for an AI_PROVIDER value other than "gemini" """
+    if name == "fake":
+        return FakeProvider(latency, error_rate, load_fixtures(fixtures_file), seed=seed)
+    if name == "replay":
+        fixtures = load_fixtures(fixtures_file)
+        if not fixtures:
+            logger.warning(f"No fixtures in {fixtures_file}: every replayed call gets a canned response")
+        provider = FakeProvider(latency, error_rate, fixtures, replay_latency=True, seed=seed)
+        provider.name = "replay"
+        return provider
+    if name == "record":
+        return RecordingProvider(ai_client.GeminiProvider(), fixtures_file)
+    raise ValueError(f"Unknown AI provider {name!r}, expected one of {', '.join(PROVIDERS)}")
@@ -0,0 +1,316 @@
+"""
+AI Smart Calendar Background Jobs
+Long-running work (e.g. a first analysis of a large history) as jobs
+that are started, polled and cancelled over HTTP.
+
+Jobs and their per-item results live in a small SQLite file shared by all
+worker processes, so any worker can answer a poll. A job handler saves
+results as it goes (JobContext.save), which also records progress, and
+skips items already saved when it starts, so a job interrupted by a
+restart resumes where it stopped instead of starting over.
+
+A handler can also save a partial result with its items; it is kept in
+the job's result column until the final result replaces it, so polls of
+an unfinished job do not have to rebuild it from the items.
+
+The process running a job owns it and refreshes a heartbeat with every
+save. A job whose heartbeat is older than stale_after (its process died)
+is claimed and resumed by the next process that looks at it: at worker
+start (resume_stale) or when a client polls it.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept this long for clients to fetch their result
+JOB_RETENTION = 24 * 60 * 60
+
+QUEUED, RUNNING, CANCELLING = "queued", "running", "cancelling"
+DONE, FAILED, CANCELLED = "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING, CANCELLING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    heartbeat REAL NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_kind_key ON jobs (kind, key);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (job_id, item)
+);
+"""
+
+_COLUMNS = ("id", "kind", "key", "status", "params", "total", "completed", "result", "error",
+            "owner", "heartbeat", "created", "updated")
+
+
+def _encode(result):
+    return json.dumps(result, ensure_ascii=False) if result is not None else None
+
+
+class JobCancelled(Exception):
+    """Raised inside a job handler once the job was cancelled"""
+
+
+class JobStore:
+    """Jobs and their saved item results in SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connection(self):
+        """Connection for this process (opened lazily, reopened after fork)"""
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._connection().execute(sql, parameters)
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def create(self, kind, key, params, total, owner, result=None):
+        """Insert a queued job owned by owner (with an initial partial result) and return it"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._connection()
+            db.execute("DELETE FROM job_items WHERE job_id IN (SELECT id FROM jobs WHERE status NOT IN (?, ?, ?) "
+                       "AND updated < ?)", ACTIVE + (now - JOB_RETENTION,))
+            db.execute("DELETE FROM jobs WHERE status NOT IN (?, ?, ?) AND updated < ?",
+                       ACTIVE + (now - JOB_RETENTION,))
+            db.execute(
+                "INSERT INTO jobs (id, kind, key, status, params, total, result, owner, heartbeat, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, key, QUEUED, json.dumps(params, ensure_ascii=False), total, _encode(result),
+                 owner, now, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        return self._job(self._execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def find_active(self, kind, key):
+        """Newest unfinished job of kind for key, or None"""
+        return self._job(self._execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE kind = ? AND key = ? AND status IN (?, ?) "
+            f"ORDER BY created DESC LIMIT 1", (kind, key, QUEUED, RUNNING)
+        ).fetchone())
+
+    def claim(self, job_id, owner, stale_after, own=True):
+        """Take over an unfinished job if its owner went silent, or (own=True) if owner already has it"""
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE jobs SET owner = ?, heartbeat = ?, updated = ?, "
+            "status = CASE status WHEN ? THEN ? ELSE status END "
+            "WHERE id = ? AND status IN (?, ?, ?) AND ((? AND owner = ?) OR heartbeat < ?)",
+            (owner, now, now, QUEUED, RUNNING, job_id) + ACTIVE + (own, owner, now - stale_after),
+        )
+        return cursor.rowcount == 1
+
+    def stale(self, stale_after):
+        """Ids of unfinished jobs whose owner went silent"""
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND heartbeat < ? ORDER BY created",
+            ACTIVE + (time.time() - stale_after,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_items(self, job_id, owner, items, result=None):
+        """Store item results, progress and a partial result; returns the job's status afterwards"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    "INSERT OR REPLACE INTO job_items (job_id, item, value) VALUES (?, ?, ?)",
+                    [(job_id, item, json.dumps(value, ensure_ascii=False)) for item, value in items.items()],
+                )
+                db.execute(
+                    "UPDATE jobs SET completed = (SELECT COUNT(*) FROM job_items WHERE job_id = ?), "
+                    "result = COALESCE(?, result), heartbeat = ?, updated = ? WHERE id = ? AND owner = ?",
+                    (job_id, _encode(result), now, now, job_id, owner),
+                )
+                status = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return status
+
+    def items(self, job_id):
+        """{item: value} saved so far for a job"""
+        rows = self._execute("SELECT item, value FROM job_items WHERE job_id = ?", (job_id,)).fetchall()
+        return {item: json.loads(value) for item, value in rows}
+
+    def status(self, job_id):
+        row = self._execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Mark a job finished; without a result, the last partial one is kept"""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, heartbeat = ?, updated = ? "
+            "WHERE id = ?",
+            (status, _encode(result), error, now, now, job_id),
+        )
+
+    def cancel(self, job_id):
+        """Cancel a queued job now and ask a running one to stop; returns the job"""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = CASE status WHEN ? THEN ? ELSE ? END, updated = ? "
+            "WHERE id = ? AND status IN (?, ?)",
+            (QUEUED, CANCELLED, CANCELLING, now, job_id, QUEUED, RUNNING),
+        )
+        return self.get(job_id)
+
+
+class JobContext:
+    """What a job handler sees of its job"""
+
+    def __init__(self, store, job, owner):
+        self.store = store
+        self.job_id = job["id"]
+        self.params = job["params"]
+        self.owner = owner
+
+    def saved(self):
+        """Item results saved so far (including by an earlier, interrupted run)"""
+        return self.store.items(self.job_id)
+
+    def check_cancelled(self):
+        if self.store.status(self.job_id) == CANCELLING:
+            raise JobCancelled()
+
+    def save(self, items, result=None):
+        """Persist item results (progress and a partial result); raises JobCancelled if the job was cancelled"""
+        if items and self.store.save_items(self.job_id, self.owner, items, result) == CANCELLING:
+            raise JobCancelled()
+        if not items:
+            self.check_cancelled()
+
+
+class JobRunner:
+    """Runs jobs of registered kinds in a thread pool of this process"""
+
+    def __init__(self, store, max_workers=2, stale_after=180.0):
+        self.store = store
+        self.max_workers = max_workers
+        self.stale_after = stale_after
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._pool_instance = None
+        self._pid = None
+
+    @property
+    def owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _pool(self):
+        """Thread pool of this process (created on first use, so never before a fork)"""
+        with self._lock:
+            if self._pool_instance is None or self._pid != os.getpid():
+                self._pool_instance = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+                self._pid = os.getpid()
+            return self._pool_instance
+
+    def register(self, kind, handler):
+        """handler(context) -> final result, for jobs of this kind"""
+        self._handlers[kind] = handler
+
+    def start(self, kind, key, params, total, result=None):
+        """Start a job, or return the unfinished one with the same kind and key.
+
+        result is the partial result of a new job before any item is done.
+        Returns (job, created).
+        """
+        job = self.store.find_active(kind, key)
+        if job is not None:
+            # Join it, taking it over only if its owner went silent
+            self.resume(job["id"])
+            return job, False
+        job = self.store.create(kind, key, params, total, self.owner, result)
+        self._pool().submit(self._run, job["id"])
+        return job, True
+
+    def get(self, job_id):
+        """Current state of a job, resuming it first if its owner went silent"""
+        job = self.store.get(job_id)
+        if job is not None and job["status"] in ACTIVE and job["heartbeat"] < time.time() - self.stale_after:
+            self.resume(job_id)
+        return job
+
+    def resume(self, job_id):
+        """Run job_id here if its owner went silent (no-op otherwise).
+
+        A job this process is running has a fresh heartbeat, so it is never
+        started a second time.
+        """
+        if self.store.claim(job_id, self.owner, self.stale_after, own=False):
+            self._pool().submit(self._run, job_id)
+
+    def resume_stale(self):
+        """Resume every job left behind by a process that stopped"""
+        for job_id in self.store.stale(self.stale_after):
+            logger.info(f"Resuming job {job_id}")
+            self.resume(job_id)
+
+    def _run(self, job_id):
+        if not self.store.claim(job_id, self.owner, self.stale_after):
+            return  # another process took it over, or it was cancelled
+        job = self.store.get(job_id)
+        context = JobContext(self.store, job, self.owner)
+        try:
+            if job["status"] == CANCELLING:
+                raise JobCancelled()
+            result = self._handlers[job["kind"]](context)
+        except JobCancelled:
+            self.store.finish(job_id, CANCELLED)
+            logger.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.store.finish(job_id, FAILED, error=str(e))
+        else:
+            self.store.finish(job_id, DONE, result=result)
+            logger.info(f"Job {job_id} done")
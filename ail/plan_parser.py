@@ -0,0 +1,211 @@
+"""
+AI Smart Calendar Plan Parser
+Turns Gemini's answer to the /generate_plan prompt into {day: activities}.
+
+generate_plan asks for a JSON object mapping each date of the week to its
+activities. parse_json_plan() accepts exactly that (optionally inside a
+```json fence) and rejects anything else with a PlanFormatError saying
+why, so a malformed answer is never half-applied. Answers that are not
+valid JSON go through parse_line_plan(), the free-text "週一: a、b" parser:
+one precompiled pattern run over the whole answer in a single pass, which
+also reads English weekdays, "Day N", dates, numbered or bulleted lines
+and markdown bold.
+
+For streamed answers, PlanStreamParser reads one day per line as the text
+arrives, so each day can be shown and saved before the rest is generated.
+"""
+
+import json
+import re
+from datetime import datetime
+
+# Weekday names are positions in the planned week, which starts today
+WEEKDAY_INDEX = {name: index for index, names in enumerate([
+    ("monday", "mon", "週一", "周一", "星期一"),
+    ("tuesday", "tue", "週二", "周二", "星期二"),
+    ("wednesday", "wed", "週三", "周三", "星期三"),
+    ("thursday", "thu", "週四", "周四", "星期四"),
+    ("friday", "fri", "週五", "周五", "星期五"),
+    ("saturday", "sat", "週六", "周六", "星期六"),
+    ("sunday", "sun", "週日", "周日", "星期日", "星期天"),
+]) for name in names}
+
+_DAY_NAME = (r"[週周][一二三四五六日]|星期[一二三四五六日天]"
+             r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tue|wed|thu|fri|sat|sun"
+             r"|day[ \t]*\d+|\d{1,2}月\d{1,2}[日號号]?|\d{4}-\d{2}-\d{2}")
+
+# "週一: a、b", "- **Monday** (Aug 11): a, b", "1. Day 1：a；b" ...
+_DAY_LINE = re.compile(
+    rf"^[ \t]*(?:[-*•]|\d+[.)])?[ \t]*(?:\*\*)?({_DAY_NAME})(?:\*\*)?[ \t]*"
+    r"(?:\([^)\n]*\)|（[^）\n]*）)?[ \t]*(?:\*\*)?[:：](?:\*\*)?[ \t]*(.+?)[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Commas between digits ("chapters 1,2") do not separate activities
+_SEPARATOR = re.compile(r"[、;；，]|,(?!\d)")
+_ACTIVITY_TRIM = re.compile(r"^[\s•*-]+|[\s*。.]+$")
+_DAY_NUMBER = re.compile(r"day\s*(\d+)")
+_MONTH_DAY = re.compile(r"(\d{1,2})月(\d{1,2})")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+class PlanFormatError(ValueError):
+    """The answer is not a valid JSON plan"""
+
+
+def _is_date(text):
+    if not _ISO_DATE.fullmatch(text):
+        return False
+    try:
+        datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def parse_json_plan(text, week_dates=None):
+    """{date: activities} of a JSON plan answer.
+
+    The answer must be one JSON object of "YYYY-MM-DD" dates (of week_dates,
+    if given) to non-empty lists of strings; raises PlanFormatError otherwise.
+    """
+    fenced = _FENCE.search(text)
+    body = (fenced.group(1) if fenced else text).strip()
+    if not body.startswith("{"):
+        raise PlanFormatError("not a JSON object")
+    try:
+        value = json.loads(body)
+    except ValueError as e:
+        raise PlanFormatError(f"invalid JSON: {e}")
+    if not isinstance(value, dict) or not value:
+        raise PlanFormatError("expected a non-empty object of date -> activities")
+
+    return dict(_checked_day(key, activities, week_dates) for key, activities in value.items())
+
+
+def _checked_day(key, activities, week_dates):
+    """(date, cleaned activities) of one JSON plan entry; raises PlanFormatError"""
+    if not isinstance(key, str) or not _is_date(key):
+        raise PlanFormatError(f"{key!r} is not a YYYY-MM-DD date")
+    if week_dates is not None and key not in week_dates:
+        raise PlanFormatError(f"{key} is not one of the planned dates")
+    if not isinstance(activities, list) or not all(isinstance(activity, str) for activity in activities):
+        raise PlanFormatError(f"activities of {key} must be a list of strings")
+    cleaned = [activity.strip() for activity in activities if activity.strip()]
+    if not cleaned:
+        raise PlanFormatError(f"no activities for {key}")
+    return key, cleaned
+
+
+def parse_json_plan_line(line, week_dates=None):
+    """(date, activities) of one {"date": ..., "activities": [...]} line.
+
+    A trailing comma (objects listed inside an array) is tolerated; anything
+    else that is not exactly such an object raises PlanFormatError.
+    """
+    try:
+        value = json.loads(line.strip().rstrip(","))
+    except ValueError as e:
+        raise PlanFormatError(f"invalid JSON: {e}")
+    if not isinstance(value, dict) or set(value) != {"date", "activities"}:
+        raise PlanFormatError('expected an object with "date" and "activities"')
+    return _checked_day(value["date"], value["activities"], week_dates)
+
+
+def split_activities(text):
+    """Activities of one day's text, separated by 、 ; ， or commas"""
+    activities = []
+    for activity in _SEPARATOR.split(text):
+        activity = _ACTIVITY_TRIM.sub("", activity)
+        if activity:
+            activities.append(activity)
+    return activities
+
+
+def parse_line_plan(text):
+    """{day as written: activities} of a free-text "day: activities" answer"""
+    plans = {}
+    for match in _DAY_LINE.finditer(text):
+        activities = split_activities(match.group(2))
+        if activities:
+            plans[match.group(1)] = activities
+    return plans
+
+
+def day_to_date(day, week_dates):
+    """Date of week_dates a day key refers to ("週一", "Day 3", "8月12日", a date), or None"""
+    key = day.strip().lower()
+    index = WEEKDAY_INDEX.get(key)
+    if index is None:
+        number = _DAY_NUMBER.fullmatch(key)
+        if number:
+            index = int(number.group(1)) - 1
+    if index is not None:
+        return week_dates[index] if 0 <= index < len(week_dates) else None
+    if key in week_dates:
+        return key
+    month_day = _MONTH_DAY.match(key)
+    if month_day:
+        suffix = f"-{int(month_day.group(1)):02d}-{int(month_day.group(2)):02d}"
+        for week_date in week_dates:
+            if week_date.endswith(suffix):
+                return week_date
+    return None
+
+
+class PlanStreamParser:
+    """Days of a streamed plan answer, each as soon as its line is complete.
+
+    The streaming prompt asks for one {"date", "activities"} JSON object per
+    line; lines that are not JSON are read as free text ("週一: a、b"), and
+    lines that are neither (fences, prose, invalid entries) are skipped.
+    Each date is reported once.
+    """
+
+    def __init__(self, week_dates):
+        self.week_dates = week_dates
+        self.free_text = 0
+        self.skipped = 0
+        self._seen = set()
+        self._buffer = ""
+
+    def feed(self, text):
+        """[(date, activities)] of the lines completed by text"""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        return self._parse(lines)
+
+    def close(self):
+        """[(date, activities)] of the last, unterminated line"""
+        lines, self._buffer = [self._buffer], ""
+        return self._parse(lines)
+
+    def _parse(self, lines):
+        days = []
+        for line in lines:
+            day = self._parse_line(line.strip())
+            if day is None:
+                continue
+            if day[0] in self._seen:
+                self.skipped += 1
+                continue
+            self._seen.add(day[0])
+            days.append(day)
+        return days
+
+    def _parse_line(self, line):
+        if not line or line.startswith("```") or line in ("[", "]"):
+            return None
+        if line.startswith("{"):
+            try:
+                return parse_json_plan_line(line, self.week_dates)
+            except PlanFormatError:
+                self.skipped += 1
+                return None
+        for day, activities in parse_line_plan(line).items():
+            actual_date = day_to_date(day, self.week_dates)
+            if actual_date:
+                self.free_text += 1
+                return actual_date, activities
+        self.skipped += 1
+        return None
@@ -0,0 +1,159 @@
+"""
+AI Smart Calendar Response Cache
+In-process cache of finished AI endpoint responses, with single-flight
+coalescing of identical requests.
+
+Keys are built from the endpoint, its normalized input and everything the
+answer depends on (store version, prompt version, ...), so a cached
+response is only reused while none of those changed. Entries also expire
+after a TTL and the least recently used ones are evicted beyond
+max_entries.
+
+While a response is being computed, identical requests do not start their
+own Gemini calls: they wait for the one in flight and share its result
+(or its exception). The cache is per worker process; the categorization
+cache in ai_cache.py is what carries AI work across processes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from ai_cache import prompt_version
+
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+
+class Flight:
+    """One claim on a key: a cache hit, a computation to wait for, or one to run"""
+
+    def __init__(self, cache, key, value=None, hit=False, leader=False):
+        self.cache = cache
+        self.key = key
+        self.value = value
+        self.hit = hit
+        self.leader = leader
+        self.error = None
+        self._done = threading.Event()
+        if hit:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        """Result of the computation this flight follows"""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def resolve(self, value, cacheable=True):
+        """Leader: publish the result to waiting requests (and the cache)"""
+        self.value = value
+        self.cache._finish(self, cacheable)
+
+    def fail(self, error):
+        """Leader: hand the exception to waiting requests; nothing is cached"""
+        self.error = error
+        self.cache._finish(self, False)
+
+
+class ResponseCache:
+    """TTL + LRU response cache with single-flight coalescing"""
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(endpoint, *parts):
+        return f"{endpoint}:{prompt_version(*parts)}"
+
+    def claim(self, key):
+        """Return a Flight for key.
+
+        flight.hit: value is the cached response. Otherwise flight.leader
+        says whether the caller computes it (and must resolve() or fail()),
+        or waits for the request already computing it with wait().
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return Flight(self, key, entry[1], hit=True)
+                del self._entries[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return _Follower(flight)
+            self.misses += 1
+            flight = self._flights[key] = Flight(self, key, leader=True)
+            return flight
+
+    def _finish(self, flight, cacheable):
+        with self._lock:
+            self._flights.pop(flight.key, None)
+            if cacheable and self.ttl > 0:
+                self._entries[flight.key] = (time.monotonic() + self.ttl, flight.value)
+                self._entries.move_to_end(flight.key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight._done.set()
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """Cached response for key, else compute() once for all concurrent callers.
+
+        cacheable(value) decides whether a result is kept for later requests;
+        requests already waiting share it either way.
+        """
+        flight = self.claim(key)
+        if flight.hit or not flight.leader:
+            return flight.wait()
+        try:
+            value = compute()
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        flight.resolve(value, cacheable is None or cacheable(value))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "in_flight": len(self._flights),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+
+class _Follower:
+    """A waiting request's view of another request's Flight"""
+
+    hit = False
+    leader = False
+
+    def __init__(self, flight):
+        self._flight = flight
+
+    def wait(self):
+        return self._flight.wait()
@@ -0,0 +1,284 @@
+"""
+AI Smart Calendar Schedule Retrieval
+Picks the part of the calendar that is relevant to an /ask_ai question,
+so the prompt stays within a token budget however long the history gets.
+
+Two signals are combined:
+- the date windows parsed from the question ("next week", "8月15日",
+  "明天", "2025-08-15"), whose dates are always included first;
+- BM25 ranking of the question against an inverted index of the note
+  text. Latin words and numbers are indexed as words, Chinese/Japanese
+  runs as overlapping character bigrams (there are no spaces to split
+  on), so "慢跑" matches "30分鐘慢跑".
+
+The index is kept in sync through the store's change log: each query
+re-indexes only the dates changed since the last one, and rebuilds from
+scratch only when the log no longer covers that gap.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from datetime import date, timedelta
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Dates listed when the question has neither a date nor matching notes
+DEFAULT_UPCOMING_DAYS = 14
+
+# Best-ranked matches considered for the context
+MAX_MATCHES = 200
+
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿"
+_TOKEN_PATTERN = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RUN = re.compile(f"[{_CJK}]")
+
+_WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+}
+_CJK_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+
+_ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_CJK_DATE = re.compile(r"(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日號号]?")
+_SLASH_DATE = re.compile(r"(?<![\d/])(\d{1,2})/(\d{1,2})(?![\d/])")
+_NEXT_DAYS = re.compile(r"(?:next|coming|未來|未来|接下來|接下来)\s*(\d{1,3})\s*(?:days?|天)")
+_WEEKDAY = re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b|(?:週|周|星期|禮拜|礼拜)([一二三四五六日天])")
+
+# Relative phrases and their offset from today (in days, weeks or months)
+_RELATIVE_DAYS = [
+    (re.compile(r"\btoday\b|今天|今日"), 0),
+    (re.compile(r"\btomorrow\b|明天|明日"), 1),
+    (re.compile(r"\byesterday\b|昨天|昨日"), -1),
+    (re.compile(r"後天|后天"), 2),
+    (re.compile(r"前天"), -2),
+]
+_RELATIVE_WEEKS = [
+    (re.compile(r"\bthis week\b|本週|本周|這週|这周|這星期|这星期"), 0),
+    (re.compile(r"\bnext week\b|下週|下周|下星期|下禮拜|下礼拜"), 1),
+    (re.compile(r"\blast week\b|上週|上周|上星期|上禮拜|上礼拜"), -1),
+]
+_RELATIVE_MONTHS = [
+    (re.compile(r"\bthis month\b|本月|這個月|这个月"), 0),
+    (re.compile(r"\bnext month\b|下個月|下个月"), 1),
+    (re.compile(r"\blast month\b|上個月|上个月"), -1),
+]
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text):
+    """Index terms of a text: words for Latin script, bigrams for CJK runs"""
+    terms = []
+    for run in _TOKEN_PATTERN.findall(_normalize(text)):
+        if _CJK_RUN.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def estimate_tokens(text):
+    """Rough model token count: one per CJK character, one per ~4 other characters"""
+    cjk = len(_CJK_RUN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _month_window(today, offset):
+    month_index = today.year * 12 + today.month - 1 + offset
+    start = date(month_index // 12, month_index % 12 + 1, 1)
+    following = month_index + 1
+    return start, date(following // 12, following % 12 + 1, 1) - timedelta(days=1)
+
+
+def _safe_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_date_windows(question, today):
+    """[(first, last)] date spans the question refers to, merged and sorted"""
+    text = _normalize(question)
+    spans = []
+
+    for match in _ISO_DATE.finditer(text):
+        day = _safe_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if day:
+            spans.append((day, day))
+    for match in _CJK_DATE.finditer(text):
+        year = int(match.group(1)) if match.group(1) else today.year
+        day = _safe_date(year, int(match.group(2)), int(match.group(3)))
+        if day:
+            spans.append((day, day))
+    for match in _SLASH_DATE.finditer(_ISO_DATE.sub(" ", text)):
+        day = _safe_date(today.year, int(match.group(1)), int(match.group(2)))
+        if day:
+            spans.append((day, day))
+
+    for pattern, offset in _RELATIVE_DAYS:
+        if pattern.search(text):
+            day = today + timedelta(days=offset)
+            spans.append((day, day))
+    for pattern, offset in _RELATIVE_WEEKS:
+        if pattern.search(text):
+            monday = today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+            spans.append((monday, monday + timedelta(days=6)))
+    for pattern, offset in _RELATIVE_MONTHS:
+        if pattern.search(text):
+            spans.append(_month_window(today, offset))
+
+    for match in _NEXT_DAYS.finditer(text):
+        spans.append((today, today + timedelta(days=int(match.group(1)) - 1)))
+    for match in _WEEKDAY.finditer(text):
+        weekday = _WEEKDAYS[match.group(1)] if match.group(1) else _CJK_WEEKDAYS[match.group(2)]
+        # The coming such day (today counts)
+        day = today + timedelta(days=(weekday - today.weekday()) % 7)
+        spans.append((day, day))
+
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def note_activities(value):
+    """Activity list of a stored note entry (plain list or {"activities": [...]})"""
+    if isinstance(value, dict):
+        return value.get("activities", [])
+    return value
+
+
+class ScheduleIndex:
+    """BM25 inverted index over the note text of each date"""
+
+    def __init__(self, store, change_log):
+        self.store = store
+        self.change_log = change_log
+        self.version = None
+        self._postings = {}  # term -> {date: term frequency}
+        self._lengths = {}  # date -> number of terms
+        self._terms = {}  # date -> distinct terms, to unindex it
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        if key not in self._lengths:
+            return
+        for term in self._terms.pop(key):
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(key)
+
+    def _add(self, key, activities):
+        terms = tokenize(" ".join(activities))
+        if not terms:
+            return
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, count in frequencies.items():
+            self._postings.setdefault(term, {})[key] = count
+        self._terms[key] = list(frequencies)
+        self._lengths[key] = len(terms)
+        self._total_length += len(terms)
+
+    def _rebuild(self, version):
+        self._postings, self._lengths, self._terms, self._total_length = {}, {}, {}, 0
+        for key, value in self.store.snapshot().items():
+            self._add(key, note_activities(value))
+        self.version = version
+
+    def sync(self):
+        """Re-index the dates changed since the last sync"""
+        with self._lock:
+            if self.version is None:
+                self._rebuild(self.change_log.since(0)[0])
+                return
+            version, changed = self.change_log.since(self.version)
+            if changed is None:
+                self._rebuild(version)
+                return
+            for key in changed.get("notes", []):
+                self._remove(key)
+                value = self.store.get(key)
+                if value is not None:
+                    self._add(key, note_activities(value))
+            self.version = version
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def search(self, query, limit=None):
+        """[(date, score)] of dates matching the query, best first"""
+        self.sync()
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    norm = K1 * (1 - B + B * self._lengths[key] / average_length)
+                    scores[key] = scores.get(key, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+def select_context(index, question, today, token_budget):
+    """Schedule lines for a question within token_budget, and what was picked.
+
+    Dates in the question's windows come first, then the best BM25 matches;
+    a question with neither gets the upcoming days and then the most recent
+    ones. Lines are returned in date order.
+    """
+    store = index.store
+    windows = parse_date_windows(question, today)
+    candidates = []
+    for start, end in windows:
+        candidates.extend(sorted(store.get_range(start, end).items()))
+    matches = index.search(question, MAX_MATCHES)
+    candidates.extend((key, store.get(key)) for key, _ in matches)
+    if not candidates:
+        upcoming = store.get_range(today, today + timedelta(days=DEFAULT_UPCOMING_DAYS - 1))
+        candidates.extend(sorted(upcoming.items()))
+        candidates.extend(store.latest(DEFAULT_UPCOMING_DAYS))
+
+    picked = {}
+    tokens = 0  # running estimate, one extra per line break
+    for key, value in candidates:
+        if key in picked or not value:
+            continue
+        line = f"{key}: {'、'.join(note_activities(value))}"
+        cost = estimate_tokens(line) + 1
+        if tokens + cost > token_budget:
+            continue  # a shorter, lower-ranked line may still fit
+        picked[key] = line
+        tokens += cost
+
+    lines = [picked[key] for key in sorted(picked)]
+    return lines, {
+        "windows": [[start.isoformat(), end.isoformat()] for start, end in windows],
+        "matched": len(matches),
+        "dates": len(picked),
+        "total_dates": len(index),
+        "context_tokens": estimate_tokens("\n".join(lines)),
+    }
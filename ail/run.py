@@ -2,8 +2,17 @@
 """
 AI Smart Calendar Runner
 Simple script to start the AI Smart Calendar application.
+
+    python run.py                  # development server with reloader
+    python run.py --production     # gunicorn (waitress on Windows)
+
+Production mode can also be selected with SERVER_MODE=production, and is
+tuned with WEB_WORKERS, WEB_THREADS, WEB_WORKER_CLASS and GRACEFUL_TIMEOUT.
+gunicorn uses gevent workers by default, so open /events streams cost a
+greenlet each instead of a thread.
 """
 
+import argparse
 import os
 import sys
 import subprocess
@@ -26,14 +35,115 @@ def check_requirements():
         print("Please run: pip install -r requirements.txt")
         sys.exit(1)
 
+def parse_args():
+    """Command line options, defaulting to the environment"""
+    parser = argparse.ArgumentParser(description="Start the AI Smart Calendar server")
+    parser.add_argument("--production", action="store_true",
+                        default=os.environ.get("SERVER_MODE", "").lower() == "production",
+                        help="serve with gunicorn (or waitress) instead of the development server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", "2")),
+                        help="worker processes (gunicorn only)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", "8")),
+                        help="threads per worker")
+    parser.add_argument("--worker-class", default=os.environ.get("WEB_WORKER_CLASS", "gevent"),
+                        help="gunicorn worker class: gevent (cheap idle /events streams) or gthread")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.environ.get("GRACEFUL_TIMEOUT", "30")),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"],
+                        default=os.environ.get("WEB_SERVER", "auto"))
+    return parser.parse_args()
+
+def resolve_server(args):
+    """The production server to use: gunicorn, or waitress on Windows"""
+    if args.server == "auto":
+        return "waitress" if os.name == "nt" else "gunicorn"
+    return args.server
+
+def patch_for_gevent(args):
+    """Monkey-patch the standard library when gunicorn will run gevent workers.
+
+    Must run before flask, google.generativeai, ssl or the app are imported,
+    or their sockets and locks would block the whole worker. Without gevent
+    installed, fall back to gthread workers.
+
+    google-generativeai talks to Gemini over gRPC, whose C core does its own
+    blocking I/O: init_gevent() makes it yield to the event loop, or one
+    Gemini call would stall every request and /events stream of the worker.
+    """
+    if not (args.production and resolve_server(args) == "gunicorn" and args.worker_class == "gevent"):
+        return
+    try:
+        from gevent import monkey
+    except ImportError:
+        print("ℹ️  gevent is not installed, using gthread workers (pip install -r requirements.txt)")
+        args.worker_class = "gthread"
+        return
+    monkey.patch_all()
+    import grpc.experimental.gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+
+def serve_gunicorn(args):
+    """Serve with gunicorn: preloaded app, several worker processes"""
+    from gunicorn.app.base import BaseApplication
+    from app import app, start_background_tasks
+
+    class CalendarApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "threads": args.threads,
+                "worker_class": args.worker_class,
+                # Import (and build the stores) once in the master, then fork
+                "preload_app": True,
+                # SIGTERM lets in-flight requests finish for this long
+                "graceful_timeout": args.graceful_timeout,
+                # /events streams stay open, so only time out silent workers
+                "timeout": 120,
+                "worker_connections": 1000,
+                # Connections and threads must not cross fork: start them in each worker
+                "post_worker_init": lambda worker: start_background_tasks(),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    CalendarApplication().run()
+
+def serve_waitress(args):
+    """Serve with waitress: one process, many threads (works on Windows)"""
+    from waitress import serve
+    from app import app, start_background_tasks
+
+    if args.workers > 1:
+        print("ℹ️  waitress runs a single process; use --threads to scale")
+    start_background_tasks()
+    # waitress finishes in-flight requests when interrupted
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+def serve_production(args):
+    """Pick gunicorn where available, otherwise waitress"""
+    server = resolve_server(args)
+    if server == "gunicorn" and args.worker_class == "gevent":
+        print(f"🏭 Production mode: {server}, {args.workers} gevent worker(s)")
+    else:
+        print(f"🏭 Production mode: {server}, {args.workers} worker(s) x {args.threads} thread(s)")
+        # The app keeps most threads free of /events streams (see events.py)
+        os.environ["WEB_THREADS"] = str(args.threads)
+    if server == "gunicorn":
+        serve_gunicorn(args)
+    else:
+        serve_waitress(args)
+
 def main():
     """Main function to run the application"""
     print("🤖 Starting AI Smart Calendar...")
     print()
     
-    # Check requirements
-    check_requirements()
-    
     # Set environment variables if .env file exists
     env_file = Path(".env")
     if env_file.exists():
@@ -43,17 +153,36 @@ def main():
                 if "=" in line and not line.startswith("#"):
                     key, value = line.strip().split("=", 1)
                     os.environ[key] = value
+
+    args = parse_args()
+    
+    # gevent has to patch the standard library before anything imports flask
+    patch_for_gevent(args)
+    
+    # Check requirements
+    check_requirements()
     
     # Start the Flask application
     print("🚀 Starting Flask server...")
-    print("📱 Open your browser and go to: http://localhost:5000")
+    print(f"📱 Open your browser and go to: http://localhost:{args.port}")
     print("⏹️  Press Ctrl+C to stop the server")
     print()
     
     try:
-        # Import and run the Flask app
-        from app import app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        if args.production:
+            serve_production(args)
+        else:
+            # Import and run the Flask app
+            from app import app, start_background_tasks
+            # The reloader's parent process only watches files; the child it
+            # starts to serve (WERKZEUG_RUN_MAIN) runs the background tasks
+            if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+                start_background_tasks()
+            app.run(debug=True, host=args.host, port=args.port)
+    except ImportError as e:
+        print(f"❌ Error: Missing production server - {e}")
+        print("Please run: pip install -r requirements.txt")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
     except Exception as e:
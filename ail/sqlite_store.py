@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+AI Smart Calendar SQLite Storage
+Optional SQLite backend for notes and labels (STORAGE_BACKEND=sqlite).
+
+Notes are stored one row per activity and labels one row per date, both
+keyed by ISO date with an index on the date column, so single-note writes
+are single-row inserts and month/range reads and deletes are indexed range
+queries instead of rewrites of the whole calendar.
+
+Every mutation also inserts one row per changed date into the changes
+table. Its autoincrement id is the version used for ETags and delta sync;
+only the most recent CHANGE_HISTORY rows are kept.
+
+Run this file directly to import an existing notes.json/labels.json:
+    python sqlite_store.py --notes notes.json --labels labels.json --db calendar.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+from storage import CHANGE_HISTORY, to_iso_date
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_date ON notes (date, position);
+
+CREATE TABLE IF NOT EXISTS labels (
+    date TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    store TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_store ON changes (store, version);
+"""
+
+# Date recorded in the changes table when a whole store is replaced
+ALL_DATES = "*"
+
+# Seconds a writer waits for another process's transaction to finish
+BUSY_TIMEOUT = 30.0
+
+
+def open_database(path):
+    """Open (and create if needed) the calendar database"""
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def reopen_after_fork(path, *users):
+    """Give forked worker processes their own connection.
+
+    A connection opened before fork (e.g. by a preloading server) must not
+    be used by the children, so each child reopens the database and hands
+    the new connection to every store sharing the old one.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+
+    def reopen():
+        connection = open_database(path)
+        for user in users:
+            user._db = connection
+
+    os.register_at_fork(after_in_child=reopen)
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+class SqliteStore:
+    """Shared connection handling for the SQLite stores.
+
+    Stores that share a connection must also share its lock, since a
+    connection can only run one transaction at a time.
+    """
+
+    kind = None  # "notes" or "labels", used in the changes table
+
+    def __init__(self, connection, lock):
+        self._db = connection
+        self._lock = lock
+
+    def _changed(self, db, dates):
+        """Record that dates changed, which bumps the version"""
+        rows = [(self.kind, d) for d in dates]
+        if not rows:
+            return
+        db.executemany("INSERT INTO changes (store, date) VALUES (?, ?)", rows)
+        db.execute(
+            "DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?", (CHANGE_HISTORY,)
+        )
+
+    @property
+    def version(self):
+        """Latest change version of either store (never goes backwards)"""
+        with self._lock:
+            row = self._db.execute("SELECT MAX(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def etag(self):
+        """Validator that changes whenever the data changes"""
+        return str(self.version)
+
+    def _transaction(self):
+        """Run statements atomically; use as `with self._transaction() as db:`"""
+        return _Transaction(self._db, self._lock)
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one transaction, rolled back if the block raises"""
+        with self._transaction():
+            yield
+
+    def sync(self):
+        """Every read goes to the database, so there is nothing to pick up"""
+
+    def invalidate(self):
+        """Nothing is cached in process, so there is nothing to drop"""
+
+
+class _Transaction:
+    """Transaction that joins an already open one instead of nesting"""
+
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+        self._nested = False
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._nested = self._db.in_transaction
+        if not self._nested:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+            except BaseException:
+                # __exit__ will not run: e.g. "database is locked" after busy_timeout
+                self._lock.release()
+                raise
+        return self._db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self._nested:
+                self._db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+        return False
+
+
+class SqliteChangeLog:
+    """Delta sync over the changes table, mirroring storage.ChangeLog"""
+
+    def __init__(self, connection, lock):
+        self._db = connection
+        self._lock = lock
+
+    @property
+    def version(self):
+        with self._lock:
+            row = self._db.execute("SELECT MAX(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def since(self, since):
+        """Return (version, {kind: [dates]}) of changes after since, or (version, None) to resync"""
+        with self._lock:
+            oldest, version = self._db.execute("SELECT MIN(version), MAX(version) FROM changes").fetchone()
+            version = version or 0
+            floor = oldest - 1 if oldest is not None else version
+            if since < floor or since > version:
+                return version, None
+            rows = self._db.execute(
+                "SELECT DISTINCT store, date FROM changes WHERE version > ? ORDER BY date", (since,)
+            ).fetchall()
+        changed = {}
+        for kind, key in rows:
+            if key == ALL_DATES:
+                return version, None
+            changed.setdefault(kind, []).append(key)
+        return version, changed
+
+
+class SqliteNoteStore(SqliteStore):
+    """Notes keyed by date, one row per activity"""
+
+    kind = "notes"
+
+    def _rows_to_dict(self, rows):
+        notes = {}
+        for note_date, content in rows:
+            notes.setdefault(note_date, []).append(json.loads(content))
+        return notes
+
+    def _select(self, where="", params=()):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT date, content FROM notes {where} ORDER BY date, position", params
+            ).fetchall()
+        return self._rows_to_dict(rows)
+
+    def _insert_day(self, db, key, contents):
+        db.executemany(
+            "INSERT INTO notes (date, position, content) VALUES (?, ?, ?)",
+            [(key, position, _encode(content)) for position, content in enumerate(contents)],
+        )
+
+    # Reads
+
+    def snapshot(self):
+        return self._select()
+
+    def get(self, key, default=None):
+        notes = self._select("WHERE date = ?", (key,))
+        return notes.get(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM notes WHERE date = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(DISTINCT date) FROM notes").fetchone()[0]
+
+    def get_range(self, start, end):
+        return self._select("WHERE date BETWEEN ? AND ?", (to_iso_date(start), to_iso_date(end)))
+
+    def latest(self, count):
+        notes = self._select(
+            "WHERE date IN (SELECT DISTINCT date FROM notes ORDER BY date DESC LIMIT ?)", (count,)
+        )
+        return sorted(notes.items(), reverse=True)
+
+    # Writes
+
+    def append_note(self, date, content):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO notes (date, position, content) "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0), ? FROM notes WHERE date = ?",
+                (date, _encode(content), date),
+            )
+            self._changed(db, [date])
+
+    def remove_note(self, date, index):
+        if index < 0:
+            return False
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id FROM notes WHERE date = ? ORDER BY position LIMIT 1 OFFSET ?", (date, index)
+            ).fetchone()
+            if row is None:
+                return False
+            db.execute("DELETE FROM notes WHERE id = ?", (row[0],))
+            self._changed(db, [date])
+            return True
+
+    def set(self, key, value):
+        with self._transaction() as db:
+            db.execute("DELETE FROM notes WHERE date = ?", (key,))
+            self._insert_day(db, key, value)
+            self._changed(db, [key])
+
+    def set_many(self, entries):
+        with self._transaction() as db:
+            for key, value in entries.items():
+                db.execute("DELETE FROM notes WHERE date = ?", (key,))
+                self._insert_day(db, key, value)
+            self._changed(db, entries.keys())
+
+    def delete(self, key):
+        return self.delete_many([key]).get(key)
+
+    def delete_many(self, keys):
+        removed = {}
+        with self._transaction() as db:
+            for key in keys:
+                if key in removed:
+                    continue
+                rows = db.execute(
+                    "SELECT date, content FROM notes WHERE date = ? ORDER BY position", (key,)
+                ).fetchall()
+                if rows:
+                    removed.update(self._rows_to_dict(rows))
+                    db.execute("DELETE FROM notes WHERE date = ?", (key,))
+            self._changed(db, removed.keys())
+        return removed
+
+    def delete_range(self, start, end):
+        params = (to_iso_date(start), to_iso_date(end))
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT date, content FROM notes WHERE date BETWEEN ? AND ? ORDER BY date, position", params
+            ).fetchall()
+            db.execute("DELETE FROM notes WHERE date BETWEEN ? AND ?", params)
+            removed = self._rows_to_dict(rows)
+            self._changed(db, removed.keys())
+        return removed
+
+    def replace_all(self, data):
+        with self._transaction() as db:
+            db.execute("DELETE FROM notes")
+            for key, value in data.items():
+                self._insert_day(db, key, value)
+            self._changed(db, [ALL_DATES])
+
+
+class SqliteLabelStore(SqliteStore):
+    """Labels keyed by date, one row per date"""
+
+    kind = "labels"
+
+    def _select(self, where="", params=()):
+        with self._lock:
+            rows = self._db.execute(f"SELECT date, data FROM labels {where} ORDER BY date", params).fetchall()
+        return {label_date: json.loads(data) for label_date, data in rows}
+
+    # Reads
+
+    def snapshot(self):
+        return self._select()
+
+    def get(self, key, default=None):
+        return self._select("WHERE date = ?", (key,)).get(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM labels WHERE date = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    def get_range(self, start, end):
+        return self._select("WHERE date BETWEEN ? AND ?", (to_iso_date(start), to_iso_date(end)))
+
+    def latest(self, count):
+        labels = self._select("WHERE date IN (SELECT date FROM labels ORDER BY date DESC LIMIT ?)", (count,))
+        return sorted(labels.items(), reverse=True)
+
+    # Writes
+
+    def set(self, key, value):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO labels (date, data) VALUES (?, ?)", (key, _encode(value)))
+            self._changed(db, [key])
+
+    def set_many(self, entries):
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO labels (date, data) VALUES (?, ?)",
+                [(key, _encode(value)) for key, value in entries.items()],
+            )
+            self._changed(db, entries.keys())
+
+    def update_label(self, date, fields):
+        with self._transaction() as db:
+            row = db.execute("SELECT data FROM labels WHERE date = ?", (date,)).fetchone()
+            if row is None:
+                return False
+            updated = json.loads(row[0])
+            updated.update(fields)
+            db.execute("UPDATE labels SET data = ? WHERE date = ?", (_encode(updated), date))
+            self._changed(db, [date])
+            return True
+
+    def delete(self, key):
+        return self.delete_many([key]).get(key)
+
+    def delete_many(self, keys):
+        removed = {}
+        with self._transaction() as db:
+            for key in keys:
+                if key in removed:
+                    continue
+                row = db.execute("SELECT data FROM labels WHERE date = ?", (key,)).fetchone()
+                if row is not None:
+                    removed[key] = json.loads(row[0])
+                    db.execute("DELETE FROM labels WHERE date = ?", (key,))
+            self._changed(db, removed.keys())
+        return removed
+
+    def delete_range(self, start, end):
+        params = (to_iso_date(start), to_iso_date(end))
+        with self._transaction() as db:
+            rows = db.execute("SELECT date, data FROM labels WHERE date BETWEEN ? AND ? ORDER BY date", params).fetchall()
+            db.execute("DELETE FROM labels WHERE date BETWEEN ? AND ?", params)
+            self._changed(db, [label_date for label_date, _ in rows])
+        return {label_date: json.loads(data) for label_date, data in rows}
+
+    def replace_all(self, data):
+        with self._transaction() as db:
+            db.execute("DELETE FROM labels")
+            db.executemany(
+                "INSERT INTO labels (date, data) VALUES (?, ?)",
+                [(key, _encode(value)) for key, value in data.items()],
+            )
+            self._changed(db, [ALL_DATES])
+
+
+def migrate_from_json(notes_file, labels_file, sqlite_file):
+    """Import notes.json/labels.json into the SQLite database, replacing its contents"""
+    from storage import NoteStore, LabelStore
+
+    notes = NoteStore(notes_file).snapshot()
+    labels = LabelStore(labels_file).snapshot()
+
+    connection = open_database(sqlite_file)
+    lock = threading.RLock()
+    SqliteNoteStore(connection, lock).replace_all(notes)
+    SqliteLabelStore(connection, lock).replace_all(labels)
+    connection.close()
+
+    total_notes = sum(len(notes_list) for notes_list in notes.values())
+    return len(notes), total_notes, len(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import notes.json/labels.json into SQLite")
+    parser.add_argument("--notes", default="notes.json", help="notes JSON file to import")
+    parser.add_argument("--labels", default="labels.json", help="labels JSON file to import")
+    parser.add_argument("--db", default="calendar.db", help="SQLite database to create or replace")
+    args = parser.parse_args()
+
+    print(f"📦 Importing {args.notes} and {args.labels} into {args.db}...")
+    days, total_notes, total_labels = migrate_from_json(args.notes, args.labels, args.db)
+    print(f"✅ Imported {total_notes} notes on {days} days and {total_labels} labels")
+    print("Set STORAGE_BACKEND=sqlite in your .env file to use the database")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,28 @@ let selectedDate = null;
 let notesData = {};
 let editingNoteIndex = null;
 
+// Server change version that notesData/labels reflect (null = never synced)
+let changesVersion = null;
+
+// Last response for each conditional GET: url -> { etag, data }
+const conditionalCache = new Map();
+
+// Fetch JSON, sending back the last ETag so unchanged data is answered with 304
+async function fetchJSONConditional(url) {
+    const cached = conditionalCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        conditionalCache.set(url, { etag, data });
+    }
+    return data;
+}
+
 // Calendar functionality
 class Calendar {
     constructor() {
@@ -270,7 +292,7 @@ class Calendar {
             
             const data = await response.json();
             if (data.status === 'success') {
-                await this.loadNotes();
+                await this.refreshData();
                 this.renderCalendar();
                 this.updateNotesPanel();
                 this.updateWeekOverview();
@@ -304,7 +326,7 @@ class Calendar {
             const data = await response.json();
             if (data.status === 'success') {
                 document.getElementById('new-note-content').value = '';
-                await this.loadNotes();
+                await this.refreshData();
                 this.renderCalendar();
                 this.updateNotesPanel();
                 this.updateWeekOverview();
@@ -319,8 +341,7 @@ class Calendar {
 
     async loadNotes() {
         try {
-            const response = await fetch('/get_notes');
-            const data = await response.json();
+            const data = await fetchJSONConditional('/get_notes');
             notesData = data || {};
             console.log('Notes loaded:', notesData); // Debug log
         } catch (error) {
@@ -330,9 +351,47 @@ class Calendar {
     }
 
     async refreshData() {
-        await this.loadNotes();
+        // Fetch only what changed since the last sync; the server falls back
+        // to a full resync when our version is too old. Returns what was applied.
+        try {
+            const since = changesVersion === null ? -1 : changesVersion;
+            const response = await fetch(`/changes?since=${since}`, { cache: 'no-store' });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error);
+            }
+            this.applyChanges(data);
+            return data;
+        } catch (error) {
+            console.error('Error syncing changes:', error);
+            changesVersion = null;
+            await this.loadNotes();
+            if (labelManager) {
+                await labelManager.loadLabels();
+            }
+            return { full_resync: true };
+        }
+    }
+
+    applyChanges(data) {
+        const labelsData = labelManager ? labelManager.labelsData : {};
+        if (data.full_resync) {
+            notesData = data.notes || {};
+            if (labelManager) {
+                labelManager.labelsData = data.labels || {};
+            }
+        } else {
+            // Copy before patching: the old objects may be shared with the ETag cache
+            notesData = { ...notesData, ...data.notes };
+            data.deleted_notes.forEach(date => delete notesData[date]);
+            if (labelManager) {
+                labelManager.labelsData = { ...labelsData, ...data.labels };
+                data.deleted_labels.forEach(date => delete labelManager.labelsData[date]);
+            }
+        }
+        changesVersion = data.version;
         if (labelManager) {
-            await labelManager.loadLabels();
+            labelManager.renderLabelsList();
         }
     }
 
@@ -465,7 +524,7 @@ class Calendar {
                     
                     const data = await response.json();
                     if (data.status === 'success') {
-                        await this.loadNotes();
+                        await this.refreshData();
                         this.renderCalendar();
                         this.updateNotesPanel();
                         this.updateWeekOverview();
@@ -516,25 +575,47 @@ class AIAssistant {
             return;
         }
         
+        const weeks = parseInt(document.getElementById('plan-weeks').value, 10) || 1;
         const resultDisplay = document.getElementById('plan-result');
-        resultDisplay.textContent = 'Generating plan with AI... Please wait.';
+        resultDisplay.textContent = weeks > 1
+            ? `Generating a ${weeks}-week plan with AI... Please wait.`
+            : 'Generating plan with AI... Please wait.';
         
         try {
+            // Ask for a streamed plan so each day shows up (and is saved) as soon as it is generated;
+            // plans longer than a week come back as one JSON response
             const response = await fetch('/generate_plan', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ goal })
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify({ goal, weeks })
             });
             
-            const data = await response.json();
-            if (data.status === 'success') {
-                resultDisplay.textContent = this.formatPlanResult(data);
-                // Refresh calendar to show new plans
-                calendar.renderCalendar();
-                calendar.updateWeekOverview();
-            } else {
-                resultDisplay.textContent = `Error: ${data.error}`;
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.body || !contentType.startsWith('text/event-stream')) {
+                const data = await response.json();
+                if (data.status === 'success') {
+                    resultDisplay.textContent = this.formatPlanResult(data);
+                    await this.refreshCalendar();
+                } else {
+                    resultDisplay.textContent = `Error: ${data.error}`;
+                }
+                return;
             }
+
+            const plan = {};
+            await readEventStream(response, (event, data) => {
+                if (event === 'day') {
+                    plan[data.date] = data.activities;
+                    resultDisplay.textContent = this.formatPlanResult({ plan }, true);
+                } else if (event === 'done') {
+                    resultDisplay.textContent = this.formatPlanResult(data);
+                } else if (event === 'error') {
+                    // Days saved before the failure were put back, so the calendar is unchanged
+                    resultDisplay.textContent = `Error: ${data.error}\nYour calendar was not changed.`;
+                }
+            });
+            // Refresh calendar to show new plans
+            await this.refreshCalendar();
         } catch (error) {
             console.error('Error generating plan:', error);
             resultDisplay.textContent = 'Error generating plan. Please try again.';
@@ -552,26 +633,50 @@ class AIAssistant {
         resultDisplay.textContent = 'AI is analyzing your schedule... Please wait.';
         
         try {
+            // Ask for a streamed answer so text shows up as soon as Gemini produces it
             const response = await fetch('/ask_ai', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                 body: JSON.stringify({ question })
             });
             
-            const data = await response.json();
-            if (data.answer) {
-                resultDisplay.textContent = data.answer;
-            } else {
-                resultDisplay.textContent = `Error: ${data.error}`;
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.body || !contentType.startsWith('text/event-stream')) {
+                const data = await response.json();
+                if (data.answer) {
+                    resultDisplay.textContent = data.answer;
+                } else {
+                    resultDisplay.textContent = `Error: ${data.error}`;
+                }
+                return;
             }
+
+            let answer = '';
+            await readEventStream(response, (event, data) => {
+                if (event === 'chunk') {
+                    answer += data.text;
+                    resultDisplay.textContent = answer;
+                } else if (event === 'error') {
+                    resultDisplay.textContent = answer ? `${answer}\n\nError: ${data.error}` : `Error: ${data.error}`;
+                }
+            });
         } catch (error) {
             console.error('Error asking AI:', error);
             resultDisplay.textContent = 'Error getting AI response. Please try again.';
         }
     }
 
-    formatPlanResult(data) {
-        let result = '✅ AI Plan Generated Successfully!\n\n';
+    async refreshCalendar() {
+        await calendar.refreshData();
+        calendar.renderCalendar();
+        calendar.updateWeekOverview();
+    }
+
+    formatPlanResult(data, inProgress = false) {
+        let result = inProgress ? '⏳ Generating plan...\n\n' : '✅ AI Plan Generated Successfully!\n\n';
+        if (data.failed_weeks) {
+            result += `⚠️ ${data.failed_weeks} of ${data.weeks.length} weeks could not be generated by AI and use a template plan.\n\n`;
+        }
         result += '📅 Weekly Schedule:\n';
         result += '==================\n\n';
         
@@ -670,7 +775,7 @@ class BulkDeleteManager {
             
             if (data.status === 'success') {
                 dateInput.value = '';
-                calendar.loadNotes();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 calendar.updateWeekOverview();
                 if (selectedDate === date) {
@@ -709,7 +814,7 @@ class BulkDeleteManager {
             if (data.status === 'success') {
                 document.getElementById('start-date-input').value = '';
                 document.getElementById('end-date-input').value = '';
-                calendar.loadNotes();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 calendar.updateWeekOverview();
                 calendar.updateNotesPanel();
@@ -736,7 +841,7 @@ class BulkDeleteManager {
             this.showDeleteResult(data);
             
             if (data.status === 'success') {
-                calendar.loadNotes();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 calendar.updateWeekOverview();
                 calendar.updateNotesPanel();
@@ -775,7 +880,7 @@ class BulkDeleteManager {
             this.showDeleteResult(data);
             
             if (data.status === 'success') {
-                calendar.loadNotes();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 calendar.updateWeekOverview();
                 calendar.updateNotesPanel();
@@ -828,7 +933,7 @@ class BulkDeleteManager {
             
             if (data.status === 'success') {
                 document.getElementById('multiple-dates-input').value = '';
-                calendar.loadNotes();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 calendar.updateWeekOverview();
                 calendar.updateNotesPanel();
@@ -900,8 +1005,7 @@ class LabelManager {
 
     async loadLabels() {
         try {
-            const response = await fetch('/get_labels');
-            const data = await response.json();
+            const data = await fetchJSONConditional('/get_labels');
             this.labelsData = data || {};
             this.renderLabelsList();
         } catch (error) {
@@ -936,7 +1040,7 @@ class LabelManager {
             this.showLabelResult(data);
             
             if (data.status === 'success') {
-                await this.loadLabels();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 this.clearForm();
             }
@@ -971,7 +1075,7 @@ class LabelManager {
             this.showLabelResult(data);
             
             if (data.status === 'success') {
-                await this.loadLabels();
+                await calendar.refreshData();
                 calendar.renderCalendar();
                 this.clearForm();
                 this.editingLabelDate = null;
@@ -998,7 +1102,7 @@ class LabelManager {
             this.showLabelResult(data);
             
             if (data.status === 'success') {
-                await this.loadLabels();
+                await calendar.refreshData();
                 calendar.renderCalendar();
             }
         } catch (error) {
@@ -1119,6 +1223,7 @@ class LabelManager {
 class AnalyticsManager {
     constructor() {
         this.analysisData = null;
+        this.currentJobId = null;
         this.bindEvents();
     }
 
@@ -1127,6 +1232,10 @@ class AnalyticsManager {
             this.analyzeTimeAllocation();
         });
 
+        document.getElementById('cancel-analysis-btn').addEventListener('click', () => {
+            this.cancelAnalysis();
+        });
+
         document.getElementById('show-trends-btn').addEventListener('click', () => {
             this.showTrends();
         });
@@ -1138,29 +1247,88 @@ class AnalyticsManager {
 
     async analyzeTimeAllocation() {
         try {
-            const response = await fetch('/analyze_time_allocation');
-            const data = await response.json();
-            this.analysisData = data;
-            
-            this.renderSummaryStats(data);
-            this.renderScaleCharts(data);
-            this.renderBarChart(data.chart_data);
-            this.renderWeeklyChart(data.weekly_analysis, data.weekly_intensities);
-            this.renderAICategorizationResults(data);
-            this.renderActivityDetails(data.chart_data);
-            this.generateInsights(data);
-            
-            this.showAnalyticsResult('✅ Time allocation analysis completed!');
+            // Large histories take longer than one request: run the analysis as a job and poll it
+            const response = await fetch('/analysis_jobs', { method: 'POST' });
+            let job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || response.statusText);
+            }
+            this.currentJobId = job.job_id;
+            this.setAnalysisRunning(true);
+
+            // Partial results carry a few sample activities per category; the full list comes when the job is done
+            let rendered = 0;
+            while (['queued', 'running', 'cancelling'].includes(job.status)) {
+                this.showAnalysisProgress(job);
+                if (job.completed > rendered) {
+                    this.renderAnalysis(job.result);
+                    rendered = job.completed;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const poll = await fetch(`/analysis_jobs/${job.job_id}`);
+                job = await poll.json();
+                if (!poll.ok) {
+                    throw new Error(job.error || poll.statusText);
+                }
+            }
+
+            this.renderAnalysis(job.result);
+            if (job.status === 'done') {
+                this.showAnalyticsResult('✅ Time allocation analysis completed!');
+            } else if (job.status === 'cancelled') {
+                this.showAnalyticsResult(`⏹️ Analysis cancelled after ${job.completed}/${job.total} activities`);
+            } else {
+                this.showAnalyticsResult(`❌ Analysis failed: ${job.error}`);
+            }
         } catch (error) {
             console.error('Error analyzing time allocation:', error);
             this.showAnalyticsResult('❌ Error analyzing time allocation. Please try again.');
+        } finally {
+            this.currentJobId = null;
+            this.setAnalysisRunning(false);
         }
     }
 
+    async cancelAnalysis() {
+        if (!this.currentJobId) {
+            return;
+        }
+        try {
+            await fetch(`/analysis_jobs/${this.currentJobId}/cancel`, { method: 'POST' });
+        } catch (error) {
+            console.error('Error cancelling analysis:', error);
+        }
+    }
+
+    renderAnalysis(data) {
+        this.analysisData = data;
+        
+        this.renderSummaryStats(data);
+        this.renderScaleCharts(data);
+        this.renderBarChart(data.chart_data);
+        this.renderWeeklyChart(data.weekly_analysis, data.weekly_intensities);
+        this.renderAICategorizationResults(data);
+        this.renderActivityDetails(data.chart_data);
+        this.generateInsights(data);
+    }
+
+    setAnalysisRunning(running) {
+        document.getElementById('analyze-time-btn').disabled = running;
+        document.getElementById('cancel-analysis-btn').style.display = running ? 'inline-block' : 'none';
+    }
+
+    showAnalysisProgress(job) {
+        const resultDisplay = document.getElementById('analytics-result');
+        const percent = Math.round(job.progress * 100);
+        resultDisplay.textContent = job.status === 'cancelling'
+            ? '⏹️ Cancelling analysis...'
+            : `⏳ AI is categorizing activities: ${job.completed}/${job.total} (${percent}%)`;
+        resultDisplay.style.color = '#666';
+    }
+
     async showTrends() {
         try {
-            const response = await fetch('/get_activity_trends');
-            const data = await response.json();
+            const data = await fetchJSONConditional('/get_activity_trends');
             
             this.renderTrendsChart(data.trends);
             this.showAnalyticsResult('✅ Activity trends loaded!');
@@ -1402,7 +1570,7 @@ class AnalyticsManager {
                         ${item.details.slice(0, 5).map(detail => 
                             `<div class="activity-tag">${detail.activity} (${detail.intensity}/10)</div>`
                         ).join('')}
-                        ${item.details.length > 5 ? `<div class="activity-tag">+${item.details.length - 5} more</div>` : ''}
+                        ${item.count > 5 ? `<div class="activity-tag">+${item.count - 5} more</div>` : ''}
                     </div>
                 </div>
             `;
@@ -1611,10 +1779,10 @@ class AutoDeadlineManager {
         // Load deadlines immediately on page load
         await this.loadAutoDeadlines();
         
-        // Set up auto-refresh every 5 minutes
-        this.autoRefreshInterval = setInterval(() => {
-            this.loadAutoDeadlines();
-        }, 5 * 60 * 1000);
+        // Label changes are pushed over /events; poll only without it
+        if (!window.EventSource) {
+            this.startPolling();
+        }
         
         // Also refresh every hour to update day counts
         setInterval(() => {
@@ -1622,10 +1790,25 @@ class AutoDeadlineManager {
         }, 60 * 60 * 1000);
     }
 
+    startPolling() {
+        // Fallback auto-refresh every 5 minutes while the event stream is down
+        if (!this.autoRefreshInterval) {
+            this.autoRefreshInterval = setInterval(() => {
+                this.loadAutoDeadlines();
+            }, 5 * 60 * 1000);
+        }
+    }
+
+    stopPolling() {
+        if (this.autoRefreshInterval) {
+            clearInterval(this.autoRefreshInterval);
+            this.autoRefreshInterval = null;
+        }
+    }
+
     async loadAutoDeadlines() {
         try {
-            const response = await fetch('/get_labeled_deadlines');
-            const data = await response.json();
+            const data = await fetchJSONConditional('/get_labeled_deadlines');
             this.autoDeadlineData = data;
             
             this.renderAutoDeadlineDisplay(data);
@@ -1801,4 +1984,117 @@ document.addEventListener('DOMContentLoaded', async () => {
     const today = new Date();
     const todayString = today.toISOString().split('T')[0];
     calendar.selectDate(todayString);
+
+    connectEventStream();
 });
+
+// Polling interval while this tab has no event stream
+const CHANGES_POLL_INTERVAL = 30 * 1000;
+// Delay before asking for a stream again after the server refused one
+const EVENT_STREAM_RETRY = 5 * 60 * 1000;
+let changesPollInterval = null;
+
+function startChangesPolling() {
+    if (changesPollInterval) {
+        return;
+    }
+    changesPollInterval = setInterval(async () => {
+        const before = changesVersion;
+        const data = await calendar.refreshData();
+        if (changesVersion !== before) {
+            renderLiveChanges(data);
+        }
+    }, CHANGES_POLL_INTERVAL);
+}
+
+function stopChangesPolling() {
+    if (changesPollInterval) {
+        clearInterval(changesPollInterval);
+        changesPollInterval = null;
+    }
+}
+
+// Live updates: the server pushes every note/label change over /events.
+// It caps open streams per process; tabs over the cap poll /changes instead.
+function connectEventStream() {
+    if (!window.EventSource) {
+        startChangesPolling();
+        return;
+    }
+    const events = new EventSource('/events');
+
+    events.onopen = () => {
+        stopChangesPolling();
+        autoDeadlineManager.stopPolling();
+    };
+
+    events.onerror = () => {
+        // EventSource reconnects by itself after a dropped connection; poll in the meantime
+        startChangesPolling();
+        autoDeadlineManager.startPolling();
+        if (events.readyState === EventSource.CLOSED) {
+            // Refused (503 at the subscriber cap): EventSource gives up, so ask again later
+            setTimeout(connectEventStream, EVENT_STREAM_RETRY);
+        }
+    };
+
+    events.addEventListener('changes', async (event) => {
+        const data = JSON.parse(event.data);
+        if (changesVersion !== null && data.version <= changesVersion) {
+            return; // Already synced, e.g. our own mutation
+        }
+        if (!data.full_resync && data.from_version === changesVersion) {
+            calendar.applyChanges(data);
+        } else {
+            await calendar.refreshData();
+        }
+        renderLiveChanges(data);
+    });
+
+    events.addEventListener('resync', async (event) => {
+        await calendar.refreshData();
+        renderLiveChanges({ full_resync: true });
+    });
+}
+
+// Read Server-Sent Events from a fetch() response (EventSource cannot POST)
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trimStart());
+                }
+            });
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+function renderLiveChanges(data) {
+    calendar.renderCalendar();
+    calendar.updateNotesPanel();
+    calendar.updateWeekOverview();
+    const labelsChanged = data.full_resync ||
+        Object.keys(data.labels || {}).length > 0 || (data.deleted_labels || []).length > 0;
+    if (labelsChanged) {
+        autoDeadlineManager.loadAutoDeadlines();
+    }
+}
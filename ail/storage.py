@@ -0,0 +1,837 @@
+"""
+AI Smart Calendar Storage
+In-process caches for notes.json and labels.json.
+
+The stores keep the parsed JSON in memory and only re-read the file when
+its mtime or size changes (for example when someone edits notes.json by
+hand). Mutations are not written by re-serializing the whole calendar:
+each one appends a compact JSON line to a journal next to the file
+(notes.json.journal), and a background compactor folds the journal into a
+new notes.json once it grows past a size or record threshold. Loading
+replays the journal on top of the last snapshot.
+
+Journal records only ever set a date to its full new value or delete it,
+so replaying records that are already part of the snapshot is harmless.
+
+Every journal record carries a version number taken from a ChangeLog
+shared by the note and label stores, so each store exposes a monotonically
+increasing version that changes whenever its data does (compaction writes
+a marker record to keep the version across restarts), and the ChangeLog
+can list the dates changed since any recent version for delta sync.
+
+Each store also keeps a sorted list of the dates that actually have
+entries, so range reads and deletes cost O(log n + k) via bisect instead
+of probing every calendar day in the range.
+
+Several worker processes may serve the same files. Every write (and the
+journal swap of a compaction) holds an inter-process lock on a lock file
+shared by both stores, and first replays what other processes appended,
+so read-modify-write sequences never lose updates and versions stay
+unique across processes.
+
+Files are never rewritten in place: snapshots and journals are written to
+a temporary file, fsynced and renamed over the original, so a crash leaves
+either the old or the new file, never a truncated one. Within a process,
+stores can use a reader/writer lock (rw_lock=True) so reads of a current
+cache run concurrently and only writes and reloads are exclusive.
+"""
+
+import bisect
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Compact the journal once it holds this many records or bytes
+JOURNAL_MAX_RECORDS = 1000
+JOURNAL_MAX_BYTES = 1024 * 1024
+
+# Number of recent changes kept in memory for /changes
+CHANGE_HISTORY = 10000
+
+
+def to_iso_date(value):
+    """Normalize a date object or YYYY-MM-DD string to a YYYY-MM-DD string"""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def file_stamp(path):
+    """Return (mtime, size) of a file, or None if missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def temp_path_for(path):
+    """Temporary file name next to path, unique per process and thread"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def fsync_directory(directory):
+    """Make a rename in directory durable (no-op where unsupported)"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replace_file(temp_path, path):
+    """Atomically move a fully written temporary file over path.
+
+    If the rename fails, path is untouched and the temporary file is removed.
+    """
+    try:
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+class ReadWriteLock:
+    """Many readers or one writer, for the threads of one process.
+
+    Used as a context manager it is the (reentrant) write lock, so it can
+    stand in for an RLock; read() gives shared access. Waiting writers block
+    new readers so a steady stream of reads cannot starve them. The writing
+    thread may also read, and a reading thread may read again.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        depth = getattr(self._local, "depth", 0)
+        with self._condition:
+            if self._writer != me and depth == 0:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release(self):
+        with self._condition:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class FileLock:
+    """Exclusive lock on a lock file, shared between processes.
+
+    Reentrant within a process: nested acquires by the thread holding it
+    only bump a counter, and other threads of the process wait on an
+    in-process lock before touching the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self._pid = None
+
+    def _lock_file(self):
+        if self._file is None or self._pid != os.getpid():
+            # Open per process: a descriptor inherited over fork would share
+            # the lock with the parent instead of excluding it
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "a+b")
+            self._pid = os.getpid()
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _unlock_file(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ChangeLog:
+    """Version clock and recent change history shared by the JSON stores"""
+
+    def __init__(self, max_entries=CHANGE_HISTORY):
+        self.version = 0
+        # Changes at or below floor are no longer listed individually
+        self.floor = 0
+        self._entries = deque(maxlen=max_entries)  # (version, kind, date)
+        self._stores = []
+        self._lock = threading.Lock()
+
+    def attach(self, store):
+        self._stores.append(store)
+
+    def sync(self):
+        """Pick up changes (and versions) other processes wrote to any store"""
+        for store in self._stores:
+            store.sync()
+
+    def next_version(self):
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def record(self, version, kind, key):
+        with self._lock:
+            self.version = max(self.version, version)
+            if len(self._entries) == self._entries.maxlen:
+                self.floor = max(self.floor, self._entries[0][0])
+            self._entries.append((version, kind, key))
+
+    def raise_floor(self, version):
+        """Forget individual changes up to version (e.g. folded into a snapshot)"""
+        with self._lock:
+            self.version = max(self.version, version)
+            self.floor = max(self.floor, version)
+
+    def since(self, since):
+        """Return (version, {kind: [dates]}) of changes after since.
+
+        The dict is None when since is older than the retained history (or
+        from a different history), meaning the client must resync fully.
+        """
+        self.sync()
+        with self._lock:
+            if since < self.floor or since > self.version:
+                return self.version, None
+            changed = {}
+            for version, kind, key in self._entries:
+                if version > since:
+                    changed.setdefault(kind, set()).add(key)
+            return self.version, {kind: sorted(keys) for kind, keys in changed.items()}
+
+
+class JsonStore:
+    """Cached, journaled view of a date-keyed JSON file"""
+
+    kind = None  # "notes" or "labels", as reported by the ChangeLog
+
+    def __init__(self, path, name, change_log=None, file_lock=None, rw_lock=False,
+                 max_records=JOURNAL_MAX_RECORDS, max_bytes=JOURNAL_MAX_BYTES):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.name = name
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self._data = {}
+        self._keys = []  # sorted dates present in _data
+        self.version = 0  # version of the last journal record applied
+        self._recorded_version = 0  # last version reported to the change log
+        self._snapshot_mark = None  # snapshot stamp named by the latest mark record
+        self._marking = threading.local()
+        self.change_log = change_log or ChangeLog()
+        self.change_log.attach(self)
+        self._file_lock = file_lock or FileLock(path + ".lock")
+        self._stamp = None
+        self._journal_stamp = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._loaded = False
+        self._pending = None  # journal records held back by batch()
+        self._lock = ReadWriteLock() if rw_lock else threading.RLock()
+        self._compact_event = threading.Event()
+        self._compactor = None
+
+    # ------------------------------------------------------------------
+    # Snapshot and journal handling
+    # ------------------------------------------------------------------
+
+    def _read_file(self):
+        """Parse the snapshot file with the same error handling as before.
+
+        An unparsable file is copied aside first, since the next compaction
+        replaces it with whatever the store then holds.
+        """
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    pass
+            backup = f"{self.path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            shutil.copyfile(self.path, backup)
+            logger.error(f"Failed to parse {self.name}, starting with empty data (original kept as {backup})")
+        return {}
+
+    def _put(self, key, value):
+        """Set a cached entry, keeping the date index in sync"""
+        if key not in self._data:
+            bisect.insort(self._keys, key)
+        self._data[key] = value
+
+    def _pop(self, key):
+        """Remove a cached entry, keeping the date index in sync"""
+        value = self._data.pop(key)
+        del self._keys[bisect.bisect_left(self._keys, key)]
+        return value
+
+    def _load_data(self, data):
+        """Replace the cached data and rebuild the date index"""
+        self._data = data
+        self._keys = sorted(data)
+
+    def _keys_between(self, start, end):
+        """Dates with entries from start to end (inclusive), via bisect"""
+        low = bisect.bisect_left(self._keys, to_iso_date(start))
+        high = bisect.bisect_right(self._keys, to_iso_date(end))
+        return self._keys[low:high]
+
+    def _track(self, record):
+        """Update the version and change log for a record read or written"""
+        version = record.get("v", 0)
+        self.version = max(self.version, version)
+        if record["op"] == "mark":
+            self.change_log.raise_floor(version)
+            self._snapshot_mark = record.get("snapshot")
+        elif version > self._recorded_version:
+            self.change_log.record(version, self.kind, record["key"])
+            self._recorded_version = version
+
+    def _apply(self, record):
+        """Apply one journal record to the cached data"""
+        self._track(record)
+        if record["op"] == "set":
+            self._put(record["key"], record["value"])
+        elif record["op"] == "del" and record["key"] in self._data:
+            self._pop(record["key"])
+
+    def _replay(self, offset):
+        """Apply journal records written after offset.
+
+        A trailing line without a newline is a write that is still in
+        progress or was cut short by a crash; it is left for the next read.
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        consumed = chunk.rfind(b"\n") + 1
+        for line in chunk[:consumed].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError):
+                logger.error(f"Skipping corrupt record in {self.name} journal")
+                continue
+            self._journal_records += 1
+        self._journal_offset = offset + consumed
+
+    def _is_current(self):
+        """True if the cache already reflects the files on disk"""
+        return (self._loaded and self._pending is None
+                and file_stamp(self.path) == self._stamp
+                and file_stamp(self.journal_path) == self._journal_stamp)
+
+    def _refresh(self):
+        """Bring the cache up to date with the snapshot and journal on disk"""
+        if self._pending is not None:
+            # Inside batch(): the cache holds uncommitted changes
+            return
+        stamp = file_stamp(self.path)
+        journal_stamp = file_stamp(self.journal_path)
+        if self._loaded and stamp == self._stamp:
+            if journal_stamp == self._journal_stamp:
+                return
+            if journal_stamp and journal_stamp[1] >= self._journal_offset:
+                # Only the journal grew (another process wrote): replay the tail
+                self._replay(self._journal_offset)
+                self._journal_stamp = journal_stamp
+                return
+        if self._loaded:
+            logger.info(f"{self.name} changed on disk, reloading")
+        self._load_data(self._read_file())
+        self.version = 0
+        self._snapshot_mark = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._replay(0)
+        self._stamp = stamp
+        self._journal_stamp = journal_stamp
+        self._loaded = True
+        self._maybe_compact()
+
+    def _log(self, records):
+        """Append records to the journal and make them durable"""
+        if self._pending is not None:
+            self._pending.extend(records)
+            return
+        for record in records:
+            record["v"] = self.change_log.next_version()
+        payload = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records
+        ).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            if f.tell() > self._journal_offset:
+                # Writers hold the file lock, so bytes past the last complete
+                # record are a torn append of a crashed process: drop them, or
+                # they would corrupt the record written after them
+                f.truncate(self._journal_offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(payload)
+        self._journal_records += len(records)
+        self._journal_stamp = file_stamp(self.journal_path)
+        for record in records:
+            self._track(record)
+        self._maybe_compact()
+
+    def _log_set(self, key):
+        self._log([{"op": "set", "key": key, "value": self._data[key]}])
+
+    def _log_delete(self, key):
+        self._log([{"op": "del", "key": key}])
+
+    def _marker(self, version):
+        """Journal line that carries the version over the fresh snapshot just written"""
+        return (json.dumps({"op": "mark", "v": version, "snapshot": list(self._stamp)}) + "\n").encode("utf-8")
+
+    def _snapshot_edited(self):
+        """True if the snapshot on disk is not the one the journal's last mark names.
+
+        Compaction and replace_all() mark the snapshot they write, so this
+        means it was edited by hand (or written by a version without marks).
+        """
+        return self._stamp is not None and self._snapshot_mark != list(self._stamp)
+
+    def _mark_snapshot(self):
+        """Journal a mark for a snapshot edited by hand.
+
+        Its new version raises the change log floor in every process, so
+        delta clients and the schedule index resync instead of missing the
+        edit.
+        """
+        self._marking.active = True
+        try:
+            with self._writing():
+                if self._snapshot_edited():
+                    logger.info(f"{self.name} was edited outside the app, clients will resync")
+                    self._log([{"op": "mark", "snapshot": list(self._stamp)}])
+        finally:
+            self._marking.active = False
+
+    def _replace_journal(self, payload):
+        """Atomically replace the journal contents"""
+        journal_temp = temp_path_for(self.journal_path)
+        with open(journal_temp, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(journal_temp, self.journal_path)
+
+    @contextmanager
+    def _reading(self):
+        """Access to an up-to-date cache for reading.
+
+        With a reader/writer lock, reads share the lock as long as nothing
+        changed on disk; reloading takes it exclusively.
+        """
+        if isinstance(self._lock, ReadWriteLock):
+            with self._lock.read():
+                if self._is_current():
+                    yield
+                    return
+        with self._lock:
+            self._refresh()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        """Hold the write locks with the cache up to date.
+
+        Syncing every store of the change log (not just this one) makes sure
+        the version clock has seen the newest record of any process before
+        the next version is handed out.
+        """
+        with self._file_lock:
+            self.change_log.sync()
+            with self._lock:
+                yield
+
+    def etag(self):
+        """Validator that changes whenever the data may have changed.
+
+        Combines the version with the snapshot stamp so hand edits of the
+        file are noticed too.
+        """
+        with self._reading():
+            return f"{self.version}-{self._stamp[0] if self._stamp else 0}"
+
+    def sync(self):
+        """Pick up changes made on disk by other processes, or by hand"""
+        with self._reading():
+            edited = self._snapshot_edited()
+        # _mark_snapshot() syncs the change log itself, which ends up here
+        if edited and not getattr(self._marking, "active", False):
+            self._mark_snapshot()
+
+    def invalidate(self):
+        """Drop the cache so the next access re-reads snapshot and journal"""
+        with self._lock:
+            self._loaded = False
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one journal write.
+
+        Other threads wait until the block finishes. If the block raises,
+        every change made inside it is rolled back and nothing is written.
+        """
+        with self._writing():
+            if self._pending is not None:
+                yield
+                return
+            saved = (dict(self._data), list(self._keys))
+            self._pending = []
+            try:
+                yield
+            except BaseException:
+                self._data, self._keys = saved
+                self._pending = None
+                raise
+            records, self._pending = self._pending, None
+            if records:
+                self._log(records)
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _maybe_compact(self):
+        """Wake the background compactor once the journal is over threshold"""
+        if self._journal_records < self.max_records and self._journal_offset < self.max_bytes:
+            return
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name=f"{self.name}-compactor", daemon=True
+            )
+            self._compactor.start()
+        self._compact_event.set()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait()
+            self._compact_event.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Failed to compact {self.name} journal: {e}")
+
+    def _write_snapshot(self, data):
+        """Write data to a temporary file next to the snapshot and return its path"""
+        temp_path = temp_path_for(self.path)
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        return temp_path
+
+    def compact(self):
+        """Fold the journal into a new snapshot.
+
+        The snapshot is serialized from a copy outside the lock so requests
+        keep being served; records appended meanwhile are carried over into
+        the new journal.
+        """
+        with self._lock:
+            self._refresh()
+            data = dict(self._data)
+            version = self.version
+            offset = self._journal_offset
+            stamp = self._stamp
+        temp_path = self._write_snapshot(data)
+
+        with self._writing():
+            if self._stamp != stamp:
+                # Another process compacted or replaced the file meanwhile
+                os.remove(temp_path)
+                return
+            try:
+                with open(self.journal_path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+            except FileNotFoundError:
+                tail = b""
+            replace_file(temp_path, self.path)
+            self._stamp = file_stamp(self.path)
+            # A crash before the journal is rewritten only means old records
+            # are replayed on top of the new snapshot, which is harmless
+            journal = self._marker(version) + tail
+            self._replace_journal(journal)
+
+            self._snapshot_mark = list(self._stamp)
+            self._journal_stamp = file_stamp(self.journal_path)
+            self._journal_offset = len(journal)
+            self._journal_records = journal.count(b"\n")
+        logger.info(f"Compacted {self.name} journal ({len(data)} dates)")
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def snapshot(self):
+        """Return a shallow copy of all entries.
+
+        Values are never mutated in place by the store, so the copy stays
+        consistent even if other requests write afterwards.
+        """
+        with self._reading():
+            return dict(self._data)
+
+    def get(self, key, default=None):
+        with self._reading():
+            return self._data.get(key, default)
+
+    def __contains__(self, key):
+        with self._reading():
+            return key in self._data
+
+    def __len__(self):
+        with self._reading():
+            return len(self._data)
+
+    def get_range(self, start, end):
+        """Return entries from start to end (inclusive), in date order"""
+        with self._reading():
+            return {key: self._data[key] for key in self._keys_between(start, end)}
+
+    def latest(self, count):
+        """Return the count most recent (date, value) pairs, newest first"""
+        with self._reading():
+            return [(key, self._data[key]) for key in reversed(self._keys[-count:])] if count > 0 else []
+
+    # ------------------------------------------------------------------
+    # Writes (each one is journaled immediately)
+    # ------------------------------------------------------------------
+
+    def set(self, key, value):
+        """Store a value for a date"""
+        with self._writing():
+            self._put(key, value)
+            self._log_set(key)
+
+    def set_many(self, entries):
+        """Store several values with a single journal write"""
+        with self._writing():
+            for key, value in entries.items():
+                self._put(key, value)
+            self._log([{"op": "set", "key": key, "value": value} for key, value in entries.items()])
+
+    def delete(self, key):
+        """Remove a date, returning its old value (or None)"""
+        with self._writing():
+            if key not in self._data:
+                return None
+            value = self._pop(key)
+            self._log_delete(key)
+            return value
+
+    def delete_many(self, keys):
+        """Remove several dates with a single journal write.
+
+        Returns a dict of the removed entries in the order they were given.
+        """
+        with self._writing():
+            removed = {}
+            for key in keys:
+                if key in self._data:
+                    removed[key] = self._pop(key)
+            if removed:
+                self._log([{"op": "del", "key": key} for key in removed])
+            return removed
+
+    def delete_range(self, start, end):
+        """Remove every entry from start to end (inclusive) with a single journal write"""
+        with self._writing():
+            return self.delete_many(self._keys_between(start, end))
+
+    def replace_all(self, data):
+        """Replace the whole store contents with a fresh snapshot"""
+        with self._writing():
+            temp_path = self._write_snapshot(data)
+            replace_file(temp_path, self.path)
+            self._stamp = file_stamp(self.path)
+            self.version = self.change_log.next_version()
+            self.change_log.raise_floor(self.version)
+            journal = self._marker(self.version)
+            self._replace_journal(journal)
+            self._load_data(dict(data))
+            self._snapshot_mark = list(self._stamp)
+            self._journal_stamp = file_stamp(self.journal_path)
+            self._journal_offset = len(journal)
+            self._journal_records = 1
+            self._loaded = True
+
+
+class NoteStore(JsonStore):
+    """Notes keyed by date, each value a list of activity strings"""
+
+    kind = "notes"
+
+    def __init__(self, path, **options):
+        super().__init__(path, "notes.json", **options)
+
+    def append_note(self, date, content):
+        """Append a single note to a date"""
+        with self._writing():
+            self._put(date, list(self._data.get(date, [])) + [content])
+            self._log_set(date)
+
+    def remove_note(self, date, index):
+        """Remove the note at index from a date.
+
+        Returns False if the note does not exist. The date is dropped once
+        its last note is removed.
+        """
+        with self._writing():
+            notes = self._data.get(date)
+            if notes is None or not 0 <= index < len(notes):
+                return False
+            remaining = notes[:index] + notes[index + 1:]
+            if remaining:
+                self._put(date, remaining)
+                self._log_set(date)
+            else:
+                self._pop(date)
+                self._log_delete(date)
+            return True
+
+
+class LabelStore(JsonStore):
+    """Labels keyed by date, each value a dict with label, color and timestamps"""
+
+    kind = "labels"
+
+    def __init__(self, path, **options):
+        super().__init__(path, "labels.json", **options)
+
+    def update_label(self, date, fields):
+        """Merge fields into an existing label. Returns False if missing."""
+        with self._writing():
+            if date not in self._data:
+                return False
+            updated = dict(self._data[date])
+            updated.update(fields)
+            self._put(date, updated)
+            self._log_set(date)
+            return True
+
+
+def create_stores(backend, notes_file, labels_file, sqlite_file, rw_lock=False):
+    """Build (note_store, label_store, change_log) for the configured backend"""
+    if backend == "json":
+        change_log = ChangeLog()
+        # One lock for both files: a batch may write to both stores
+        file_lock = FileLock(os.path.join(os.path.dirname(os.path.abspath(notes_file)), "calendar.lock"))
+        return (NoteStore(notes_file, change_log=change_log, file_lock=file_lock, rw_lock=rw_lock),
+                LabelStore(labels_file, change_log=change_log, file_lock=file_lock, rw_lock=rw_lock),
+                change_log)
+    if backend == "sqlite":
+        from sqlite_store import (SqliteNoteStore, SqliteLabelStore, SqliteChangeLog,
+                                  open_database, reopen_after_fork)
+        connection = open_database(sqlite_file)
+        lock = threading.RLock()
+        stores = (SqliteNoteStore(connection, lock),
+                  SqliteLabelStore(connection, lock),
+                  SqliteChangeLog(connection, lock))
+        reopen_after_fork(sqlite_file, *stores)
+        return stores
+    raise ValueError(f"Unknown storage backend: {backend}. Use 'json' or 'sqlite'.")
@@ -0,0 +1,170 @@
+"""
+AI Smart Calendar Taxonomy
+Keyword lists for categorizing activities and spotting important labels.
+
+Every keyword set is compiled once into a single regular expression that
+is run over the text in one pass. The pattern is a trie of all keywords
+(shared prefixes factored out, so most positions fail on the first
+character) inside a lookahead, so it reports the longest keyword starting
+at each position, and each keyword knows the tags of all keywords that are
+a prefix of it ("workout" also carries the tags of "work"). Together that
+yields every keyword occurrence, exactly like checking `keyword in text`
+for each keyword, but without looping over the lists.
+
+Intensities are derived deterministically from the text, so the same
+activity always gets the same score. Since activities repeat a lot, the
+hits of recently scanned texts are also memoized.
+"""
+
+import re
+import zlib
+from functools import lru_cache
+
+# Activity categories in priority order: the first category with a hit wins
+CATEGORY_KEYWORDS = {
+    "study": ["study", "learn", "read", "research", "exam", "test", "quiz", "assignment",
+              "homework", "project", "paper", "essay", "review", "practice", "course",
+              "class", "lecture", "tutorial", "workshop", "seminar", "library", "book",
+              "chapter", "notes", "revision", "preparation"],
+    "exercise": ["exercise", "workout", "gym", "run", "jog", "walk", "swim", "bike",
+                 "cycling", "yoga", "pilates", "fitness", "training", "sport", "basketball",
+                 "football", "soccer", "tennis", "volleyball", "badminton", "dance",
+                 "aerobics", "strength", "cardio", "stretch"],
+    "work": ["work", "job", "office", "meeting", "presentation", "client", "project", "deadline",
+             "report", "email", "call", "conference", "interview", "business", "professional",
+             "task", "assignment", "collaboration", "team", "manager", "colleague", "workplace"],
+    "rest": ["rest", "sleep", "nap", "relax", "break", "vacation", "holiday", "weekend",
+             "leisure", "free time", "downtime", "chill", "unwind", "recharge", "refresh",
+             "peace", "quiet", "meditation", "mindfulness"],
+    "social": ["friend", "family", "party", "dinner", "lunch", "coffee", "date", "hangout",
+               "visit", "birthday", "celebration", "event", "gathering", "meet", "social",
+               "relationship", "conversation", "chat", "talk"],
+}
+
+# Intensity levels with their 1-10 score ranges, checked in this order
+INTENSITY_KEYWORDS = {
+    "high": ["intense", "hard", "difficult", "challenging", "major", "important",
+             "critical", "all-day", "marathon", "competition", "exam", "test"],
+    "medium": ["regular", "normal", "standard", "routine", "daily", "weekly"],
+    "low": ["light", "easy", "casual", "quick", "short", "brief", "simple"],
+}
+INTENSITY_RANGES = {"high": (7, 10), "medium": (4, 6), "low": (1, 3)}
+DEFAULT_INTENSITY_RANGE = (4, 6)
+
+# Label words that mark a date as an important event or deadline
+IMPORTANT_LABEL_KEYWORDS = [
+    "deadline", "due", "exam", "test", "quiz", "assignment", "project", "presentation",
+    "meeting", "appointment", "interview", "submission", "review", "final", "important",
+    "urgent", "critical", "must", "essential", "priority", "due date", "final exam",
+    "term paper", "thesis", "dissertation", "proposal", "report", "conference",
+    "workshop", "seminar", "training", "certification", "license", "renewal",
+    "expiry", "expiration", "expires", "expiring", "last day", "final day"
+]
+
+# Tags reported by scan()
+IMPORTANT = "important"
+
+
+def _intensity_tag(level):
+    return f"intensity:{level}"
+
+
+_INTENSITY_TAGS = [(_intensity_tag(level), INTENSITY_RANGES[level]) for level in INTENSITY_KEYWORDS]
+
+
+def _trie_pattern(words):
+    """Regex matching the longest of words at a position, as a nested trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: prefer the longer keyword, fall back to the one ending here
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return build(trie)
+
+
+def _compile():
+    """Build the scanner pattern and the tags each matched keyword implies"""
+    tags = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            tags.setdefault(keyword, set()).add(category)
+    for level, keywords in INTENSITY_KEYWORDS.items():
+        for keyword in keywords:
+            tags.setdefault(keyword, set()).add(_intensity_tag(level))
+    for keyword in IMPORTANT_LABEL_KEYWORDS:
+        tags.setdefault(keyword, set()).add(IMPORTANT)
+
+    # A match of a keyword is also a match of every keyword that prefixes it
+    implied = {
+        keyword: frozenset().union(*(tags[other] for other in tags if keyword.startswith(other)))
+        for keyword in tags
+    }
+    return re.compile(f"(?=({_trie_pattern(tags)}))"), implied
+
+
+_PATTERN, _IMPLIED_TAGS = _compile()
+
+# Existence checks need no overlap handling: any occurrence will do
+_IMPORTANT_PATTERN = re.compile(_trie_pattern(IMPORTANT_LABEL_KEYWORDS))
+
+
+@lru_cache(maxsize=8192)
+def _scan_lower(text):
+    found = set()
+    for keyword in set(_PATTERN.findall(text)):
+        found |= _IMPLIED_TAGS[keyword]
+    return frozenset(found)
+
+
+def scan(text):
+    """Return every tag (category, intensity level, IMPORTANT) hit in text"""
+    return _scan_lower(text.lower())
+
+
+def first_category(hits, categories):
+    """First of categories (in order) that was hit, or None"""
+    for category in categories:
+        if category in hits:
+            return category
+    return None
+
+
+def determine_intensity(text, hits=None):
+    """Deterministic 1-10 intensity for an activity.
+
+    The intensity words pick the range; a checksum of the text picks the
+    score within it, so results vary across activities but never between
+    calls.
+    """
+    if hits is None:
+        hits = scan(text)
+    low, high = DEFAULT_INTENSITY_RANGE
+    for tag, score_range in _INTENSITY_TAGS:
+        if tag in hits:
+            low, high = score_range
+            break
+    return low + zlib.crc32(text.strip().lower().encode("utf-8")) % (high - low + 1)
+
+
+def categorize(text, categories):
+    """Keyword category and intensity for an activity, or None if no category matched"""
+    hits = scan(text)
+    category = first_category(hits, categories)
+    if category is None:
+        return None
+    return {"category": category, "intensity": determine_intensity(text, hits)}
+
+
+def is_important_label(text):
+    """True if a label text contains any important-event keyword"""
+    return _IMPORTANT_PATTERN.search(text.lower()) is not None
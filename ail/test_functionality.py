@@ -2,6 +2,11 @@ import requests
 import json
 from datetime import datetime, timedelta
 import re # Added for date consistency tests
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 
 # Test the Flask app endpoints
 BASE_URL = "http://127.0.0.1:5000"
@@ -202,6 +207,50 @@ def test_date_logic_fixes():
     except Exception as e:
         print(f"❌ DELETE /delete_month - Error: {e}")
 
+def test_batch_operations():
+    """Test applying several note/label operations in one request"""
+    print("\nTesting batch operations...")
+    
+    today = datetime.now().strftime("%Y-%m-%d")
+    
+    # Test 1: Mixed batch, applied in order with a single save
+    try:
+        data = {
+            "operations": [
+                {"op": "save_note", "date": today, "content": "Batch note 1"},
+                {"op": "save_note", "date": today, "content": "Batch note 2"},
+                {"op": "save_label", "date": today, "label": "Batch label", "color": "#17a2b8"},
+                {"op": "delete_label", "date": today}
+            ]
+        }
+        response = requests.post(f"{BASE_URL}/batch", json=data)
+        if response.status_code == 200:
+            result = response.json()
+            print("✅ POST /batch - Success")
+            print(f"   Applied: {result.get('applied_count', 0)}, failed: {result.get('failed_count', 0)}")
+        else:
+            print(f"❌ POST /batch - Failed: {response.status_code}")
+    except Exception as e:
+        print(f"❌ POST /batch - Error: {e}")
+    
+    # Test 2: All-or-nothing batch is rolled back when one operation fails
+    try:
+        data = {
+            "atomic": True,
+            "operations": [
+                {"op": "save_note", "date": today, "content": "Should be rolled back"},
+                {"op": "update_label", "date": "1999-01-01", "label": "Missing label"}
+            ]
+        }
+        response = requests.post(f"{BASE_URL}/batch", json=data)
+        notes_data = requests.get(f"{BASE_URL}/get_notes").json()
+        if response.status_code == 404 and "Should be rolled back" not in notes_data.get(today, []):
+            print("✅ POST /batch (atomic) - Rolled back as expected")
+        else:
+            print(f"❌ POST /batch (atomic) - Not rolled back: {response.status_code}")
+    except Exception as e:
+        print(f"❌ POST /batch (atomic) - Error: {e}")
+
 def test_date_consistency():
     """Test date consistency between calendar and notes"""
     print("\nTesting date consistency...")
@@ -473,6 +522,853 @@ def generate_date_consistency_report():
     except Exception as e:
         print(f"❌ Error during date consistency analysis: {e}")
 
+# ----------------------------------------------------------------------
+# In-process tests: no running server needed, results are asserted
+# ----------------------------------------------------------------------
+
+def scratch_dir():
+    """Fresh temporary directory for one test's data files"""
+    return tempfile.mkdtemp(prefix="calendar-test-")
+
+def test_sqlite_lock_released_when_begin_fails():
+    """A failed BEGIN (database locked by another process) must not keep the store lock"""
+    from sqlite_store import SqliteNoteStore, open_database
+    
+    path = os.path.join(scratch_dir(), "calendar.db")
+    connection = open_database(path)
+    connection.execute("PRAGMA busy_timeout = 50")
+    store = SqliteNoteStore(connection, threading.RLock())
+    
+    other_process = sqlite3.connect(path, isolation_level=None)
+    other_process.execute("BEGIN IMMEDIATE")
+    try:
+        store.set("2025-01-01", ["Blocked"])
+        raise AssertionError("set() succeeded while the database was locked")
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        other_process.execute("ROLLBACK")
+    
+    # Another thread can write once the database is free again
+    writer = threading.Thread(target=store.set, args=("2025-01-02", ["Written"]), daemon=True)
+    writer.start()
+    writer.join(timeout=5)
+    assert not writer.is_alive(), "store lock was leaked by the failed BEGIN"
+    assert store.get("2025-01-02") == ["Written"]
+
+_calendar_app = None
+
+def calendar_app():
+    """The app module, imported once in a scratch directory with the fake AI provider.
+
+    The app keeps its data files relative to the working directory, so the
+    test process stays in that directory from then on.
+    """
+    global _calendar_app
+    if _calendar_app is None:
+        os.environ.update({
+            "AI_PROVIDER": "fake",
+            "AI_FAKE_LATENCY": "0",
+            "AI_REQUESTS_PER_MINUTE": "60000",
+            "ANALYSIS_JOB_CHUNK": "1"
+        })
+        os.chdir(scratch_dir())
+        import app
+        _calendar_app = app
+    return _calendar_app
+
+def test_write_routes_reject_invalid_dates():
+    """Dates that are not YYYY-MM-DD strings get a 400, not a 500 from the date index"""
+    client = calendar_app().app.test_client()
+    
+    for bad_date in [20250101, "2025-13-01", ["2025-01-01"]]:
+        response = client.post("/save_note", json={"date": bad_date, "content": "Run"})
+        assert response.status_code == 400, bad_date
+        response = client.post("/update_note", json={"date": bad_date, "contents": ["Run"]})
+        assert response.status_code == 400, bad_date
+        response = client.post("/save_label", json={"date": bad_date, "label": "Race"})
+        assert response.status_code == 400, bad_date
+    
+    response = client.post("/batch", json={"operations": [
+        {"op": "save_note", "date": 20250101, "content": "Run"},
+        {"op": "save_note", "date": "2025-01-01", "content": "Run"}
+    ]})
+    result = response.json
+    assert response.status_code == 200
+    assert [r["status_code"] for r in result["results"]] == [400, 200]
+    assert client.get("/get_notes").json.get("2025-01-01") == ["Run"]
+
+def test_journal_replay_after_torn_append():
+    """A record cut short by a crash is ignored, and later appends still replay"""
+    from storage import NoteStore
+    
+    path = os.path.join(scratch_dir(), "notes.json")
+    store = NoteStore(path)
+    store.set("2025-01-01", ["Run"])
+    store.append_note("2025-01-02", "Swim")
+    # The process dies halfway through appending the next record
+    with open(store.journal_path, "ab") as f:
+        f.write(b'{"op":"set","key":"2025-01-03","val')
+    
+    restarted = NoteStore(path)
+    assert restarted.snapshot() == {"2025-01-01": ["Run"], "2025-01-02": ["Swim"]}
+    restarted.set("2025-01-04", ["Read"])
+    
+    assert NoteStore(path).snapshot() == {
+        "2025-01-01": ["Run"], "2025-01-02": ["Swim"], "2025-01-04": ["Read"]
+    }
+
+def test_compaction_keeps_records_appended_meanwhile():
+    """Records written while the snapshot is serialized are carried into the new journal"""
+    from storage import NoteStore
+    
+    path = os.path.join(scratch_dir(), "notes.json")
+    store = NoteStore(path)
+    store.set_many({"2025-02-01": ["Run"], "2025-02-02": ["Swim"]})
+    
+    write_snapshot = store._write_snapshot
+    def write_snapshot_while_busy(data):
+        temp_path = write_snapshot(data)
+        store.set("2025-02-03", ["Written during compaction"])
+        return temp_path
+    store._write_snapshot = write_snapshot_while_busy
+    store.compact()
+    
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"2025-02-01": ["Run"], "2025-02-02": ["Swim"]}
+    restarted = NoteStore(path)
+    assert restarted.get("2025-02-03") == ["Written during compaction"]
+    assert len(restarted) == 3
+    assert restarted.version == store.version
+
+def test_failed_replace_keeps_old_file():
+    """If renaming the new snapshot fails, the old file and cache stay intact"""
+    import storage
+    
+    directory = scratch_dir()
+    path = os.path.join(directory, "notes.json")
+    store = storage.NoteStore(path)
+    store.replace_all({"2025-03-01": ["Old"]})
+    
+    real_replace = os.replace
+    def failing_replace(source, target):
+        raise OSError("disk full")
+    storage.os.replace = failing_replace
+    try:
+        store.replace_all({"2025-03-02": ["New"]})
+        raise AssertionError("replace_all() succeeded although the rename failed")
+    except OSError:
+        pass
+    finally:
+        storage.os.replace = real_replace
+    
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"2025-03-01": ["Old"]}
+    assert store.snapshot() == {"2025-03-01": ["Old"]}
+    assert storage.NoteStore(path).snapshot() == {"2025-03-01": ["Old"]}
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+def test_etags_and_not_modified():
+    """Calendar reads carry an ETag and answer a matching If-None-Match with 304"""
+    client = calendar_app().app.test_client()
+    
+    for url in ["/get_notes", "/get_labels", "/get_notes_for_month?year=2025&month=4",
+                "/get_activity_trends", "/get_labeled_deadlines"]:
+        response = client.get(url)
+        etag = response.headers.get("ETag")
+        assert response.status_code == 200 and etag, url
+        
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304, url
+        assert response.data == b"", url
+        assert response.headers.get("ETag") == etag, url
+    
+    # Any write changes the validator
+    etag = client.get("/get_notes").headers["ETag"]
+    client.post("/save_note", json={"date": "2025-04-01", "content": "Run"})
+    response = client.get("/get_notes", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json["2025-04-01"] == ["Run"]
+    
+    etag = client.get("/get_labeled_deadlines").headers["ETag"]
+    client.post("/save_label", json={"date": "2025-04-02", "label": "Exam"})
+    assert client.get("/get_labeled_deadlines", headers={"If-None-Match": etag}).status_code == 200
+
+def test_changes_delta_sync():
+    """/changes lists what changed after a version, with tombstones for deletions"""
+    client = calendar_app().app.test_client()
+    client.post("/update_note", json={"date": "2025-05-03", "contents": ["Old note"]})
+    since = client.get("/changes?since=0").json["version"]
+    
+    client.post("/save_note", json={"date": "2025-05-01", "content": "Run"})
+    client.post("/save_label", json={"date": "2025-05-02", "label": "Race"})
+    client.post("/delete_all_notes", json={"date": "2025-05-03"})
+    
+    delta = client.get(f"/changes?since={since}").json
+    assert delta["full_resync"] is False
+    assert delta["version"] > since
+    assert delta["notes"] == {"2025-05-01": ["Run"]}
+    assert delta["deleted_notes"] == ["2025-05-03"]
+    assert list(delta["labels"]) == ["2025-05-02"]
+    assert delta["deleted_labels"] == []
+    
+    # Nothing changed since the latest version
+    latest = client.get(f"/changes?since={delta['version']}").json
+    assert latest["notes"] == {} and latest["deleted_notes"] == [] and latest["labels"] == {}
+    
+    # Versions the server cannot account for get everything
+    for bad_since in [delta["version"] + 1000, -1]:
+        resync = client.get(f"/changes?since={bad_since}").json
+        assert resync["full_resync"] is True
+        assert resync["notes"]["2025-05-01"] == ["Run"]
+    
+    assert client.get("/changes").status_code == 400
+
+def test_hand_edited_snapshot_forces_resync():
+    """Editing notes.json by hand makes delta clients and the schedule index resync, once"""
+    import storage
+    from retrieval import ScheduleIndex
+    
+    path = os.path.join(scratch_dir(), "notes.json")
+    store = storage.NoteStore(path)
+    other_process = storage.NoteStore(path, change_log=storage.ChangeLog())
+    store.set("2025-06-10", ["Dentist"])
+    store.compact()
+    index = ScheduleIndex(store, store.change_log)
+    assert [key for key, _ in index.search("dentist")] == ["2025-06-10"]
+    version = store.change_log.since(0)[0]
+    assert store.change_log.since(version) == (version, {})
+    assert other_process.change_log.since(version) == (version, {})
+    
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["2025-06-11"] = ["Piano lesson"]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    
+    assert store.change_log.since(version)[1] is None
+    assert store.get("2025-06-11") == ["Piano lesson"]
+    assert [key for key, _ in index.search("piano")] == ["2025-06-11"]
+    # The edit is marked once in the journal, so other processes resync to the same version
+    resynced = store.change_log.version
+    assert resynced > version
+    assert store.change_log.since(resynced) == (resynced, {})
+    assert other_process.change_log.since(version) == (resynced, None)
+    assert other_process.change_log.since(resynced) == (resynced, {})
+    with open(store.journal_path, "r", encoding="utf-8") as f:
+        assert sum(json.loads(line)["op"] == "mark" for line in f) == 2
+
+def test_event_subscribers_capped_below_thread_count():
+    """Threaded servers keep most threads for requests; refused tabs are told to poll"""
+    from events import EventBroker, default_max_subscribers
+    from storage import ChangeLog
+    
+    assert default_max_subscribers(8) == 2
+    assert default_max_subscribers(2) == 1
+    
+    broker = EventBroker(ChangeLog(), lambda changed: {}, max_subscribers=2)
+    assert broker.try_subscribe() and broker.try_subscribe()
+    assert not broker.try_subscribe()
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    cap = app.event_broker.max_subscribers
+    app.event_broker.max_subscribers = 0
+    try:
+        response = client.get("/events")
+    finally:
+        app.event_broker.max_subscribers = cap
+    assert response.status_code == 503
+    assert response.headers.get("Retry-After")
+    assert "/changes" in response.json["error"]
+
+def test_joining_analysis_job_does_not_run_it_twice():
+    """A second POST joins the running job instead of starting another runner for it"""
+    import ai_client
+    import fake_ai
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    for day in range(1, 7):
+        client.post("/save_note", json={"date": f"2025-06-{day:02d}", "content": f"Job activity {day}"})
+    
+    handler = app.job_runner._handlers["time_allocation"]
+    runs = []
+    def counting_handler(job):
+        runs.append(threading.get_ident())
+        return handler(job)
+    provider = fake_ai.FakeProvider(latency="0.05")
+    previous_provider = ai_client.provider()
+    ai_client.set_provider(provider)
+    app.job_runner.register("time_allocation", counting_handler)
+    try:
+        started = client.post("/analysis_jobs")
+        assert started.status_code == 202
+        joined = client.post("/analysis_jobs")
+        assert joined.status_code == 200
+        assert joined.json["job_id"] == started.json["job_id"]
+        
+        job = joined.json
+        give_up = time.time() + 30
+        while job["status"] in ("queued", "running") and time.time() < give_up:
+            time.sleep(0.05)
+            job = client.get(f"/analysis_jobs/{job['job_id']}").json
+    finally:
+        app.job_runner.register("time_allocation", handler)
+        ai_client.set_provider(previous_provider)
+    
+    assert job["status"] == "done"
+    assert len(runs) == 1, f"handler ran {len(runs)} times"
+    # ANALYSIS_JOB_CHUNK=1: one AI call per activity, none repeated by a second runner
+    assert provider.calls <= job["total"]
+
+def test_analysis_job_polls_read_the_saved_partial_result():
+    """Jobs store the notes version, not the notes, and polls do not re-summarize them"""
+    import ai_client
+    import fake_ai
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    client.post("/save_note", json={"date": "2025-07-01", "content": "Partial result activity"})
+    
+    summarize = app.summarize_time_allocation
+    summarized_by = []
+    def spying_summarize(*args):
+        summarized_by.append(threading.get_ident())
+        return summarize(*args)
+    provider = fake_ai.FakeProvider(latency="0.05")
+    previous_provider = ai_client.provider()
+    ai_client.set_provider(provider)
+    app.summarize_time_allocation = spying_summarize
+    try:
+        job = client.post("/analysis_jobs").json
+        assert set(app.job_store.get(job["job_id"])["params"]) == {"notes_version"}
+        assert job["result"] is not None
+        summarized_by_post = summarized_by.count(threading.get_ident())
+        
+        give_up = time.time() + 30
+        while job["status"] in ("queued", "running") and time.time() < give_up:
+            time.sleep(0.05)
+            job = client.get(f"/analysis_jobs/{job['job_id']}").json
+            assert job["result"] is not None
+    finally:
+        app.summarize_time_allocation = summarize
+        ai_client.set_provider(previous_provider)
+    
+    assert job["status"] == "done"
+    assert job["result"]["total_activities"] >= job["total"]
+    # The job thread summarized (once, at the end); the polls did not
+    assert summarized_by.count(threading.get_ident()) == summarized_by_post
+    assert len(summarized_by) > summarized_by_post
+
+def test_circuit_breaker_open_half_open_close():
+    """Failures open the breaker, it fails fast, then one probe decides whether it closes"""
+    import fake_ai
+    from ai_executor import AIExecutor, AIUnavailable, CircuitBreaker
+    
+    provider = fake_ai.FakeProvider(latency="0", error_rate=1.0)
+    breaker = CircuitBreaker(failure_threshold=2, latency_slo=5.0, reset_timeout=0.2)
+    executor = AIExecutor(max_workers=2, requests_per_minute=60000, call_timeout=5.0, breaker=breaker)
+    
+    def call():
+        return executor.run(provider.generate_text, "What do I have tomorrow?")
+    
+    def outcome():
+        try:
+            call()
+            return "ok"
+        except AIUnavailable:
+            return "rejected"
+        except fake_ai.FakeAIError:
+            return "failed"
+    
+    assert [outcome(), outcome()] == ["failed", "failed"]
+    assert breaker.state == "open"
+    assert outcome() == "rejected"
+    assert provider.calls == 2  # rejected calls never reach the provider
+    
+    # Half-open: the probe fails, so the breaker opens again
+    time.sleep(0.25)
+    assert outcome() == "failed"
+    assert breaker.state == "open" and breaker.opens == 2
+    
+    # Half-open again: the probe succeeds and closes it
+    time.sleep(0.25)
+    provider.error_rate = 0.0
+    assert outcome() == "ok"
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+    assert breaker.status()["rejected"] == 1
+    
+    # Calls slower than the latency SLO count as failures
+    slow = CircuitBreaker(failure_threshold=1, latency_slo=0.01, reset_timeout=30.0)
+    executor = AIExecutor(max_workers=1, requests_per_minute=60000, call_timeout=5.0, breaker=slow)
+    assert executor.run(fake_ai.FakeProvider(latency="0.05").generate_text, "hello")
+    assert slow.state == "open"
+
+def test_open_breaker_degrades_endpoints():
+    """While the breaker is open /ask_ai answers 503 and /generate_plan uses the template plan"""
+    from ai_executor import CircuitBreaker
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    breaker = app.ai_executor.breaker
+    app.ai_executor.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    app.ai_executor.breaker.record_failure("test")
+    try:
+        response = client.post("/ask_ai", json={"question": "Breaker test: am I busy?"})
+        assert response.status_code == 503
+        response = client.post("/generate_plan", json={"goal": "Breaker test goal"})
+        assert response.status_code == 200
+        assert response.json["plan_format"] == "fallback"
+        assert len(response.json["plan"]) == 7
+    finally:
+        app.ai_executor.breaker = breaker
+    assert client.get("/ai_status").json["breaker"]["state"] == "closed"
+
+def test_plan_parser_strict_json_and_text_fallback():
+    """Every fixture answer maps to its expected days; JSON answers are parsed strictly"""
+    import json
+    import plan_parser
+    
+    app = calendar_app()
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "plan_responses.json"), encoding="utf-8") as f:
+        fixtures = json.load(f)
+    week_dates = fixtures["week_dates"]
+    
+    for case in fixtures["responses"]:
+        plans, plan_format, json_error = app.parse_plan_response(case["response"], week_dates)
+        if plan_format == "json":
+            dates = set(plans)
+            assert json_error is None, case["name"]
+        else:
+            dates = {plan_parser.day_to_date(day, week_dates) for day in plans} - {None}
+            assert json_error, case["name"]
+        assert len(dates) == case["days"], case["name"]
+        assert dates <= set(week_dates), case["name"]
+        if case["name"].startswith("json") and case["days"]:
+            assert plan_format == "json", case["name"]
+    
+    # Strict JSON: anything but dates of the week to lists of strings is rejected
+    monday, tuesday = week_dates[:2]
+    assert plan_parser.parse_json_plan(f'{{"{monday}": [" Read ", ""]}}', week_dates) == {monday: ["Read"]}
+    for answer in [
+        "週一: 閱讀",
+        f'{{"{monday}": ["Read"],}}',
+        "{}",
+        '{"Monday": ["Read"]}',
+        '{"2025-02-30": ["Read"]}',
+        '{"2030-01-01": ["Read"]}',
+        f'{{"{monday}": "Read, Write"}}',
+        f'{{"{monday}": [1, 2]}}',
+        f'{{"{monday}": [" "]}}',
+    ]:
+        try:
+            plan_parser.parse_json_plan(answer, week_dates)
+        except plan_parser.PlanFormatError:
+            continue
+        raise AssertionError(f"accepted {answer!r}")
+    
+    # Text fallback: day names, day numbers and month/day map onto the week
+    assert plan_parser.parse_line_plan("週一: 閱讀、筆記\nDay 2: Run, Swim\n8月13日: 休息") == {
+        "週一": ["閱讀", "筆記"], "Day 2": ["Run", "Swim"], "8月13日": ["休息"]}
+    assert [plan_parser.day_to_date(day, week_dates) for day in ("週一", "Day 2", "8月13日", "Day 9", "someday")] == [
+        monday, tuesday, week_dates[2], None, None]
+    assert app.parse_plan_response("No plan today, sorry.", week_dates)[1] is None
+    
+    # Streaming: days arrive line by line, split chunks and duplicates included
+    parser = plan_parser.PlanStreamParser(week_dates)
+    assert parser.feed('```json\n{"date": "' + monday + '", "activ') == []
+    assert parser.feed('ities": ["Read"]}\n週二: Run、Swim\n{"date": "' + monday + '", "activities": ["Again"]}\n') == [
+        (monday, ["Read"]), (tuesday, ["Run", "Swim"])]
+    assert parser.close() == []
+    assert parser.free_text == 1 and parser.skipped == 1
+
+def test_stream_plan_rollback_keeps_edits_made_meanwhile():
+    """A failed streamed plan restores its days, but not a day another client edited mid-stream"""
+    import ai_client
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    week_dates = [f"2025-09-0{day}" for day in range(1, 8)]
+    client.post("/update_note", json={"date": week_dates[0], "contents": ["Dentist"]})
+    client.post("/update_note", json={"date": week_dates[2], "contents": ["Gym"]})
+    
+    class FailingMidStream:
+        def stream_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+            for day in week_dates[:3]:
+                yield json.dumps({"date": day, "activities": [f"Plan {day}"]}) + "\n"
+            raise RuntimeError("connection reset")
+    
+    provider = ai_client.provider()
+    ai_client.set_provider(FailingMidStream())
+    try:
+        response = client.post("/generate_plan", json={"goal": "Rollback test", "start_date": week_dates[0],
+                                                       "end_date": week_dates[-1]},
+                               headers={"Accept": "text/event-stream"})
+        events = (chunk.decode() for chunk in response.iter_encoded())
+        days = [next(events) for _ in range(3)]
+        assert all(event.startswith("event: day") for event in days)
+        assert client.get("/get_notes").json[week_dates[1]] == [f"Plan {week_dates[1]}"]
+        # Another client edits a day this plan already saved
+        client.post("/update_note", json={"date": week_dates[2], "contents": ["Gym moved to 7pm"]})
+        error = "".join(events)
+    finally:
+        ai_client.set_provider(provider)
+    
+    assert error.startswith("event: error")
+    assert json.loads(error.split("data: ", 1)[1])["rolled_back"] == week_dates[:2]
+    notes = client.get("/get_notes").json
+    assert notes[week_dates[0]] == ["Dentist"]
+    assert week_dates[1] not in notes
+    assert notes[week_dates[2]] == ["Gym moved to 7pm"]
+
+def test_multi_week_plan_retries_then_falls_back_per_week():
+    """A failing week is asked for again, and a week that keeps failing gets the template plan"""
+    import ai_client
+    import fake_ai
+    
+    class FailingWeeks(fake_ai.FakeProvider):
+        """Fails the plan requests of given weeks (by first date) a number of times"""
+        
+        def __init__(self, failures):
+            super().__init__(latency="0")
+            self.failures = failures
+            self.requests = {}
+        
+        def generate_text(self, prompt, model_name=None, temperature=None, max_output_tokens=None):
+            for first_date in self.failures:
+                if f"days: {first_date}" in prompt:
+                    self.requests[first_date] = self.requests.get(first_date, 0) + 1
+                    if self.requests[first_date] <= self.failures[first_date]:
+                        raise fake_ai.FakeAIError("503 Service Unavailable (injected)")
+            return super().generate_text(prompt, model_name, temperature, max_output_tokens)
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    first_dates = ["2025-10-06", "2025-10-13", "2025-10-20"]
+    flaky = FailingWeeks({first_dates[0]: 0, first_dates[1]: 1, first_dates[2]: app.PLAN_WEEK_ATTEMPTS})
+    provider = ai_client.provider()
+    ai_client.set_provider(flaky)
+    try:
+        response = client.post("/generate_plan", json={"goal": "Half marathon", "start_date": first_dates[0],
+                                                       "end_date": "2025-10-26"})
+    finally:
+        ai_client.set_provider(provider)
+    
+    assert response.status_code == 200
+    result = response.json
+    assert flaky.requests == {first_dates[0]: 1, first_dates[1]: 2, first_dates[2]: app.PLAN_WEEK_ATTEMPTS}
+    assert [week["start"] for week in result["weeks"]] == first_dates
+    assert [week["plan_format"] for week in result["weeks"]] == ["json", "json", "fallback"]
+    assert result["failed_weeks"] == 1
+    assert result["weeks"][0]["error"] is None and result["weeks"][1]["error"] is None
+    assert "injected" in result["weeks"][2]["error"]
+    
+    # Every day is planned and saved, the failed week from the template
+    assert len(result["plan"]) == 21
+    notes = client.get("/get_notes").json
+    assert all(notes[day] == activities for day, activities in result["plan"].items())
+    assert notes[first_dates[1]][0] == "Half marathon - part 1"
+    assert notes[first_dates[2]][0] == "Start Half marathon today"
+    
+    # The deadline grows with the rounds of the pool and the rate limiter's pacing
+    from ai_executor import AIExecutor
+    executor = AIExecutor(max_workers=8, requests_per_minute=60)
+    assert executor.batch_budget(1, 45) == executor.batch_budget(8, 45) == 45
+    assert executor.batch_budget(16, 45) == 2 * 45 + 8
+
+def test_analysis_job_partial_results_stay_small_and_fallbacks_are_retried():
+    """Chunks save running counts with a few sample details; a resumed job asks the AI about fallbacks again"""
+    import ai_client
+    import fake_ai
+    
+    app = calendar_app()
+    client = app.app.test_client()
+    for day in range(1, 21):
+        client.post("/save_note", json={"date": f"2025-11-{day:02d}", "content": "Tally: morning run"})
+        client.post("/save_note", json={"date": f"2025-11-{day:02d}", "content": f"Tally: chapter {day}"})
+    
+    class RecordingJob:
+        """JobContext stand-in resumed with saved items"""
+        
+        def __init__(self, saved):
+            self._saved = saved
+            self.items = {}
+            self.results = []
+        
+        def saved(self):
+            return dict(self._saved)
+        
+        def check_cancelled(self):
+            pass
+        
+        def save(self, items, result=None):
+            self.items.update(items)
+            self.results.append(result)
+    
+    earlier = {
+        "Tally: chapter 1": {"category": "rest", "intensity": 2, "fallback": True},
+        "Tally: chapter 2": {"category": "study", "intensity": 6},
+    }
+    job = RecordingJob(earlier)
+    provider = ai_client.provider()
+    ai_client.set_provider(fake_ai.FakeProvider(latency="0"))
+    try:
+        final = app.run_time_allocation_job(job)
+    finally:
+        ai_client.set_provider(provider)
+    
+    # The keyword fallback was asked for again, the AI answer was kept
+    assert "Tally: chapter 1" in job.items and not job.items["Tally: chapter 1"].get("fallback")
+    assert "Tally: chapter 2" not in job.items
+    
+    # Partial results: bounded details, and the last one counts what the final result does
+    for result in job.results:
+        assert all(len(item["details"]) <= app.ANALYSIS_PARTIAL_DETAILS for item in result["chart_data"])
+    counts = lambda result: {item["category"]: (item["count"], item["average_intensity"])
+                             for item in result["chart_data"]}
+    assert counts(job.results[-1]) == counts(final)
+    assert job.results[-1]["total_activities"] == final["total_activities"]
+    assert sum(item["count"] for item in final["chart_data"]) == final["total_activities"]
+    assert max(len(item["details"]) for item in final["chart_data"]) > app.ANALYSIS_PARTIAL_DETAILS
+
+def test_schedule_retrieval():
+    """Date windows, CJK bigrams, BM25 ranking, the token budget and incremental index sync"""
+    from datetime import date
+    from retrieval import ScheduleIndex, parse_date_windows, select_context, tokenize
+    from storage import NoteStore
+    
+    today = date(2025, 8, 13)  # a Wednesday
+    windows = lambda question: [(start.isoformat(), end.isoformat())
+                                for start, end in parse_date_windows(question, today)]
+    assert windows("What is on next week?") == [("2025-08-18", "2025-08-24")]
+    assert windows("8月15日有什麼安排") == [("2025-08-15", "2025-08-15")]
+    assert windows("週三要做什麼") == [("2025-08-13", "2025-08-13")]
+    assert windows("next 3 days") == [("2025-08-13", "2025-08-15")]
+    assert windows("tomorrow and 8月15日") == [("2025-08-14", "2025-08-15")]  # adjacent spans merge
+    assert windows("2025-02-30, 13/45 or 2月30日") == []
+    assert windows("How am I doing?") == []
+    
+    assert tokenize("30分鐘慢跑 Morning-Run 跑") == ["30", "分鐘", "鐘慢", "慢跑", "morning", "run", "跑"]
+    
+    store = NoteStore(os.path.join(scratch_dir(), "notes.json"))
+    store.set_many({
+        "2025-08-01": ["慢跑", "公園慢跑"],
+        "2025-08-02": ["30分鐘慢跑", "讀書", "寫報告", "整理房間"],
+        "2025-08-03": ["Read chapter 3"],
+        "2025-08-15": ["Dentist at 10"],
+    })
+    index = ScheduleIndex(store, store.change_log)
+    assert [key for key, _ in index.search("慢跑")] == ["2025-08-01", "2025-08-02"]
+    assert [key for key, _ in index.search("chapter")] == ["2025-08-03"]
+    assert index.search("swimming") == []
+    
+    # Windowed dates come first; lines that do not fit the budget are skipped
+    lines, info = select_context(index, "8月15日 and 慢跑?", today, token_budget=1000)
+    assert lines == ["2025-08-01: 慢跑、公園慢跑", "2025-08-02: 30分鐘慢跑、讀書、寫報告、整理房間",
+                     "2025-08-15: Dentist at 10"]
+    assert info["windows"] == [["2025-08-15", "2025-08-15"]] and info["matched"] == 2
+    lines, info = select_context(index, "8月15日 and 慢跑?", today, token_budget=20)
+    assert lines == ["2025-08-01: 慢跑、公園慢跑", "2025-08-15: Dentist at 10"]
+    assert info["context_tokens"] <= 20
+    
+    # Edits and deletes are picked up without rebuilding the index
+    def no_rebuild(version):
+        raise AssertionError("index rebuilt instead of synced")
+    index._rebuild = no_rebuild
+    store.set("2025-08-03", ["Swimming lesson"])
+    store.delete("2025-08-01")
+    assert index.search("chapter") == []
+    assert [key for key, _ in index.search("swimming")] == ["2025-08-03"]
+    assert [key for key, _ in index.search("慢跑")] == ["2025-08-02"]
+    assert len(index) == 3
+
+def test_response_cache_single_flight():
+    """Concurrent identical requests share one computation, its result or its exception"""
+    from response_cache import ResponseCache
+    
+    cache = ResponseCache(ttl=60, max_entries=2)
+    release = threading.Event()
+    computed = []
+    
+    def run_concurrently(compute, followers=4):
+        outcomes = []
+        def request():
+            try:
+                outcomes.append(("value", cache.get_or_compute("question", compute)))
+            except Exception as e:
+                outcomes.append(("error", e))
+        threads = [threading.Thread(target=request, daemon=True) for _ in range(followers + 1)]
+        coalesced = cache.coalesced
+        for thread in threads:
+            thread.start()
+        give_up = time.time() + 10
+        while cache.coalesced < coalesced + followers and time.time() < give_up:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        release.clear()
+        return outcomes
+    
+    def answer():
+        computed.append(1)
+        release.wait(10)
+        return "answer"
+    assert run_concurrently(answer) == [("value", "answer")] * 5
+    assert len(computed) == 1
+    assert cache.get_or_compute("question", answer) == "answer" and len(computed) == 1
+    
+    error = RuntimeError("Gemini unavailable")
+    def failing():
+        computed.append(1)
+        release.wait(10)
+        raise error
+    cache.clear()
+    computed.clear()
+    assert run_concurrently(failing) == [("error", error)] * 5
+    assert len(computed) == 1
+    # Failures are not cached
+    assert cache.get_or_compute("question", lambda: "retried") == "retried"
+    
+    # Results cacheable() rejects (an analysis with keyword fallbacks) are recomputed
+    partial = lambda: ({"total_activities": 3}, False)
+    assert cache.get_or_compute("analysis", partial, cacheable=lambda result: result[1])[1] is False
+    complete = lambda: ({"total_activities": 3}, True)
+    assert cache.get_or_compute("analysis", complete, cacheable=lambda result: result[1])[1] is True
+    assert cache.get_or_compute("analysis", partial, cacheable=lambda result: result[1])[1] is True
+    
+    # LRU: the least recently used entry goes first
+    cache.clear()
+    cache.get_or_compute("a", lambda: "A")
+    cache.get_or_compute("b", lambda: "B")
+    cache.get_or_compute("a", lambda: "A again")
+    cache.get_or_compute("c", lambda: "C")
+    assert cache.get_or_compute("a", lambda: "A again") == "A"
+    assert cache.get_or_compute("b", lambda: "B again") == "B again"
+    assert cache.stats()["entries"] == 2
+    
+    # TTL: expired entries are recomputed
+    short = ResponseCache(ttl=0.05)
+    short.get_or_compute("a", lambda: "A")
+    time.sleep(0.1)
+    assert short.get_or_compute("a", lambda: "A again") == "A again"
+
+def test_categorization_cache_versions_eviction_and_fallbacks():
+    """Entries are per prompt/model version, bounded LRU, and keyword fallbacks are never cached"""
+    import ai_client
+    import fake_ai
+    from ai_cache import CategorizationCache
+    
+    path = os.path.join(scratch_dir(), "ai_cache.db")
+    cache = CategorizationCache(path, "prompt-v1", max_entries=3)
+    cache.put_many({
+        "Morning run": {"category": "exercise", "intensity": 5},
+        "Read chapter": {"category": "study", "intensity": 4},
+        "Nap": {"category": "rest", "intensity": 1},
+    })
+    assert cache.get("  morning   RUN ") == {"category": "exercise", "intensity": 5}
+    assert cache.get("Read chapter") == {"category": "study", "intensity": 4}
+    # "Nap" is now the least recently used entry
+    cache.put("Yoga", {"category": "exercise", "intensity": 3})
+    assert cache.get("Nap") is None
+    assert [row[0] for row in cache.entries()] == ["morning run", "read chapter", "yoga"]
+    
+    # Another prompt or model version does not see these answers
+    changed_prompt = CategorizationCache(path, "prompt-v2", max_entries=3)
+    assert changed_prompt.get("Morning run") is None
+    assert changed_prompt.stats()["entries"] == 0
+    
+    # categorize_activities caches AI answers but not keyword fallbacks
+    app = calendar_app()
+    activity = "Cache test: practice violin scales"
+    provider = ai_client.provider()
+    ai_client.set_provider(fake_ai.FakeProvider(latency="0", error_rate=1.0))
+    try:
+        result = app.categorize_activities([activity], app.TIME_ALLOCATION_CATEGORIES)[activity]
+    finally:
+        ai_client.set_provider(provider)
+    assert result["fallback"] is True
+    assert app.categorization_cache.get(activity) is None
+    
+    ai_client.set_provider(fake_ai.FakeProvider(latency="0"))
+    try:
+        result = app.categorize_activities([activity], app.TIME_ALLOCATION_CATEGORIES)[activity]
+    finally:
+        ai_client.set_provider(provider)
+    assert not result.get("fallback")
+    assert app.categorization_cache.get(activity) == {"category": result["category"],
+                                                      "intensity": result["intensity"]}
+
+def test_date_index_consistent_through_mixed_mutations():
+    """Range reads and deletes match a plain dict after sets, deletes, rollbacks, compaction and reloads"""
+    import random
+    from datetime import date, timedelta
+    from storage import NoteStore
+    
+    path = os.path.join(scratch_dir(), "notes.json")
+    store = NoteStore(path)
+    expected = {}
+    rng = random.Random(4)
+    days = [(date(2025, 1, 1) + timedelta(days=offset)).isoformat() for offset in range(60)]
+    
+    def check(store):
+        assert store.snapshot() == expected
+        assert store._keys == sorted(expected)
+        for _ in range(5):
+            start, end = sorted(rng.sample(days, 2))
+            assert store.get_range(start, end) == {key: expected[key] for key in sorted(expected) if start <= key <= end}
+        assert store.get_range(date(2025, 1, 10), date(2025, 1, 20)) == {
+            key: value for key, value in sorted(expected.items()) if "2025-01-10" <= key <= "2025-01-20"}
+        assert store.latest(3) == sorted(expected.items(), reverse=True)[:3]
+    
+    for step in range(300):
+        day = rng.choice(days)
+        operation = rng.randrange(7)
+        if operation == 0:
+            store.set(day, [f"Set {step}"])
+            expected[day] = [f"Set {step}"]
+        elif operation == 1:
+            store.append_note(day, f"Note {step}")
+            expected[day] = expected.get(day, []) + [f"Note {step}"]
+        elif operation == 2:
+            assert store.delete(day) == expected.pop(day, None)
+        elif operation == 3:
+            keys = rng.sample(days, 3)
+            removed = {key: expected.pop(key) for key in keys if key in expected}
+            assert store.delete_many(keys) == removed
+        elif operation == 4:
+            start, end = sorted(rng.sample(days, 2))
+            removed = {key: expected.pop(key) for key in sorted(expected) if start <= key <= end}
+            assert store.delete_range(start, end) == removed
+        elif operation == 5:
+            # A batch that fails is rolled back, date index included
+            try:
+                with store.batch():
+                    store.set(day, ["Rolled back"])
+                    store.delete_many(rng.sample(days, 5))
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        else:
+            other_day = rng.choice(days)
+            with store.batch():
+                store.set_many({day: [f"Batch {step}"]})
+                store.delete(other_day)
+            expected[day] = [f"Batch {step}"]
+            expected.pop(other_day, None)
+        check(store)
+        if step % 100 == 99:
+            store.compact()
+            store = NoteStore(path)
+            check(store)
+    
+    # An edit by another process is picked up with the journal replay
+    NoteStore(path).set("2025-01-15", ["Other process"])
+    expected["2025-01-15"] = ["Other process"]
+    check(store)
+
 if __name__ == "__main__":
     print("🚀 Testing AI Calendar Application...")
     print("=" * 50)
@@ -481,6 +1377,7 @@ if __name__ == "__main__":
     test_ai_functionality()
     test_analytics_functionality()
     test_date_logic_fixes()
+    test_batch_operations()
     test_date_consistency()
     generate_date_consistency_report()
     